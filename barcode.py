@@ -1,3 +1,200 @@
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by the batch decoder
+    np = None
+
+
+def _build_module_table(modules: dict) -> tuple:
+    """Given a module dictionary, build a 128-entry lookup table.
+
+    Args:
+        modules (dict): Mapping of 7-bit binary modules to digits.
+    Returns:
+        tuple: Entry i is the digit encoded by the module whose bits equal i,
+            or -1 if i is not a valid module.
+    """
+    table = [-1] * 128
+    for bits, digit in modules.items():
+        table[int(bits, 2)] = int(digit)
+    return tuple(table)
+
+
+class DecodeResult:
+    """The outcome of decoding a single binary barcode.
+
+    Decoding never raises: a failed decode is reported through ``reason``.
+    """
+
+    NORMAL = "normal"
+    FLIPPED = "flipped"
+
+    def __init__(self, digits: str = None, orientation: str = None, reason: str = None):
+        self.digits = digits
+        self.orientation = orientation
+        self.reason = reason
+
+    def is_valid(self) -> bool:
+        """Check whether the barcode decoded successfully.
+
+        Returns:
+            bool: True if ``digits`` holds a valid 12 digit barcode.
+        """
+        return self.reason is None
+
+    def __repr__(self):
+        if self.reason is None:
+            return f"DecodeResult({self.digits!r}, {self.orientation!r})"
+        return f"DecodeResult(invalid: {self.reason})"
+
+
+class BatchDecodeResult:
+    """The outcome of decoding many binary barcodes at once.
+
+    Attributes:
+        codes (numpy.ndarray): The 12 digit barcodes ('' where invalid).
+        valid (numpy.ndarray): Boolean mask of rows that decoded.
+        flipped (numpy.ndarray): Boolean mask of rows that decoded reversed.
+    """
+
+    def __init__(self, codes, valid, flipped):
+        self.codes = codes
+        self.valid = valid
+        self.flipped = flipped
+
+    def __len__(self):
+        return len(self.codes)
+
+    def valid_codes(self) -> list[str]:
+        """Get the decoded barcodes, in input order, skipping invalid rows.
+
+        Returns:
+            list[str]: The 12 digit barcodes that decoded.
+        """
+        return self.codes[self.valid].tolist()
+
+
+class ScanStats:
+    """Per-file statistics on how scans decoded."""
+
+    def __init__(self):
+        self.scanned = 0
+        self.decoded = 0
+        self.flipped = 0
+        self.failures = {}
+
+    def record(self, result: DecodeResult):
+        """Count a single decode result.
+
+        Args:
+            result (DecodeResult): The result to count.
+        """
+        self.scanned += 1
+        if result.reason is None:
+            self.decoded += 1
+            if result.orientation == DecodeResult.FLIPPED:
+                self.flipped += 1
+        else:
+            self.failures[result.reason] = self.failures.get(result.reason, 0) + 1
+
+    def record_batch(self, result: BatchDecodeResult):
+        """Count every row of a batch decode result.
+
+        Args:
+            result (BatchDecodeResult): The results to count.
+        """
+        self.scanned += len(result)
+        self.decoded += int(result.valid.sum())
+        self.flipped += int(result.flipped.sum())
+        invalid = len(result) - int(result.valid.sum())
+        if invalid:
+            self.failures["invalid"] = self.failures.get("invalid", 0) + invalid
+
+    def merge(self, other: 'ScanStats'):
+        """Add the counts of another ScanStats (e.g. from another chunk of the
+        same file) to this one.
+
+        Args:
+            other (ScanStats): The statistics to add.
+        """
+        self.scanned += other.scanned
+        self.decoded += other.decoded
+        self.flipped += other.flipped
+        for reason, count in other.failures.items():
+            self.failures[reason] = self.failures.get(reason, 0) + count
+
+    def get_invalid(self) -> int:
+        """Get the number of scans that didn't decode.
+
+        Returns:
+            int: The number of invalid scans.
+        """
+        return self.scanned - self.decoded
+
+    def __repr__(self):
+        return (f"ScanStats(scanned={self.scanned}, decoded={self.decoded}, "
+                f"flipped={self.flipped}, invalid={self.get_invalid()})")
+
+
+class DecodeCache:
+    """A bounded LRU cache from raw scans (binary strings or their integer
+    form) to DecodeResults, including failed decodes.
+
+    Lane traffic is mostly the same few hundred SKUs scanned over and over,
+    so most scans can skip decoding altogether.
+    """
+
+    def __init__(self, maxsize: int):
+        if maxsize <= 0:
+            raise ValueError("Cache size must be positive")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key) -> DecodeResult:
+        """Look up a scan, marking it as recently used.
+
+        Args:
+            key (str or int): The raw scan.
+        Returns:
+            DecodeResult: The cached result (None if not cached).
+        """
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result: DecodeResult):
+        """Cache a decode result, evicting the least recently used entry if
+        the cache is full.
+
+        Args:
+            key (str or int): The raw scan.
+            result (DecodeResult): Its decode result.
+        """
+        self._entries[key] = result
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return (f"DecodeCache(hits={self.hits}, misses={self.misses}, "
+                f"evictions={self.evictions}, size={len(self)}, maxsize={self.maxsize})")
+
 
 class BarcodeProcessor:
     LEFT_SIDE_MODULES = {
@@ -34,6 +231,41 @@ class BarcodeProcessor:
     MODULE_WIDTH = 7
     CENTER_GUARD_LENGTH = 5
 
+    # Reverse mappings, from digits to modules, used by encode()
+    LEFT_DIGIT_MODULES = {digit: module for module, digit in LEFT_SIDE_MODULES.items()}
+    RIGHT_DIGIT_MODULES = {digit: module for module, digit in RIGHT_SIDE_MODULES.items()}
+
+    # Lookup tables indexed by the integer value of a 7-bit module.
+    LEFT_MODULE_TABLE = _build_module_table(LEFT_SIDE_MODULES)
+    RIGHT_MODULE_TABLE = _build_module_table(RIGHT_SIDE_MODULES)
+
+    # Bit offsets (from the least significant bit) of each module when the
+    # whole 95-bit barcode is read as one integer.
+    LEFT_MODULE_SHIFTS = tuple(85 - 7 * i for i in range(6))
+    RIGHT_MODULE_SHIFTS = tuple(38 - 7 * i for i in range(6))
+    CENTER_GUARD_SHIFT = 45
+
+    # ODD_PARITY[i] is 1 if the 7-bit module i has an odd number of 1s
+    ODD_PARITY = tuple(bin(i).count('1') % 2 for i in range(128))
+
+    # Failure reasons reported by decode()
+    BAD_LENGTH = "wrong length"
+    BAD_CHARACTERS = "non-binary characters"
+    BAD_LEFT_GUARD = "wrong LEFT guard"
+    BAD_CENTER_GUARD = "wrong CENTER guard"
+    BAD_RIGHT_GUARD = "wrong RIGHT guard"
+    BAD_LEFT_MODULE = "invalid LEFT module"
+    BAD_RIGHT_MODULE = "invalid RIGHT module"
+    BAD_CHECK_DIGIT = "security check failed"
+
+    def __init__(self, cache_size: int = 0):
+        """
+        Args:
+            cache_size (int, optional): Keep the results of up to this many
+                distinct scans in a DecodeCache. Defaults to 0 (no cache).
+        """
+        self.cache = DecodeCache(cache_size) if cache_size else None
+
     def invert_barcode(self, binary_barcode: str) -> str:
         """Given a barcode (length 95 string), invert it.
 
@@ -170,6 +402,40 @@ class BarcodeProcessor:
         return left_digits + right_digits
     
 
+    def encode(self, numeric_barcode: str) -> str:
+        """Given a numeric barcode (length 12 string), encode it as a binary
+        barcode (length 95 string). This is the inverse of convert_to_12_digits;
+        the check digit is encoded as given, not verified.
+
+        Args:
+            numeric_barcode (str): The barcode to encode.
+        Returns:
+            str: The 95 bit binary barcode.
+        Raises:
+            ValueError: If the barcode isn't 12 digits.
+        """
+        if len(numeric_barcode) != 12 or not numeric_barcode.isdigit():
+            raise ValueError("Invalid barcode format")
+        left = self.LEFT_DIGIT_MODULES
+        right = self.RIGHT_DIGIT_MODULES
+        return (self.GUARDS["LEFT"]
+                + ''.join(left[d] for d in numeric_barcode[:6])
+                + self.GUARDS["CENTER"]
+                + ''.join(right[d] for d in numeric_barcode[6:])
+                + self.GUARDS["RIGHT"])
+
+    def compute_check_digit(self, digits: str) -> str:
+        """Given the first 11 digits of a barcode, compute its check digit
+        (see modulo_check).
+
+        Args:
+            digits (str): The first 11 digits.
+        Returns:
+            str: The check digit.
+        """
+        total = 3 * sum(map(int, digits[0:11:2])) + sum(map(int, digits[1:11:2]))
+        return str((10 - total % 10) % 10)
+
     def modulo_check(self, numeric_barcode: str) -> bool:
         """Given a numeric barcode (length 12 string), check through the modulo check if it's read in properly.
         The modulo check is as follows:
@@ -235,6 +501,241 @@ class BarcodeProcessor:
 
         return True
 
+    def _decode_value(self, value: int) -> tuple:
+        """Given a 95-bit barcode read as an integer, decode it in one pass.
+
+        Guards, module parity (through the lookup tables, which only contain
+        valid modules) and the check digit are all verified here.
+
+        Args:
+            value (int): The barcode bits, first bit most significant.
+        Returns:
+            tuple: (digits, None) on success, or (None, reason) where reason
+                is one of the BAD_* failure reasons.
+        """
+        if value >> 92 != 0b101:
+            return None, self.BAD_LEFT_GUARD
+        if (value >> self.CENTER_GUARD_SHIFT) & 0b11111 != 0b01010:
+            return None, self.BAD_CENTER_GUARD
+        if value & 0b111 != 0b101:
+            return None, self.BAD_RIGHT_GUARD
+
+        left_table = self.LEFT_MODULE_TABLE
+        right_table = self.RIGHT_MODULE_TABLE
+        digits = []
+        for shift in self.LEFT_MODULE_SHIFTS:
+            digit = left_table[(value >> shift) & 0x7F]
+            if digit < 0:
+                return None, self.BAD_LEFT_MODULE
+            digits.append(digit)
+        for shift in self.RIGHT_MODULE_SHIFTS:
+            digit = right_table[(value >> shift) & 0x7F]
+            if digit < 0:
+                return None, self.BAD_RIGHT_MODULE
+            digits.append(digit)
+
+        total = 3 * sum(digits[0:11:2]) + sum(digits[1:11:2])
+        if (10 - total % 10) % 10 != digits[11]:
+            return None, self.BAD_CHECK_DIGIT
+        return ''.join(map(str, digits)), None
+
+    def decode(self, binary_barcode: str) -> DecodeResult:
+        """Given a barcode (length 95 string), decode it without raising.
+
+        This is the fast path used by POSSystem. The orientation is told
+        from the parity of the first module (a left module has an odd number
+        of 1s, a reversed right module an even number), so the barcode is
+        decoded exactly once, in the right direction. Unlike validate_barcode,
+        it does not rely on assert, so it also works under ``python -O``.
+
+        With a cache, results (including failures) are shared between calls
+        for the same scan, so they must not be modified.
+
+        Args:
+            binary_barcode (str): The barcode to decode.
+        Returns:
+            DecodeResult: The digits and orientation, or the failure reason.
+        """
+        cache = self.cache
+        if cache is None:
+            return self._decode_string(binary_barcode)
+        result = cache.get(binary_barcode)
+        if result is None:
+            result = self._decode_string(binary_barcode)
+            cache.put(binary_barcode, result)
+        return result
+
+    def _decode_string(self, binary_barcode: str) -> DecodeResult:
+        """Uncached decode()."""
+        if len(binary_barcode) != self.BARCODE_LENGTH:
+            return DecodeResult(reason=self.BAD_LENGTH)
+        if binary_barcode.count('0') + binary_barcode.count('1') != self.BARCODE_LENGTH:
+            return DecodeResult(reason=self.BAD_CHARACTERS)
+
+        value = int(binary_barcode, 2)
+        if self.ODD_PARITY[(value >> self.LEFT_MODULE_SHIFTS[0]) & 0x7F]:
+            orientation = DecodeResult.NORMAL
+        else:
+            orientation = DecodeResult.FLIPPED
+            value = int(binary_barcode[::-1], 2)
+
+        digits, reason = self._decode_value(value)
+        if reason is not None:
+            return DecodeResult(reason=reason)
+        return DecodeResult(digits, orientation)
+
+    def decode_value(self, value: int) -> DecodeResult:
+        """Given a 95-bit barcode read as an integer (first bit most
+        significant), decode it without raising, like decode().
+
+        Args:
+            value (int): The barcode bits, e.g. a packed scan log record.
+        Returns:
+            DecodeResult: The digits and orientation, or the failure reason.
+        """
+        cache = self.cache
+        if cache is None:
+            return self._decode_integer(value)
+        result = cache.get(value)
+        if result is None:
+            result = self._decode_integer(value)
+            cache.put(value, result)
+        return result
+
+    def _decode_integer(self, value: int) -> DecodeResult:
+        """Uncached decode_value()."""
+        if value < 0 or value >> self.BARCODE_LENGTH:
+            return DecodeResult(reason=self.BAD_LENGTH)
+        if self.ODD_PARITY[(value >> self.LEFT_MODULE_SHIFTS[0]) & 0x7F]:
+            orientation = DecodeResult.NORMAL
+        else:
+            orientation = DecodeResult.FLIPPED
+            value = int(format(value, '095b')[::-1], 2)
+
+        digits, reason = self._decode_value(value)
+        if reason is not None:
+            return DecodeResult(reason=reason)
+        return DecodeResult(digits, orientation)
+
+    def _decode_bit_rows(self, bits):
+        """Given an (N, 95) array of 0/1 bits, decode every row as read.
+
+        Args:
+            bits (numpy.ndarray): The barcode bits, one barcode per row.
+        Returns:
+            tuple: (digits, ok) where digits is an (N, 12) int8 array (-1 for
+                invalid modules) and ok is a boolean mask of valid rows.
+        """
+        left_table = np.array(self.LEFT_MODULE_TABLE, dtype=np.int8)
+        right_table = np.array(self.RIGHT_MODULE_TABLE, dtype=np.int8)
+
+        ok = (bits[:, :3] == (1, 0, 1)).all(axis=1)
+        ok &= (bits[:, 45:50] == (0, 1, 0, 1, 0)).all(axis=1)
+        ok &= (bits[:, 92:] == (1, 0, 1)).all(axis=1)
+
+        # Pack each 7-bit module into its integer lookup index
+        weights = (1 << np.arange(self.MODULE_WIDTH - 1, -1, -1)).astype(np.uint8)
+        left = np.einsum('ijk,k->ij', bits[:, 3:45].reshape(-1, 6, self.MODULE_WIDTH), weights)
+        right = np.einsum('ijk,k->ij', bits[:, 50:92].reshape(-1, 6, self.MODULE_WIDTH), weights)
+        digits = np.concatenate((left_table[left], right_table[right]), axis=1)
+        ok &= (digits >= 0).all(axis=1)
+
+        wide = digits.astype(np.int16)
+        total = 3 * wide[:, 0:11:2].sum(axis=1) + wide[:, 1:11:2].sum(axis=1)
+        ok &= (10 - total % 10) % 10 == wide[:, 11]
+        return digits, ok
+
+    def decode_batch_array(self, bits, mask=None) -> BatchDecodeResult:
+        """Given an (N, 95) array of 0/1 bits, decode every row at once.
+
+        As in decode(), each row's orientation is told from the parity of
+        its first module, and the row is decoded once in that direction.
+
+        Args:
+            bits (numpy.ndarray): The barcode bits, one barcode per row.
+            mask (numpy.ndarray, optional): Rows known to be unusable.
+        Returns:
+            BatchDecodeResult: The codes with validity and orientation masks.
+        """
+        if np is None:
+            raise ImportError("Batch decoding requires numpy")
+        bits = np.asarray(bits, dtype=np.uint8).reshape(-1, self.BARCODE_LENGTH)
+
+        flipped = bits[:, 3:10].sum(axis=1) % 2 == 0
+        if flipped.any():
+            bits = np.where(flipped[:, None], bits[:, ::-1], bits)
+        digits, valid = self._decode_bit_rows(bits)
+        if mask is not None:
+            valid &= mask
+        flipped &= valid
+
+        chars = (digits + ord('0')).astype(np.uint8)
+        codes = np.ascontiguousarray(chars).view('S12').ravel().astype('U12')
+        return BatchDecodeResult(np.where(valid, codes, ''), valid, flipped)
+
+    def _decode_char_rows(self, chars) -> BatchDecodeResult:
+        """Given an (N, 95) array of ASCII codes, decode every row at once."""
+        bits = chars - np.uint8(ord('0'))
+        binary = (bits <= 1).all(axis=1)
+        if not binary.all():
+            bits = np.where(binary[:, None], bits, 0).astype(np.uint8)
+        return self.decode_batch_array(bits, binary)
+
+    def decode_batch(self, lines) -> BatchDecodeResult:
+        """Given binary barcodes (length 95 strings), decode them all at once.
+
+        Lines are stripped first; lines of the wrong length or with
+        non-binary characters are reported as invalid.
+
+        Args:
+            lines (Iterable[str]): The barcodes to decode.
+        Returns:
+            BatchDecodeResult: The codes with validity and orientation masks.
+        """
+        if np is None:
+            raise ImportError("Batch decoding requires numpy")
+        lines = [line.strip() for line in lines]
+        length = self.BARCODE_LENGTH
+        right_length = np.fromiter((len(line) == length for line in lines), dtype=bool, count=len(lines))
+        blank = '0' * length
+        data = ''.join(line if len(line) == length else blank for line in lines)
+        chars = np.frombuffer(data.encode('ascii', 'replace'), dtype=np.uint8)
+        result = self._decode_char_rows(chars.reshape(-1, length))
+        result.valid &= right_length
+        result.flipped &= right_length
+        result.codes[~right_length] = ''
+        return result
+
+    def decode_batch_file(self, barcode_file_path: str) -> BatchDecodeResult:
+        """Decode every line of a scan file at once.
+
+        Files made of fixed-width lines (95 bits and a newline) are decoded
+        straight from the file bytes without splitting them into lines.
+
+        Args:
+            barcode_file_path (str): The scan file to decode.
+        Returns:
+            BatchDecodeResult: The codes with validity and orientation masks.
+        """
+        if np is None:
+            raise ImportError("Batch decoding requires numpy")
+        with open(barcode_file_path, 'rb') as f:
+            data = f.read()
+        width = self.BARCODE_LENGTH + 1
+        if data and len(data) % width == 0:
+            rows = np.frombuffer(data, dtype=np.uint8).reshape(-1, width)
+            if (rows[:, -1] == ord('\n')).all():
+                return self._decode_char_rows(rows[:, :-1])
+        return self.decode_batch(data.decode('ascii', 'replace').splitlines())
+
+    def cache_info(self) -> DecodeCache:
+        """Get the decode cache, with its hit, miss and eviction counters.
+
+        Returns:
+            DecodeCache: The cache (None if caching is off).
+        """
+        return self.cache
+
     def flip_barcode(self, barcode: str) -> str:
         """Return the barcode flipped (reversed).
 
@@ -249,12 +750,13 @@ class BarcodeProcessor:
 
 def barcode_doctests():
     """
-    >>> from tester_student import generate_barcode_12, barcode_digits2binary
     >>> scanner = BarcodeProcessor()
     >>> valid_numeric = '252109613999'
-    >>> valid_binary = barcode_digits2binary(valid_numeric)
+    >>> valid_binary = scanner.encode(valid_numeric)
     >>> invalid_numeric = '036000291439'
-    >>> invalid_binary = barcode_digits2binary(invalid_numeric)
+    >>> invalid_binary = scanner.encode(invalid_numeric)
+    >>> scanner.compute_check_digit(valid_numeric[:11]) == valid_numeric[-1]
+    True
     >>> scanner._validate_length('')
     Traceback (most recent call last):
     ...
@@ -300,3 +802,64 @@ def barcode_doctests():
     >>> all(checks)
     True
     """
+
+
+def decode_doctests():
+    """
+    >>> scanner = BarcodeProcessor()
+    >>> binary = scanner.encode('252109613999')
+    >>> scanner.decode(binary)
+    DecodeResult('252109613999', 'normal')
+    >>> scanner.decode(scanner.flip_barcode(binary))
+    DecodeResult('252109613999', 'flipped')
+    >>> scanner.decode(binary[:-1])
+    DecodeResult(invalid: wrong length)
+    >>> scanner.decode(binary[:10] + 'x' + binary[11:])
+    DecodeResult(invalid: non-binary characters)
+    >>> scanner.decode('000' + binary[3:]).reason
+    'wrong LEFT guard'
+    >>> scanner.decode(binary[:45] + '11111' + binary[50:]).reason
+    'wrong CENTER guard'
+    >>> scanner.decode(scanner.invert_barcode(binary)).is_valid()
+    False
+    >>> bad_check = scanner.encode('252109613998')
+    >>> scanner.decode(bad_check).reason
+    'security check failed'
+    >>> cached = BarcodeProcessor(cache_size=2)
+    >>> for line in [binary, binary, bad_check, bad_check, '', binary]:
+    ...     _ = cached.decode(line)
+    >>> cached.decode(binary) is cached.decode(binary)
+    True
+    >>> cached.cache_info()
+    DecodeCache(hits=4, misses=4, evictions=2, size=2, maxsize=2)
+    >>> stats = ScanStats()
+    >>> for line in [binary, scanner.flip_barcode(binary), bad_check, '']:
+    ...     stats.record(scanner.decode(line))
+    >>> stats
+    ScanStats(scanned=4, decoded=2, flipped=1, invalid=2)
+    """
+
+
+def decode_batch_doctests():
+    """Requires numpy.
+
+    >>> scanner = BarcodeProcessor()
+    >>> lines = [scanner.encode('252109613999'), scanner.encode('012345678905')[::-1],
+    ...          scanner.encode('036000291439'), '101', '']
+    >>> result = scanner.decode_batch(lines)
+    >>> result.codes.tolist()
+    ['252109613999', '012345678905', '', '', '']
+    >>> result.valid.tolist()
+    [True, True, False, False, False]
+    >>> result.flipped.tolist()
+    [False, True, False, False, False]
+    >>> result.valid_codes()
+    ['252109613999', '012345678905']
+    >>> stats = ScanStats()
+    >>> stats.record_batch(result)
+    >>> stats
+    ScanStats(scanned=5, decoded=2, flipped=1, invalid=3)
+    >>> all(scanner.decode(line).digits == code or not code
+    ...     for line, code in zip(lines, result.codes))
+    True
+    """
@@ -0,0 +1,3 @@
+"""Benchmarks for the POS hot paths. Run them from the root folder of the
+project (same level as main.py), e.g. ``python -m benchmarks.bench_decode``.
+"""
@@ -0,0 +1,85 @@
+"""Compare the per-line barcode decoders with the NumPy batch decoder.
+
+Usage:
+    python -m benchmarks.bench_decode [--scans N] [--flip-rate R] [--skus K]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from barcode import BarcodeProcessor
+from loadgen import LoadGenerator
+
+
+def make_scan_lines(count: int, flip_rate: float = 0.1, seed: int = 0,
+                    skus: int = None) -> list[str]:
+    """Build ``count`` valid 95-bit scans, a fraction of them reversed. With
+    ``skus``, scans repeat a pool of that many distinct products."""
+    generator = LoadGenerator(seed)
+    products = generator.generate_barcodes('0', skus or count)
+    if not skus:
+        return [line[::-1] if generator.rng.random() < flip_rate else line
+                for line in map(generator.processor.encode, products)]
+    return list(generator.generate_scans(count, products, flip_rate=flip_rate))
+
+
+def legacy_decode(scanner: BarcodeProcessor, lines: list[str]) -> int:
+    """The validate-then-flip loop POSSystem used before decode()."""
+    decoded = 0
+    for binary_barcode in lines:
+        try:
+            scanner.validate_barcode(binary_barcode)
+            scanner.convert_to_12_digits(binary_barcode)
+        except ValueError:
+            flipped = scanner.flip_barcode(binary_barcode)
+            try:
+                scanner.validate_barcode(flipped)
+                scanner.convert_to_12_digits(flipped)
+            except ValueError:
+                continue
+        decoded += 1
+    return decoded
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scans', type=int, default=200_000)
+    parser.add_argument('--flip-rate', type=float, default=0.1)
+    parser.add_argument('--skus', type=int, default=500,
+                        help="distinct products scanned (0 for all unique)")
+    args = parser.parse_args()
+
+    scanner = BarcodeProcessor()
+    cached = BarcodeProcessor(cache_size=1024)
+    lines = make_scan_lines(args.scans, args.flip_rate, skus=args.skus)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        f.write(''.join(line + '\n' for line in lines))
+    try:
+        cases = [
+            ('validate + flip (legacy)', lambda: legacy_decode(scanner, lines)),
+            ('decode() per line', lambda: sum(scanner.decode(line).is_valid() for line in lines)),
+            ('decode() with 1K LRU cache', lambda: sum(cached.decode(line).is_valid() for line in lines)),
+            ('decode_batch(lines)', lambda: int(scanner.decode_batch(lines).valid.sum())),
+            ('decode_batch_file(path)', lambda: int(scanner.decode_batch_file(f.name).valid.sum())),
+        ]
+        baseline = None
+        print(f"{args.scans} scans, {args.skus or 'all unique'} SKUs, flip rate {args.flip_rate}")
+        for name, func in cases:
+            seconds, decoded = timed(func)
+            baseline = baseline or seconds
+            print(f"{name:28s} {seconds:8.3f}s {args.scans / seconds:14,.0f} scans/s"
+                  f" {baseline / seconds:8.1f}x  ({decoded} decoded)")
+        print(cached.cache_info())
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == '__main__':
+    main()
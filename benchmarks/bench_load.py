@@ -0,0 +1,133 @@
+"""Compare the database CSV loads with the readlines/split loops they replaced.
+
+Usage:
+    python -m benchmarks.bench_load [--products N] [--members N] [--coupons N]
+                                    [--workers W]
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from coupon import PercentDiscountCoupon, FixedDiscountCoupon
+from database import ProductDatabase, MemberDatabase, CouponDatabase
+from loadgen import LoadGenerator
+from member import Member, SilverMember, GoldMember, PlatinumMember
+from product import Product
+
+
+def legacy_load_products(inventory_path: str) -> dict:
+    """The ProductDatabase loop before csvload."""
+    products = {}
+    with open(inventory_path, 'r') as f:
+        lines = f.readlines()
+        for line in lines[1:]:
+            line = line.strip()
+            if line:
+                parts = [x.strip() for x in line.split(',')]
+                barcode, name, price, quantity = parts
+                products[barcode] = Product(barcode, name, float(price), int(quantity))
+    return products
+
+
+def legacy_load_members(membership_path: str) -> dict:
+    """The MemberDatabase loop before csvload."""
+    memberships = {}
+    with open(membership_path, 'r') as f:
+        lines = f.readlines()
+        for line_num, line in enumerate(lines[1:], start=2):
+            line = line.strip()
+            if line:
+                parts = [x.strip() for x in line.split(',')]
+                if len(parts) != 4:
+                    print(f"WARNING: Skipping malformed line {line_num}: {line}")
+                    continue
+                barcode, name, tier, points = parts
+                points = float(points)
+                if tier == 'Silver':
+                    member = SilverMember(barcode, name, points)
+                elif tier == 'Gold':
+                    member = GoldMember(barcode, name, points)
+                elif tier == 'Platinum':
+                    member = PlatinumMember(barcode, name, points)
+                elif tier == 'Member':
+                    member = Member(barcode, name, points)
+                else:
+                    print(f"WARNING: Unknown tier '{tier}' on line {line_num} for barcode {barcode}. Skipping.")
+                    continue
+                memberships[barcode] = member
+    return memberships
+
+
+def legacy_load_coupons(coupon_path: str) -> dict:
+    """The CouponDatabase loop before csvload."""
+    coupons = {}
+    with open(coupon_path, 'r') as f:
+        lines = f.readlines()
+        for line in lines[1:]:
+            line = line.strip()
+            if line:
+                parts = [x.strip() for x in line.split(',')]
+                barcode, expiration, discount_type, discount_value, min_purchase, description = parts
+                expiration = datetime.strptime(expiration, '%Y-%m-%d')
+                discount_value = float(discount_value)
+                min_purchase = float(min_purchase)
+                if discount_type == 'percent':
+                    coupon = PercentDiscountCoupon(barcode, expiration, min_purchase, description, discount_value)
+                elif discount_type == 'fixed':
+                    coupon = FixedDiscountCoupon(barcode, expiration, min_purchase, description, discount_value)
+                coupons[barcode] = coupon
+    return coupons
+
+
+def timed(func, *args, repeat: int = 3, **kwargs) -> float:
+    """Best time of ``repeat`` loads, each with the previous load's objects
+    already freed."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--members', type=int, default=1_000_000)
+    parser.add_argument('--coupons', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    generator = LoadGenerator(0)
+    with tempfile.TemporaryDirectory() as folder:
+        inventory_path = os.path.join(folder, 'inventory.csv')
+        membership_path = os.path.join(folder, 'memberships.csv')
+        coupon_path = os.path.join(folder, 'coupons.csv')
+        generator.write_inventory(inventory_path, args.products)
+        generator.write_memberships(membership_path, args.members)
+        generator.write_coupons(coupon_path, args.coupons)
+
+        files = [
+            ('products', args.products, legacy_load_products, ProductDatabase, inventory_path),
+            ('members', args.members, legacy_load_members, MemberDatabase, membership_path),
+            ('coupons', args.coupons, legacy_load_coupons, CouponDatabase, coupon_path),
+        ]
+        for name, rows, legacy, database_class, path in files:
+            legacy_seconds = timed(legacy, path)
+            seconds = timed(database_class, path)
+            print(f"{name:10s} {rows:>10,} rows  legacy {legacy_seconds:7.3f}s"
+                  f"  csvload {seconds:7.3f}s ({legacy_seconds / seconds:4.1f}x)", end='')
+            if args.workers > 1:
+                parallel_seconds = timed(database_class, path, workers=args.workers)
+                print(f"  {args.workers} workers {parallel_seconds:7.3f}s"
+                      f" ({legacy_seconds / parallel_seconds:4.1f}x)", end='')
+            print()
+
+
+if __name__ == '__main__':
+    main()
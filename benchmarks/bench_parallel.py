@@ -0,0 +1,63 @@
+"""Measure how POSSystem.process_barcodes_parallel scales with workers.
+
+Usage:
+    python -m benchmarks.bench_parallel [--scans N] [--workers 1 2 4 8]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from barcode import BarcodeProcessor
+from benchmarks.bench_decode import make_scan_lines
+from pos import POSSystem
+
+
+def write_fixtures(folder: str, lines: list[str]) -> tuple[str, str, str, str]:
+    """Write a scan log and an inventory holding every scanned product."""
+    scanner = BarcodeProcessor()
+    codes = sorted({scanner.decode(line).digits for line in lines})
+    paths = [os.path.join(folder, name) for name in
+             ('scans.txt', 'inventory.csv', 'memberships.csv', 'coupons.csv')]
+    with open(paths[0], 'w') as f:
+        f.write(''.join(line + '\n' for line in lines))
+    with open(paths[1], 'w') as f:
+        f.write("barcode,name,price,quantity\n")
+        f.write(''.join(f"{code},Item {code},1.0,100\n" for code in codes))
+    with open(paths[2], 'w') as f:
+        f.write("barcode,name,tier,points\n")
+    with open(paths[3], 'w') as f:
+        f.write("barcode,expiration,discount_type,discount_value,min_purchase,description\n")
+    return tuple(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scans', type=int, default=500_000)
+    parser.add_argument('--skus', type=int, default=0,
+                        help="distinct products scanned (0 for all unique)")
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        scan_path, *db_paths = write_fixtures(folder, make_scan_lines(args.scans, skus=args.skus))
+        print(f"{args.scans} scans, {os.cpu_count()} CPUs")
+
+        pos = POSSystem(*db_paths)
+        start = time.perf_counter()
+        pos.process_barcodes(scan_path)
+        serial = time.perf_counter() - start
+        print(f"{'process_barcodes':24s} {serial:8.3f}s {args.scans / serial:12,.0f} scans/s")
+
+        for workers in args.workers:
+            pos = POSSystem(*db_paths)
+            start = time.perf_counter()
+            pos.process_barcodes_parallel(scan_path, workers=workers)
+            seconds = time.perf_counter() - start
+            print(f"{f'parallel, {workers} workers':24s} {seconds:8.3f}s "
+                  f"{args.scans / seconds:12,.0f} scans/s {serial / seconds:6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""Time every POS hot path at several data sizes and check for regressions.
+
+Each size generates (with loadgen.py) a catalog of that many SKUs, a scan
+log of that many scans, and proportionally smaller membership and coupon
+files. Results are written as JSON and compared with a stored baseline; a
+case slower than the baseline by more than the threshold is a regression,
+and the runner exits with status 1. Baselines are per machine and not
+committed: without one, the runner exits with status 2 (store one first
+with --update-baseline).
+
+Usage (from the root folder of the project):
+    python -m benchmarks.run [--sizes 1000 100000 1000000] [--cases NAME ...]
+                             [--output results.json] [--baseline PATH]
+                             [--threshold 0.2] [--update-baseline]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from barcode import BarcodeProcessor, np
+from cart import ShoppingCart
+from database import (ProductDatabase, ColumnarProductDatabase, MappedProductDatabase,
+                      MemberDatabase, LazyMemberDatabase, CouponDatabase)
+from loadgen import LoadGenerator
+from pos import POSSystem
+from sqlite_store import SQLiteStore, open_backend
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+BASKET_SIZE = 50
+BATCH_SIZE = 100
+
+
+class Timer:
+    """Context manager accumulating the time spent inside it. Like timeit,
+    it turns the garbage collector off while timing."""
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        gc.collect()
+        gc.disable()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed += time.perf_counter() - self._start
+        gc.enable()
+
+
+class Fixture:
+    """Generated data files for one data size, in their own folder laid out
+    like the project root (db-data/ and cart-data/)."""
+
+    def __init__(self, folder: str, size: int, seed: int = 0):
+        self.folder = folder
+        self.size = size
+        os.makedirs(os.path.join(folder, 'db-data'), exist_ok=True)
+        os.makedirs(os.path.join(folder, 'cart-data'), exist_ok=True)
+        self.inventory_path = os.path.join(folder, 'db-data', 'inventory.csv')
+        self.membership_path = os.path.join(folder, 'db-data', 'memberships.csv')
+        self.coupon_path = os.path.join(folder, 'db-data', 'coupons.csv')
+        self.scan_path = os.path.join(folder, 'cart-data', 'scans.txt')
+        self.sqlite_path = os.path.join(folder, 'db-data', 'store.db')
+        self.snapshot_path = os.path.join(folder, 'db-data', 'inventory.bin')
+
+        generator = LoadGenerator(seed)
+        self.products = generator.write_inventory(self.inventory_path, size)
+        self.members = generator.write_memberships(self.membership_path, max(size // 10, 10))
+        self.coupons = generator.write_coupons(self.coupon_path, max(size // 100, 10))
+        generator.write_scan_log(self.scan_path, size, self.products, members=self.members,
+                                 coupons=self.coupons, flip_rate=0.1, corruption_rate=0.01)
+        with open(self.scan_path, 'r') as f:
+            self.scan_lines = [line.strip() for line in f]
+        store = SQLiteStore(self.sqlite_path)
+        store.import_csv(*self.paths())
+        store.close()
+        MappedProductDatabase.build(self.inventory_path, self.snapshot_path)
+
+    def paths(self) -> tuple[str, str, str]:
+        return self.inventory_path, self.membership_path, self.coupon_path
+
+
+def bench_decode_lines(fixture: Fixture, timer: Timer):
+    scanner = BarcodeProcessor()
+    decode = scanner.decode
+    with timer:
+        for line in fixture.scan_lines:
+            decode(line)
+
+
+def bench_decode_batch_file(fixture: Fixture, timer: Timer):
+    scanner = BarcodeProcessor()
+    with timer:
+        scanner.decode_batch_file(fixture.scan_path)
+
+
+def bench_load_products(fixture: Fixture, timer: Timer):
+    with timer:
+        ProductDatabase(fixture.inventory_path)
+
+
+def bench_load_products_columnar(fixture: Fixture, timer: Timer):
+    with timer:
+        ColumnarProductDatabase(fixture.inventory_path)
+
+
+def bench_open_snapshot(fixture: Fixture, timer: Timer):
+    with timer:
+        database = MappedProductDatabase(fixture.snapshot_path)
+        database.get_product(fixture.products[0])
+    database.close()
+
+
+def bench_load_members(fixture: Fixture, timer: Timer):
+    with timer:
+        MemberDatabase(fixture.membership_path)
+
+
+def bench_open_members_lazy(fixture: Fixture, timer: Timer):
+    with timer:
+        database = LazyMemberDatabase(fixture.membership_path)
+        database.get_member(fixture.members[0])
+    database.close()
+
+
+def bench_load_coupons(fixture: Fixture, timer: Timer):
+    with timer:
+        CouponDatabase(fixture.coupon_path)
+
+
+def bench_open_sqlite(fixture: Fixture, timer: Timer):
+    with timer:
+        backend = open_backend(fixture.sqlite_path)
+        backend.get_product(fixture.products[0])
+
+
+def bench_cart_build(fixture: Fixture, timer: Timer):
+    pos = POSSystem(*fixture.paths())
+    with timer:
+        pos.process_barcodes(fixture.scan_path)
+
+
+def bench_calculate_total(fixture: Fixture, timer: Timer):
+    database = ProductDatabase(fixture.inventory_path)
+    cart = ShoppingCart()
+    for barcode in fixture.products:
+        cart.add_item(database.get_product(barcode))
+    cart.add_membership(MemberDatabase(fixture.membership_path).get_member(fixture.members[0]))
+    with timer:
+        cart.calculate_total()
+
+
+def bench_checkout(fixture: Fixture, timer: Timer):
+    pos = POSSystem(*fixture.paths())
+    cart = pos.get_current_cart()
+    for barcode in fixture.products[:BASKET_SIZE]:
+        cart.add_item(pos.backend.get_product(barcode))
+    cart.add_membership(pos.backend.get_member(fixture.members[0]))
+    with timer:
+        pos.checkout()
+
+
+def bench_checkout_write_behind(fixture: Fixture, timer: Timer):
+    pos = POSSystem(*fixture.paths(), write_behind=True)
+    cart = pos.get_current_cart()
+    for barcode in fixture.products[:BASKET_SIZE]:
+        cart.add_item(pos.backend.get_product(barcode))
+    cart.add_membership(pos.backend.get_member(fixture.members[0]))
+    with timer:
+        pos.checkout()
+    pos.close()
+
+
+def bench_checkout_sqlite(fixture: Fixture, timer: Timer):
+    pos = POSSystem(None, None, None, backend=open_backend(fixture.sqlite_path))
+    cart = pos.get_current_cart()
+    for barcode in fixture.products[:BASKET_SIZE]:
+        cart.add_item(pos.backend.get_product(barcode))
+    cart.add_membership(pos.backend.get_member(fixture.members[0]))
+    with timer:
+        pos.checkout()
+
+
+def bench_checkout_many(fixture: Fixture, timer: Timer):
+    pos = POSSystem(*fixture.paths())
+    carts = []
+    for i in range(BATCH_SIZE):
+        cart = ShoppingCart()
+        for barcode in fixture.products[i:i + BASKET_SIZE]:
+            cart.add_item(pos.backend.get_product(barcode))
+        carts.append(cart)
+    with timer:
+        pos.checkout_many(carts)
+
+
+CASES = {
+    'decode_lines': bench_decode_lines,
+    'decode_batch_file': bench_decode_batch_file,
+    'load_products': bench_load_products,
+    'load_products_columnar': bench_load_products_columnar,
+    'open_snapshot': bench_open_snapshot,
+    'load_members': bench_load_members,
+    'open_members_lazy': bench_open_members_lazy,
+    'load_coupons': bench_load_coupons,
+    'open_sqlite': bench_open_sqlite,
+    'cart_build': bench_cart_build,
+    'calculate_total': bench_calculate_total,
+    'checkout': bench_checkout,
+    'checkout_write_behind': bench_checkout_write_behind,
+    'checkout_sqlite': bench_checkout_sqlite,
+    'checkout_many': bench_checkout_many,
+}
+
+
+def run(sizes: list[int], case_names: list[str], repeat: int) -> dict:
+    """Run the cases at every size, keeping the best of ``repeat`` runs.
+
+    Returns:
+        dict: Seconds per "case@size" key.
+    """
+    results = {}
+    cwd = os.getcwd()
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            print(f"Generating data for size {size:,}...", file=sys.stderr)
+            fixture = Fixture(folder, size)
+            # The databases save relative to the project root (db-data/...)
+            os.chdir(folder)
+            try:
+                for name in case_names:
+                    if name == 'decode_batch_file' and np is None:
+                        continue
+                    best = None
+                    for _ in range(repeat):
+                        timer = Timer()
+                        CASES[name](fixture, timer)
+                        best = timer.elapsed if best is None else min(best, timer.elapsed)
+                    results[f"{name}@{size}"] = best
+                    print(f"{name:20s} {size:>10,} {best:10.4f}s", file=sys.stderr)
+            finally:
+                os.chdir(cwd)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_time: float) -> list[str]:
+    """Compare results with a baseline.
+
+    Args:
+        results (dict): Seconds per "case@size" key.
+        baseline (dict): Baseline seconds per "case@size" key.
+        threshold (float): Allowed slowdown, e.g. 0.2 for 20%.
+        min_time (float): Ignore cases faster than this (timer noise).
+    Returns:
+        list[str]: The keys that regressed.
+    """
+    regressions = []
+    for key, seconds in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        ratio = seconds / base if base else float('inf')
+        regressed = ratio > 1 + threshold and seconds >= min_time
+        flag = "REGRESSION" if regressed else ""
+        print(f"{key:32s} {base:10.4f}s -> {seconds:10.4f}s {ratio:6.2f}x {flag}")
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed slowdown before a case is a regression (0.2 = 20%%)")
+    parser.add_argument('--min-time', type=float, default=0.001,
+                        help="don't flag cases faster than this many seconds")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.cases, args.repeat)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__ if np is not None else None,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        # Timings only mean something against the same machine, so there is
+        # no shared baseline: a run without one can't pass
+        print(f"No baseline at {args.baseline}: nothing to compare against. Run with "
+              f"--update-baseline on this machine first.", file=sys.stderr)
+        sys.exit(2)
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold, args.min_time)
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("No regressions.")
+
+
+if __name__ == '__main__':
+    main()
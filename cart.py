@@ -1,26 +1,116 @@
 from product import Product
 from member import Member, SilverMember, GoldMember, PlatinumMember
-from coupon import Coupon, FixedDiscountCoupon, PercentDiscountCoupon
+from coupon import Coupon, CouponEngine, FixedDiscountCoupon, PercentDiscountCoupon
 from datetime import datetime
+from money import from_cents
+
+
+class CartLine:
+    """A product in a cart, the number of units of it scanned, and its unit
+    price in cents when it was first scanned. Every unit of the line is
+    charged that price, even if the product's price changes meanwhile (e.g.
+    a hot reload of the inventory, see ProductDatabase.apply_diff)."""
+
+    __slots__ = ('product', 'quantity', 'unit_price_cents')
+
+    def __init__(self, product: Product, quantity: int):
+        self.product = product
+        self.quantity = quantity
+        self.unit_price_cents = product.get_unit_price_cents()
+
+    def get_product(self) -> Product:
+        return self.product
+
+    def get_quantity(self) -> int:
+        return self.quantity
+
+    def __repr__(self):
+        return f"CartLine({self.product.get_name()!r}, {self.quantity})"
 
 
 class ShoppingCart:
-    def __init__(self):
-        self.items = []
+    def __init__(self, now: datetime = None):
+        """
+        Args:
+            now (datetime, optional): The clock snapshot coupons are checked
+                against for the whole transaction. Defaults to
+                datetime.now() when the first coupon is added.
+        """
+        # One line per product, by barcode, in the order first scanned
+        self.lines = {}
         self.membership = None
-        self.coupons = []
+        self.coupon_engine = CouponEngine(now)
+        # In cents (see money.py), kept up to date by every change, so
+        # reading the totals after each scan doesn't walk the cart
+        self._subtotal_cents = 0
+        self._total_cents = None
+        self._coupon_revision = Coupon.revision  # of the coupon terms _total_cents used
 
         pass
 
-    def add_item(self, item: Product):
+    def add_item(self, item: Product, quantity: int = 1):
         """Add the specified item to the cart.
 
         Args:
             item (Product): The item to add to the cart.
+            quantity (int, optional): The number of units. Defaults to 1.
+        Raises:
+            ValueError: If quantity is less than 1.
         """
-        self.items.append(item)
+        if quantity < 1:
+            raise ValueError(f"quantity must be at least 1, not {quantity}")
+        barcode = item.get_barcode()
+        line = self.lines.get(barcode)
+        if line is None:
+            line = self.lines[barcode] = CartLine(item, quantity)
+        else:
+            line.quantity += quantity
+        self._update_subtotal(line.unit_price_cents * quantity)
         pass
 
+    def remove_item(self, item: Product, quantity: int = 1) -> int:
+        """Remove units of an item from the cart, e.g. a scan the customer
+        changed their mind about.
+
+        Args:
+            item (Product): The item to remove.
+            quantity (int, optional): The number of units. Defaults to 1.
+        Returns:
+            int: The number of units removed (fewer if the cart held fewer).
+        Raises:
+            ValueError: If quantity is less than 1.
+        """
+        if quantity < 1:
+            raise ValueError(f"quantity must be at least 1, not {quantity}")
+        barcode = item.get_barcode()
+        line = self.lines.get(barcode)
+        if line is None:
+            return 0
+        removed = min(quantity, line.quantity)
+        line.quantity -= removed
+        if not line.quantity:
+            del self.lines[barcode]
+        self._update_subtotal(-line.unit_price_cents * removed)
+        return removed
+
+    def void_item(self, item: Product) -> int:
+        """Remove every unit of an item from the cart.
+
+        Args:
+            item (Product): The item to void.
+        Returns:
+            int: The number of units removed.
+        """
+        line = self.lines.pop(item.get_barcode(), None)
+        if line is None:
+            return 0
+        self._update_subtotal(-line.unit_price_cents * line.quantity)
+        return line.quantity
+
+    def _update_subtotal(self, change_cents: int):
+        self._subtotal_cents += change_cents
+        self._total_cents = None
+
     def add_membership(self, membership: Member):
         """Add a membership to the cart.
 
@@ -28,29 +118,64 @@ class ShoppingCart:
             membership (Member): The membership to add to the cart.
         """
         self.membership = membership
+        self._total_cents = None
         pass
 
     def add_coupon(self, coupon: Coupon):
-        """Add a coupon to the cart.
+        """Add a coupon to the cart. Expired coupons and coupons already in
+        the cart are ignored.
 
         Args:
             coupon (Coupon): The coupon to add to the cart.
         """
-        if coupon not in self.coupons:
-            if coupon.get_expiration_date() >= datetime.now():
-                self.coupons.append(coupon)
+        if self.coupon_engine.add(coupon):
+            self._total_cents = None
 
         pass
 
+    def remove_coupon(self, coupon: Coupon) -> bool:
+        """Remove a coupon from the cart.
+
+        Args:
+            coupon (Coupon): The coupon to remove.
+        Returns:
+            bool: True if the cart held the coupon.
+        """
+        if not self.coupon_engine.remove(coupon):
+            return False
+        self._total_cents = None
+        return True
+
     def get_items(self) -> list[Product]:
-        """Get the items in the cart.
+        """Get the items in the cart, one entry per unit.
 
         Returns:
             list[Product]: The items in the cart.
         """
-        return self.items
+        return [line.product for line in self.lines.values() for _ in range(line.quantity)]
         pass
 
+    @property
+    def items(self) -> list[Product]:
+        """The items in the cart, one entry per unit (see get_items)."""
+        return self.get_items()
+
+    def get_lines(self) -> list[CartLine]:
+        """Get the line items in the cart, one per product.
+
+        Returns:
+            list[CartLine]: The lines, in the order first scanned.
+        """
+        return list(self.lines.values())
+
+    def get_item_count(self) -> int:
+        """Get the number of units in the cart.
+
+        Returns:
+            int: The number of units.
+        """
+        return sum(line.quantity for line in self.lines.values())
+
     def get_membership(self) -> Member:
         """Get the membership in the cart.
 
@@ -66,42 +191,79 @@ class ShoppingCart:
         Returns:
             list[Coupon]: The coupons in the cart.
         """
-        return self.coupons
+        return self.coupon_engine.get_coupons()
         pass
 
+    @property
+    def coupons(self) -> list[Coupon]:
+        """The coupons in the cart (see get_coupons)."""
+        return self.get_coupons()
+
+    def get_applied_coupon(self) -> Coupon:
+        """Get the coupon the total applies: the one with the largest
+        discount after the member discount.
+
+        Returns:
+            Coupon: The coupon (None if none applies).
+        """
+        return self.coupon_engine.best(self._member_total_cents())[0]
+
     def calculate_subtotal(self) -> float:
-        """Calculate the price of all items in the cart.
+        """Calculate the price of all items in the cart. Each line is priced
+        at its unit price when first scanned.
 
         Returns:
             float: The subtotal of the cart.
         """
-        return sum(item.get_unit_price() for item in self.items)
+        return from_cents(self._subtotal_cents)
         pass
 
+    def calculate_subtotal_cents(self) -> int:
+        """Calculate the price of all items in the cart, in cents.
+
+        Returns:
+            int: The subtotal of the cart in cents.
+        """
+        return self._subtotal_cents
+
     def calculate_total(self) -> float:
         """Calculate the total price of the cart, with coupon applied and membership applicable
 
+        The total is cached until the items, membership or coupons change
+        (including a coupon's terms, see Coupon.update).
+
         Returns:
             float: The total price of the cart.
         """
-        subtotal = self.calculate_subtotal()
-        if self.membership is not None:
-            subtotal = self.membership.apply_discount(subtotal)
-        if self.coupons:
-            coupon = self.coupons[0]
-            subtotal = coupon.apply_discount(subtotal)
-
-        return float(subtotal)
+        return from_cents(self.calculate_total_cents())
 
         pass
 
+    def calculate_total_cents(self) -> int:
+        """Calculate the total price of the cart in cents: the member
+        discount, then the best coupon, each rounded half up to the cent.
+
+        Returns:
+            int: The total price of the cart in cents.
+        """
+        if self._total_cents is None or self._coupon_revision != Coupon.revision:
+            self._coupon_revision = Coupon.revision
+            total = self._member_total_cents()
+            self._total_cents = total - self.coupon_engine.best(total)[1]
+        return self._total_cents
+
+    def _member_total_cents(self) -> int:
+        if self.membership is None:
+            return self._subtotal_cents
+        return self.membership.apply_discount_cents(self._subtotal_cents)
+
     def __str__(self):
         """Return a string representation of the shopping cart. This is for debugging purposes
 
         Returns:
             str: A formatted string showing the cart's contents, membership, coupons, and totals.
         """
-        lines = [f"Items: {[item.get_name() for item in self.items]}"]
+        lines = [f"Items: {[item.get_name() for item in self.get_items()]}"]
         lines.append(f"Membership: {self.membership.get_name() if self.membership else 'None'}")
         lines.append(f"Coupons: {[coupon.get_barcode() for coupon in self.coupons]}")
         lines.append(f"Subtotal: {self.calculate_subtotal():.2f}")
@@ -137,4 +299,71 @@ def shopping_cart_doctests():
     True
     >>> len(cart.get_items()) == 2
     True
+    >>> water = Product('012000000016', 'Water (case)', 4.5, 300)
+    >>> cart.add_item(water, 200)
+    >>> cart.add_item(water)
+    >>> cart.get_lines()
+    [CartLine('Milk', 1), CartLine('Bread', 1), CartLine('Water (case)', 201)]
+    >>> cart.calculate_subtotal() == 5 + 4.5 * 201
+    True
+    >>> water.price = 5.0
+    >>> cart.add_item(water)
+    >>> cart.calculate_subtotal() == 5 + 4.5 * 202
+    True
+    >>> cart.remove_item(water)
+    1
+    >>> cart.remove_item(water, 10), cart.get_item_count()
+    (10, 193)
+    >>> cart.remove_item(water, -5)
+    Traceback (most recent call last):
+    ...
+    ValueError: quantity must be at least 1, not -5
+    >>> cart.add_item(water, 0)
+    Traceback (most recent call last):
+    ...
+    ValueError: quantity must be at least 1, not 0
+    >>> cart.void_item(water), cart.void_item(water), len(cart.get_items())
+    (191, 0, 2)
+    >>> cart.calculate_total() == 3.5
+    True
+    >>> cart.remove_coupon(fc), cart.remove_coupon(fc)
+    (True, False)
+    >>> cart.calculate_total() == 4.5
+    True
+    >>> cart.void_item(Product('random_barcode', 'Milk', 2, 150))
+    1
+    >>> cart.void_item(Product('random_barcode2', 'Bread', 3, 80))
+    1
+    >>> cart.calculate_subtotal(), cart.calculate_total()
+    (0.0, 0.0)
+
+    The coupon with the largest discount applies, checked against the clock
+    snapshot of the cart:
+
+    >>> cart = ShoppingCart(now=datetime(2029, 12, 31))
+    >>> cart.add_item(Product('012000000016', 'Water (case)', 4.5, 300), 4)
+    >>> five_off = FixedDiscountCoupon('149000000011', datetime(2030, 1, 1), 10, 'Five off', 5)
+    >>> ten_percent = PercentDiscountCoupon('149000000028', datetime(2030, 1, 1), 0, '10%', 10)
+    >>> twenty_percent = PercentDiscountCoupon('149000000035', datetime(2030, 1, 1), 40, '20%', 20)
+    >>> for coupon in (ten_percent, five_off, twenty_percent, five_off):
+    ...     cart.add_coupon(coupon)
+    >>> len(cart.get_coupons()), cart.get_applied_coupon() is five_off, cart.calculate_total()
+    (3, True, 13.0)
+    >>> cart.add_item(Product('012000000023', 'Coffee', 30, 10))
+    >>> cart.get_applied_coupon() is twenty_percent, cart.calculate_total()
+    (True, 38.4)
+    >>> cart.remove_coupon(twenty_percent), cart.calculate_total()
+    (True, 43.0)
+    >>> cart.add_coupon(FixedDiscountCoupon('149000000042', datetime(2029, 1, 1), 0, 'Old', 50))
+    >>> len(cart.get_coupons())
+    2
+
+    A coupon whose terms change (a hot reload of the coupons file) is
+    re-evaluated, and can still be removed:
+
+    >>> five_off.update(FixedDiscountCoupon('149000000011', datetime(2030, 1, 1), 100, 'Five off', 5))
+    >>> cart.get_applied_coupon() is ten_percent, cart.calculate_total()
+    (True, 43.2)
+    >>> cart.remove_coupon(five_off), cart.remove_coupon(ten_percent), cart.calculate_total()
+    (True, True, 48.0)
     """
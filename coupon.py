@@ -1,7 +1,34 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import bisect
+import math
+import time
+
+from money import to_cents, from_cents, percent_to_basis_points, apply_rate
+
+# current_day's cache: the day, and the time.time() at which it ends
+_today = None
+_tomorrow = 0.0
+
+
+def current_day() -> date:
+    """Today's date, cached until midnight so expiration checks don't read
+    the clock. Coupons are valid through their expiration day, here and in
+    CouponDatabase.
+
+    Returns:
+        date: The current day.
+    """
+    global _today, _tomorrow
+    if time.time() >= _tomorrow:
+        today = date.today()
+        _tomorrow = datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp()
+        _today = today
+    return _today
 
 
 class Coupon:
+    revision = 0  # bumped whenever a coupon's terms change in place (see update)
+
     def __init__(
         self,
         numeric_barcode: str,
@@ -15,15 +42,38 @@ class Coupon:
         self._description = description
         pass
 
-    def _is_expired(self) -> bool:
-        """Check if the coupon is expired by comparing to current datetime.now()
+    def _is_expired(self, now: datetime = None) -> bool:
+        """Check if the coupon is expired: it is valid through its expiration
+        day, compared to current_day().
 
+        Args:
+            now (datetime, optional): Compare to the day of this time instead
+                (e.g. the clock snapshot of a transaction).
         Returns:
             bool: True if the coupon is expired, False otherwise.
         """
-        return datetime.now() > self._expiration_date
+        return (current_day() if now is None else now.date()) > self._expiration_date.date()
         pass
 
+    def update(self, new: 'Coupon'):
+        """Take the terms of a new version of the coupon (of the same type)
+        in place, e.g. from a hot reload of the coupons file. Carts holding
+        the coupon re-read its terms on their next total.
+
+        Args:
+            new (Coupon): The new version.
+        """
+        vars(self).update(vars(new))
+        Coupon.revision += 1
+
+    def get_barcode(self) -> str:
+        """Get the barcode of the coupon.
+
+        Returns:
+            str: The barcode of the coupon.
+        """
+        return self._barcode
+
     def get_expiration_date(self):
         """Get the expiration date of the coupon.
 
@@ -34,16 +84,50 @@ class Coupon:
 
     def discount_amount(self, subtotal: float) -> float:
         """Calculate the discount amount for the coupon.
-        This is a placeholder for the actual discount amount. You will need to implement the actual discount amount in the subclasses.
+        The subclasses implement it in cents, in discount_amount_cents.
 
         Args:
             subtotal (float): The subtotal of the cart.
+        Returns:
+            float: The discount amount
         """
-        if self._is_expired() or subtotal < self._min_purchase:
-            return 0
-        return round(subtotal * (self._percent_value / 100),3)
+        return from_cents(self.discount_amount_cents(to_cents(subtotal)))
         pass
 
+    def discount_amount_cents(self, subtotal_cents: int, now: datetime = None) -> int:
+        """Calculate the discount amount for the coupon, in cents.
+        This is a placeholder for the actual discount amount. You will need to implement the actual discount amount in the subclasses.
+
+        Args:
+            subtotal_cents (int): The subtotal of the cart in cents.
+            now (datetime, optional): The time to check expiration at.
+        Returns:
+            int: The discount amount in cents
+        """
+        if self._is_expired(now) or subtotal_cents < to_cents(self._min_purchase):
+            return 0
+        return apply_rate(subtotal_cents, percent_to_basis_points(self._percent_value))
+
+    def apply_discount(self, subtotal: float) -> float:
+        """Subtract the discount from the subtotal.
+
+        Args:
+            subtotal (float): The subtotal of the cart
+        Returns:
+            float: The discounted subtotal
+        """
+        return from_cents(self.apply_discount_cents(to_cents(subtotal)))
+
+    def apply_discount_cents(self, subtotal_cents: int) -> int:
+        """Subtract the discount from a subtotal in cents.
+
+        Args:
+            subtotal_cents (int): The subtotal of the cart in cents
+        Returns:
+            int: The discounted subtotal in cents
+        """
+        return subtotal_cents - self.discount_amount_cents(subtotal_cents)
+
 
 class PercentDiscountCoupon(Coupon):
 
@@ -59,16 +143,18 @@ class PercentDiscountCoupon(Coupon):
             self._percent_value = percent_value
             pass
 
-    def discount_amount(self, subtotal: float) -> float:
-        """Calculates the percentage discount to subtract from the subtotal based on the coupon
+    def discount_amount_cents(self, subtotal_cents: int, now: datetime = None) -> int:
+        """Calculates the percentage discount to subtract from the subtotal based on the coupon,
+        rounded half up to the cent
         Args:
-            subtotal (float): The subtotal of the cart
+            subtotal_cents (int): The subtotal of the cart in cents
+            now (datetime, optional): The time to check expiration at
         Returns:
-            float: The discount amount
+            int: The discount amount in cents
         """
-        if self._is_expired() or subtotal < self._min_purchase:
+        if self._is_expired(now) or subtotal_cents < to_cents(self._min_purchase):
             return 0
-        return round(subtotal * (self._percent_value / 100), 3)
+        return apply_rate(subtotal_cents, percent_to_basis_points(self._percent_value))
         pass
 
 
@@ -85,23 +171,155 @@ class FixedDiscountCoupon(Coupon):
             numeric_barcode, expiration_date, min_purchase, description
         )
         self.fixed_value = fixed_value
-    def discount_amount(self, subtotal: float) -> float:
+    def discount_amount_cents(self, subtotal_cents: int, now: datetime = None) -> int:
         """Calculates the fixed amount to subtract from the subtotal based on the coupon
 
         Args:
-            subtotal (float): The subtotal of the cart
+            subtotal_cents (int): The subtotal of the cart in cents
+            now (datetime, optional): The time to check expiration at
         Returns:
-            float: The discount amount
+            int: The discount amount in cents
         """
-        if self._is_expired() or subtotal < self._min_purchase:
+        if self._is_expired(now) or subtotal_cents < to_cents(self._min_purchase):
             return 0
-        return min(float(self.fixed_value), subtotal)
+        return min(to_cents(self.fixed_value), subtotal_cents)
         pass
 
-    def apply_discount(self, subtotal: float) -> float:
-        discount = self.discount_amount(subtotal)
-        return round(subtotal - discount, 3)
-        pass
+
+class CouponEngine:
+    """The coupons of one transaction, and the choice of the one to apply.
+
+    A transaction gets one coupon: the one with the largest discount on the
+    subtotal it's applied to. Expiration is checked against one clock
+    snapshot, taken when the first coupon is added (unless one is given),
+    so a coupon can't expire halfway through a transaction.
+
+    The coupons eligible for a subtotal only change when it crosses a
+    min_purchase threshold. Between two thresholds, the best percent coupon
+    is the one with the highest rate and the best fixed coupon the one with
+    the highest value, so those (and any other kind of coupon) are picked in
+    one pass when the subtotal enters a new range, and only they are
+    evaluated until it leaves it. Coupons changed in place (Coupon.update)
+    are picked up by the next call to best.
+    """
+
+    def __init__(self, now: datetime = None):
+        """
+        Args:
+            now (datetime, optional): The clock snapshot. Defaults to
+                datetime.now() when the first coupon is added.
+        """
+        self._clock = now
+        self.now = datetime.now() if now is None else now
+        self._coupons = {}  # by barcode, in the order added
+        self._minimums = {}  # min_purchase of each coupon, in cents, by barcode
+        self._thresholds = []  # sorted values of _minimums
+        self._band = None  # (low, high): the subtotals _candidates hold for
+        self._candidates = []
+        self._revision = Coupon.revision
+
+    def add(self, coupon: Coupon) -> bool:
+        """Add a coupon, unless it is expired or already added (by barcode).
+
+        Args:
+            coupon (Coupon): The coupon to add.
+        Returns:
+            bool: True if the coupon was added.
+        """
+        if not self._coupons and self._clock is None:
+            self.now = datetime.now()
+        barcode = coupon.get_barcode()
+        if barcode in self._coupons or coupon._is_expired(self.now):
+            return False
+        self._coupons[barcode] = coupon
+        minimum = self._minimums[barcode] = to_cents(coupon._min_purchase)
+        bisect.insort(self._thresholds, minimum)
+        self._band = None
+        return True
+
+    def remove(self, coupon: Coupon) -> bool:
+        """Remove a coupon.
+
+        Args:
+            coupon (Coupon): The coupon to remove.
+        Returns:
+            bool: True if the coupon had been added.
+        """
+        barcode = coupon.get_barcode()
+        if self._coupons.pop(barcode, None) is None:
+            return False
+        self._thresholds.remove(self._minimums.pop(barcode))
+        self._band = None
+        return True
+
+    def _refresh(self):
+        """Re-read the min_purchase of the coupons if any coupon changed in
+        place since they were read (see Coupon.update)."""
+        if self._revision == Coupon.revision:
+            return
+        self._revision = Coupon.revision
+        self._minimums = {barcode: to_cents(coupon._min_purchase)
+                          for barcode, coupon in self._coupons.items()}
+        self._thresholds = sorted(self._minimums.values())
+        self._band = None
+
+    def get_coupons(self) -> list[Coupon]:
+        """Get the coupons, in the order added.
+
+        Returns:
+            list[Coupon]: The coupons.
+        """
+        return list(self._coupons.values())
+
+    def best(self, subtotal_cents: int) -> tuple[Coupon, int]:
+        """Find the coupon with the largest discount on a subtotal (the
+        first added on ties).
+
+        Args:
+            subtotal_cents (int): The subtotal in cents.
+        Returns:
+            tuple[Coupon, int]: The coupon (None if none applies) and its
+                discount in cents.
+        """
+        self._refresh()
+        band = self._band
+        if band is None or not band[0] <= subtotal_cents < band[1]:
+            self._select(subtotal_cents)
+        best, best_discount = None, 0
+        for coupon in self._candidates:
+            discount = coupon.discount_amount_cents(subtotal_cents, self.now)
+            if discount > best_discount:
+                best, best_discount = coupon, discount
+        return best, best_discount
+
+    def _select(self, subtotal_cents: int):
+        """Pick the candidates for the range of subtotals between the
+        thresholds around subtotal_cents."""
+        thresholds = self._thresholds
+        i = bisect.bisect_right(thresholds, subtotal_cents)
+        self._band = (thresholds[i - 1] if i else -math.inf,
+                      thresholds[i] if i < len(thresholds) else math.inf)
+        best_percent = best_fixed = None
+        candidates = []
+        minimums = self._minimums
+        for index, (barcode, coupon) in enumerate(self._coupons.items()):
+            if minimums[barcode] > subtotal_cents:
+                continue
+            if isinstance(coupon, FixedDiscountCoupon):
+                value = to_cents(coupon.fixed_value)
+                if best_fixed is None or value > best_fixed[0]:
+                    best_fixed = (value, index, coupon)
+            elif isinstance(coupon, PercentDiscountCoupon):
+                rate = percent_to_basis_points(coupon._percent_value)
+                if best_percent is None or rate > best_percent[0]:
+                    best_percent = (rate, index, coupon)
+            else:
+                candidates.append((0, index, coupon))
+        candidates += [best for best in (best_percent, best_fixed) if best is not None]
+        # In the order added, so best() keeps the first on ties
+        candidates.sort(key=lambda candidate: candidate[1])
+        candidates = [coupon for _, _, coupon in candidates]
+        self._candidates = candidates
 
 
 def coupon_doctests():
@@ -135,7 +353,7 @@ def coupon_doctests():
     >>> test_percent.discount_amount(200.0)
     31.0
     >>> test_percent.discount_amount(15.0)
-    0
+    0.0
     >>> test_fixed = FixedDiscountCoupon(barcode, \
                                             expiration_date_not_expired, \
                                             min_purchase, \
@@ -146,7 +364,14 @@ def coupon_doctests():
     >>> test_fixed.discount_amount(20.0)
     20.0
     >>> test_fixed.discount_amount(10.0)
-    0
+    0.0
+
+    Coupons are valid through their expiration day, as in CouponDatabase:
+
+    >>> midnight = datetime.combine(current_day(), datetime.min.time())
+    >>> last_day = FixedDiscountCoupon(barcode, midnight, 0, description, 1)
+    >>> last_day._is_expired(), last_day.discount_amount(10.0)
+    (False, 1.0)
     """
     def test_coupon_discount():
         """
@@ -164,12 +389,12 @@ def coupon_doctests():
         >>> coupon.apply_discount(100.0)
         80.0
         >>> coupon.discount_amount(40.0)
-        0
+        0.0
         >>> coupon.apply_discount(40.0)
         40.0
         >>> coupon_expired = PercentDiscountCoupon(barcode, expired, min_purchase, description, percent_value)
         >>> coupon_expired.discount_amount(100.0)
-        0
+        0.0
         >>> coupon_expired.apply_discount(100.0)
         100.0
         """
@@ -0,0 +1,306 @@
+"""Streaming loader for the store CSVs.
+
+ProductDatabase, MemberDatabase and CouponDatabase all read their files
+through load_rows: the file is streamed line by line, each row is built by
+a row builder (build_product, build_member, build_coupon), and rows that
+can't be built are counted per reason in a LoadReport instead of being
+printed one by one. Member tiers and coupon types are dispatched through
+tables, and coupon expiration dates, which repeat heavily, are parsed once.
+
+For very large files, ``workers`` splits the file into line-aligned byte
+ranges that are parsed in separate processes.
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import os
+
+from product import Product
+from member import Member, SilverMember, GoldMember, PlatinumMember
+from coupon import PercentDiscountCoupon, FixedDiscountCoupon
+from scanlog import line_aligned_chunks
+
+MEMBER_TIERS = {
+    'Member': Member,
+    'Silver': SilverMember,
+    'Gold': GoldMember,
+    'Platinum': PlatinumMember,
+}
+COUPON_TYPES = {
+    'percent': PercentDiscountCoupon,
+    'fixed': FixedDiscountCoupon,
+}
+MAX_EXAMPLES = 5  # malformed line numbers kept per reason
+
+
+class MalformedRow(ValueError):
+    """Raised by a row builder for a row it can't build."""
+
+
+class LoadReport:
+    """Counts of the rows read from a CSV and of the rows skipped, by reason."""
+
+    def __init__(self):
+        self.rows = 0
+        self.malformed = Counter()
+        self.examples = {}
+
+    def record(self, reason: str, line_num: int):
+        """Count a skipped row.
+
+        Args:
+            reason (str): Why the row was skipped.
+            line_num (int): Its line number in the file (1 is the header).
+        """
+        self.malformed[reason] += 1
+        examples = self.examples.setdefault(reason, [])
+        if len(examples) < MAX_EXAMPLES:
+            examples.append(line_num)
+
+    def merge(self, other: 'LoadReport', line_offset: int = 0):
+        """Add the counts of another report (of a later part of the file).
+
+        Args:
+            other (LoadReport): The report to add.
+            line_offset (int, optional): Lines of the file before the part
+                the other report counted. Defaults to 0.
+        """
+        self.rows += other.rows
+        self.malformed.update(other.malformed)
+        for reason, line_nums in other.examples.items():
+            examples = self.examples.setdefault(reason, [])
+            examples.extend(line_num + line_offset for line_num in line_nums[:MAX_EXAMPLES - len(examples)])
+
+    def get_loaded(self) -> int:
+        return self.rows - sum(self.malformed.values())
+
+    def __str__(self):
+        skipped = ', '.join(f"{count} {reason} (lines {', '.join(map(str, self.examples[reason]))}"
+                            f"{', ...' if count > len(self.examples[reason]) else ''})"
+                            for reason, count in self.malformed.most_common())
+        return f"{self.get_loaded()} of {self.rows} rows loaded" + (f"; skipped {skipped}" if skipped else "")
+
+    def __repr__(self):
+        return f"LoadReport(rows={self.rows}, loaded={self.get_loaded()}, malformed={dict(self.malformed)})"
+
+
+def build_product(parts: list[str], dates: dict = None) -> Product:
+    """Build a product from barcode,name,price,quantity fields."""
+    if len(parts) != 4:
+        raise MalformedRow("wrong number of fields")
+    barcode, name, price, quantity = parts
+    return Product(barcode, name, float(price), int(quantity))
+
+
+def build_member(parts: list[str], dates: dict = None) -> Member:
+    """Build a member, of its tier's class, from barcode,name,tier,points
+    fields."""
+    if len(parts) != 4:
+        raise MalformedRow("wrong number of fields")
+    barcode, name, tier, points = parts
+    member_class = MEMBER_TIERS.get(tier)
+    if member_class is None:
+        raise MalformedRow("unknown tier")
+    return member_class(barcode, name, float(points))
+
+
+def build_coupon(parts: list[str], dates: dict = None):
+    """Build a coupon, of its type's class, from
+    barcode,expiration,discount_type,discount_value,min_purchase,description
+    fields.
+
+    Args:
+        parts (list[str]): The fields.
+        dates (dict, optional): Parsed expiration dates by text, filled in
+            as dates are parsed.
+    """
+    if len(parts) != 6:
+        raise MalformedRow("wrong number of fields")
+    barcode, expiration, discount_type, discount_value, min_purchase, description = parts
+    coupon_class = COUPON_TYPES.get(discount_type)
+    if coupon_class is None:
+        raise MalformedRow("unknown discount type")
+    if dates is None:
+        dates = {}
+    expiration_date = dates.get(expiration)
+    if expiration_date is None:
+        try:
+            expiration_date = dates[expiration] = datetime.strptime(expiration, '%Y-%m-%d')
+        except ValueError:
+            raise MalformedRow("invalid date") from None
+    return coupon_class(barcode, expiration_date, float(min_purchase), description, float(discount_value))
+
+
+def split_row(line: str) -> list[str]:
+    """Split a CSV line into stripped fields."""
+    return list(map(str.strip, line.split(',')))
+
+
+def iter_rows(path: str, report: LoadReport = None, start: int = 0, end: int = None):
+    """Stream the non-blank data rows of a CSV (skipping the header), split
+    into stripped fields.
+
+    Args:
+        path (str): The CSV.
+        report (LoadReport, optional): Counts the rows.
+        start (int, optional): Byte offset of the first line to read (a line
+            boundary). Defaults to 0, the header.
+        end (int, optional): Byte offset to stop at. Defaults to the end.
+    Yields:
+        tuple[int, list[str]]: The line number (counted from start) and
+            fields of each row.
+    """
+    with _open_lines(path, start, end) as (first_line, lines):
+        for line_num, line in enumerate(lines, first_line):
+            line = line.strip()
+            if line:
+                if report is not None:
+                    report.rows += 1
+                yield line_num, split_row(line)
+
+
+class _open_lines:
+    """Context manager giving the line number of the first line and an
+    iterator over the lines of a byte range of a file (the whole file after
+    its header by default)."""
+
+    def __init__(self, path: str, start: int = 0, end: int = None):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    def __enter__(self):
+        if self.start == 0 and self.end is None:
+            self._file = open(self.path, 'r')
+            next(self._file, None)
+            return 2, self._file
+        with open(self.path, 'rb') as f:
+            f.seek(self.start)
+            data = f.read() if self.end is None else f.read(self.end - self.start)
+        self._file = None
+        lines = data.decode().splitlines()
+        if self.start == 0:
+            return 2, lines[1:]
+        return 1, lines
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            self._file.close()
+
+
+def load_rows(path: str, build, report: LoadReport = None, workers: int = 0) -> dict:
+    """Load a CSV into a dict of built rows, keyed by their first field (the
+    barcode).
+
+    Args:
+        path (str): The CSV.
+        build (Callable): A row builder (build_product, build_member,
+            build_coupon).
+        report (LoadReport, optional): Filled in with row counts and the
+            malformed rows.
+        workers (int, optional): Parse the file in this many processes.
+            Building the objects is CPU-bound, so this only pays off for
+            files of millions of rows on several cores. Defaults to 0 (in
+            this process).
+    Returns:
+        dict: The built rows by barcode, in file order (later rows win).
+    """
+    if report is None:
+        report = LoadReport()
+    if workers > 1:
+        chunks = [(path, build, start, end) for start, end in line_aligned_chunks(path, workers)]
+        rows = {}
+        line_offset = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_rows, chunk_report, lines in executor.map(_load_chunk, chunks):
+                rows.update(chunk_rows)
+                report.merge(chunk_report, line_offset)
+                line_offset += lines
+        return rows
+    return _load(path, build, report, 0, None)[0]
+
+
+def _load(path: str, build, report: LoadReport, start: int, end: int) -> tuple[dict, int]:
+    """Build the rows of a byte range of a CSV.
+
+    Returns:
+        tuple[dict, int]: The built rows by barcode, and the number of lines
+            read.
+    """
+    rows = {}
+    dates = {}
+    strip = str.strip
+    line_num = 0
+    with _open_lines(path, start, end) as (first_line, lines):
+        for line_num, line in enumerate(lines, first_line):
+            line = line.strip()
+            if not line:
+                continue
+            report.rows += 1
+            parts = list(map(strip, line.split(',')))
+            try:
+                rows[parts[0]] = build(parts, dates)
+            except MalformedRow as error:
+                report.record(str(error), line_num)
+            except ValueError:
+                report.record("invalid number", line_num)
+    return rows, line_num
+
+
+def _load_chunk(chunk: tuple) -> tuple[dict, LoadReport, int]:
+    """Load one byte range of a CSV (run in a worker process).
+
+    Returns:
+        tuple: The built rows, their report and the number of lines in the
+            range.
+    """
+    path, build, start, end = chunk
+    report = LoadReport()
+    rows, lines = _load(path, build, report, start, end)
+    return rows, report, lines
+
+
+def warn_malformed(path: str, report: LoadReport):
+    """Print one warning for the malformed rows of a load, if any."""
+    if report.malformed:
+        print(f"WARNING: {os.path.basename(path)}: {report}")
+
+
+def csvload_doctests():
+    """Function to run the doctests for the CSV loader.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'memberships.csv')
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write('barcode,name,tier,points\\n'
+    ...                 '257274767454, Jane Doe ,Silver,1200\\n'
+    ...                 '\\n'
+    ...                 '251111111110,John Smith,Bronze,10\\n'
+    ...                 '250000000000,Broken\\n'
+    ...                 '251234567890,Ana Lopez,Gold,lots\\n'
+    ...                 '259999999990,Wei Chen,Platinum,50\\n')
+    >>> report = LoadReport()
+    >>> members = load_rows(path, build_member, report=report)
+    >>> [(member.get_name(), member.return_membership_type()) for member in members.values()]
+    [('Jane Doe', 'Silver'), ('Wei Chen', 'Platinum')]
+    >>> report
+    LoadReport(rows=5, loaded=2, malformed={'unknown tier': 1, 'wrong number of fields': 1, 'invalid number': 1})
+    >>> print(report)
+    2 of 5 rows loaded; skipped 1 unknown tier (lines 4), 1 wrong number of fields (lines 5), 1 invalid number (lines 6)
+    >>> parallel_report = LoadReport()
+    >>> list(load_rows(path, build_member, report=parallel_report, workers=2)) == list(members)
+    True
+    >>> str(parallel_report) == str(report)
+    True
+    >>> dates = {}
+    >>> coupons = [build_coupon(['149234073227', '2030-01-31', kind, '10', '0', 'test'], dates)
+    ...            for kind in ('percent', 'fixed')]
+    >>> [type(coupon).__name__ for coupon in coupons], list(dates)
+    (['PercentDiscountCoupon', 'FixedDiscountCoupon'], ['2030-01-31'])
+    >>> coupons[0].get_expiration_date() is coupons[1].get_expiration_date()
+    True
+    >>> build_coupon(['149234073227', '2030-02-31', 'fixed', '10', '0', 'test'])
+    Traceback (most recent call last):
+    ...
+    csvload.MalformedRow: invalid date
+    """
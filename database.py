@@ -1,24 +1,81 @@
 from product import Product
 from member import Member, SilverMember, GoldMember, PlatinumMember
-from coupon import Coupon, PercentDiscountCoupon, FixedDiscountCoupon
-from datetime import datetime
+from coupon import Coupon, current_day
+from journal import Journal, JournaledSnapshot, write_snapshot, merge_deltas, keep_on_failure
+from csvload import (LoadReport, load_rows, iter_rows, split_row, warn_malformed,
+                     build_product, build_member, build_coupon)
+from inventory_snapshot import InventorySnapshot, write_inventory_snapshot
+from money import to_cents, to_cents_array
+from array import array
+from collections import OrderedDict
+from datetime import date
+import bisect
 import csv
+import mmap
+import os
+import struct
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; it speeds up the columnar index and bulk updates
+    np = None
 
 
 class ProductDatabase:
     SAVE_PATH = "db-data/updated_inventory.csv"
+    COMPACT_EVERY = 1000  # journal records between compactions
+
+    def __init__(self, inventory_path, workers: int = 0):
+        """
+        Args:
+            inventory_path (str): The inventory CSV.
+            workers (int, optional): Parse the CSV in this many processes
+                (see csvload.load_rows). Defaults to 0.
+        """
+        self.workers = workers
+        self.load_report = LoadReport()
+        self._load(inventory_path)
+        warn_malformed(inventory_path, self.load_report)
 
-    def __init__(self, inventory_path):
-        self.products = {}
-        with open(inventory_path, 'r') as f:
-            lines = f.readlines()
-            for line in lines[1:]:
-                line = line.strip()
-                if line:
-                    parts = [x.strip() for x in line.split(',')]
-                    barcode, name, price, quantity = parts
-                    product = Product(barcode, name, float(price), int(quantity))
-                    self.products[barcode] = product
+        # Quantity changes since inventory_path was written, so a reload
+        # of a newer version of the file keeps them (see apply_diff)
+        self._since_load = {}
+        # Replay the journal of deltas saved since the snapshot was written
+        source = Journal(inventory_path)
+        for deltas in source.replay():
+            for barcode, delta in deltas.items():
+                product = self.get_product(barcode)
+                if product is not None:
+                    product.decrease_quantity(-delta)
+                    self._since_load[barcode] = self._since_load.get(barcode, 0) + delta
+        # While the rows are still those of this file, a save that can't
+        # append copies it instead of writing every row (see prepare_save)
+        self._source = (inventory_path, source.snapshot_id())
+        self._deltas = {}
+        self._failed = []  # deltas of saves that failed, for the next save
+        self._rows_changed = False  # by apply_diff, since the last full save
+        self._save_file = None
+        if os.path.abspath(inventory_path) == os.path.abspath(self.SAVE_PATH):
+            self._saved().open()
+
+    def _load(self, inventory_path: str):
+        self.products = load_rows(inventory_path, build_product, report=self.load_report,
+                                  workers=self.workers)
+
+    def _saved(self) -> JournaledSnapshot:
+        """The snapshot and journal at SAVE_PATH."""
+        save_file = self._save_file
+        if save_file is None or save_file.snapshot_path != self.SAVE_PATH:
+            save_file = self._save_file = JournaledSnapshot(
+                self.SAVE_PATH, self._read_rows, self._fold_row, self._write_rows, self.COMPACT_EVERY)
+        return save_file
+
+    def _can_rebase(self) -> bool:
+        """Check whether the loaded file plus _since_load is still the
+        state in memory."""
+        path, snapshot_id = self._source
+        return snapshot_id is not None and Journal(path).snapshot_id() == snapshot_id
 
     def get_product(self, numeric_barcode: str) -> Product:
         """Given a barcode, return the Product object associated with that\
@@ -32,6 +89,17 @@ class ProductDatabase:
         return self.products.get(numeric_barcode)
         pass
 
+    def get_products(self, numeric_barcodes) -> dict:
+        """Look up many barcodes at once.
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            dict: The Product of each barcode found, by barcode.
+        """
+        products = self.products
+        return {barcode: products[barcode] for barcode in numeric_barcodes if barcode in products}
+
     def decrement_inventory(self, numeric_barcode: str, quantity: int):
         """Given a barcode and a quantity to decrease by, decrement the inventory of the product associated with that barcode by the quantity.
 
@@ -41,48 +109,463 @@ class ProductDatabase:
         """
         product = self.get_product(numeric_barcode)
         if product is not None:
+            before = product.get_quantity()
             product.decrease_quantity(quantity)
+            delta = product.get_quantity() - before
+            if delta:
+                self._deltas[numeric_barcode] = self._deltas.get(numeric_barcode, 0) + delta
+                self._since_load[numeric_barcode] = self._since_load.get(numeric_barcode, 0) + delta
         else:
             pass
 
+    def diff_rows(self, products: dict) -> tuple[list, list, list]:
+        """Compare the products of a new version of the inventory file with
+        the loaded ones. Quantities are compared without the changes made
+        since the load (sales).
+
+        Args:
+            products (dict): Products by barcode, from csvload.load_rows.
+        Returns:
+            tuple[list, list, list]: The new products, the changed products
+                (new versions), and the barcodes no longer in the file.
+        """
+        added = []
+        changed = []
+        since_load = self._since_load
+        for barcode, new in products.items():
+            product = self.products.get(barcode)
+            if product is None:
+                added.append(new)
+            elif (new.name != product.name or new.price != product.price
+                    or new.quantity != product.quantity - since_load.get(barcode, 0)):
+                changed.append(new)
+        removed = [barcode for barcode in self.products if barcode not in products]
+        return added, changed, removed
+
+    def apply_diff(self, added: list, changed: list, removed: list):
+        """Apply a diff_rows result in place. Changed products keep their
+        objects (carts referring to them see the new name, but charge the
+        price they were scanned at, see cart.CartLine), and keep the
+        quantity changes made since the load. Removed products can't be
+        found any more, but carts holding them are unaffected.
+
+        Args:
+            added (list[Product]): New products.
+            changed (list[Product]): New versions of loaded products.
+            removed (list[str]): Barcodes to remove.
+        """
+        products = self.products
+        for new in added:
+            products[new.get_barcode()] = new
+        for new in changed:
+            barcode = new.get_barcode()
+            product = products[barcode]
+            product.name = new.name
+            product.price = new.price
+            product.quantity = max(0, new.quantity + self._since_load.get(barcode, 0))
+        for barcode in removed:
+            del products[barcode]
+        if added or changed or removed:
+            # Journal records only carry quantities: save a full snapshot
+            # next, and never a copy of the loaded file
+            self._rows_changed = True
+            self._source = (self._source[0], None)
+
+    def decrement_many(self, barcodes, quantities):
+        """Decrement the inventory of many products at once.
+
+        Args:
+            barcodes (Iterable[str]): 12 digit numeric barcodes.
+            quantities (Iterable[int]): The quantity to decrease each by.
+        """
+        for barcode, quantity in zip(barcodes, quantities):
+            self.decrement_inventory(barcode, quantity)
+
     def save_inventory(self):
-        """Save the inventory to a CSV file"""
-        with open(self.SAVE_PATH, 'w') as f:
-            f.write("barcode,name,price,quantity\n")
-            for product in self.products.values():
-                f.write(f"{product.get_barcode()},{product.get_name()},{product.get_price()},{product.get_quantity()}\n")
+        """Save the inventory to a CSV file.
+
+        Only the quantity changes since the last save are appended to the
+        journal of SAVE_PATH, so the cost is proportional to the changes,
+        not to the catalog. Every COMPACT_EVERY records, a background thread
+        folds the journal into a new snapshot (see compact). The first save
+        of a database copies the file it was loaded from, journaled with the
+        changes since; every row is only written after a reload changed
+        them (see apply_diff).
+        """
+        self.prepare_save()()
+
+    def prepare_save(self):
+        """Capture the state save_inventory would write, without writing it,
+        so the write can happen later or on another thread. The jobs must
+        run in the order they were prepared.
+
+        Returns:
+            Callable[[], None]: Writes the captured state.
+        """
+        deltas = self._take_deltas()
+        save_file = self._saved()
+        if not self._rows_changed and save_file.is_current():
+            if not deltas:
+                return lambda: None
+            return keep_on_failure(lambda: save_file.append(deltas), deltas, self._failed)
+        # The copy's journal record or the rows already include the deltas;
+        # they are only handed back if the write fails
+        if self._can_rebase():
+            source_path = self._source[0]
+            since_load = dict(self._since_load)
+            write = lambda: save_file.rebase(source_path, since_load)
+        else:
+            rows = self._snapshot_rows()
+            write = lambda: save_file.write(rows)
+        self._rows_changed = False
+        return keep_on_failure(write, deltas, self._failed)
+
+    def _take_deltas(self) -> dict:
+        """Swap out the pending deltas, with those of failed saves."""
+        deltas, self._deltas = self._deltas, {}
+        while self._failed:
+            merge_deltas(deltas, self._failed.pop())
+        return deltas
+
+    def compact(self):
+        """Save, then fold the journal of SAVE_PATH into a new snapshot now
+        instead of in the background."""
+        self.save_inventory()
+        save_file = self._saved()
+        save_file.wait()
+        save_file.compact()
+
+    def _snapshot_rows(self) -> list[list]:
+        return [[product.get_barcode(), product.get_name(), product.get_price(), product.get_quantity()]
+                for product in self.products.values()]
+
+    @staticmethod
+    def _read_rows(path: str):
+        return (fields for _, fields in iter_rows(path))
+
+    @staticmethod
+    def _fold_row(row: list, delta: int) -> list:
+        barcode, name, price, quantity = row
+        return [barcode, name, price, max(0, int(quantity) + delta)]
+
+    @staticmethod
+    def _write_rows(path: str, rows):
+        write_snapshot(path, ["barcode", "name", "price", "quantity"], rows)
+
+class ProductView:
+    """A product of a ColumnarProductDatabase: a row number with the Product
+    API on top of the database's columns."""
+    __slots__ = ('_database', '_row')
+
+    def __init__(self, database, row: int):
+        self._database = database
+        self._row = row
+
+    def decrease_quantity(self, quantity: int):
+        quantities = self._database._quantities
+        quantities[self._row] = max(0, quantities[self._row] - quantity)
+
+    def is_in_stock(self) -> bool:
+        return self._database._quantities[self._row] > 0
+
+    def get_barcode(self) -> str:
+        return f"{self._database._codes[self._row]:012d}"
+
+    def get_name(self) -> str:
+        database = self._database
+        offsets = database._name_offsets
+        return str(database._names[offsets[self._row]:offsets[self._row + 1]], 'utf-8')
+
+    def get_price(self) -> float:
+        return self._database._prices[self._row]
+
+    def get_quantity(self) -> int:
+        return self._database._quantities[self._row]
+
+    def get_unit_price(self) -> float:
+        return self._database._prices[self._row]
+
+    def get_unit_price_cents(self) -> int:
+        return to_cents(self._database._prices[self._row])
+
+    def __eq__(self, other):
+        return (isinstance(other, ProductView) and other._database is self._database
+                and other._row == self._row)
+
+    def __hash__(self):
+        return hash((id(self._database), self._row))
+
+    def __repr__(self):
+        return f"ProductView({self.get_barcode()!r}, {self.get_name()!r})"
+
+
+class ColumnarProductDatabase(ProductDatabase):
+    """A ProductDatabase that keeps the catalog in columns instead of one
+    Product object per SKU: barcodes, prices and quantities in typed arrays,
+    names packed into one bytes string, and a sorted barcode index searched
+    with bisect. get_product returns a ProductView of a row.
+
+    For a 1M SKU catalog this takes about a tenth of the memory of
+    ProductDatabase, and quantities and prices can be updated or summed
+    with NumPy (see quantity_array and price_array). Barcodes must be 12
+    digits.
+    """
+
+    def _load(self, inventory_path: str):
+        codes = array('q')
+        prices = array('d')
+        quantities = array('i')
+        names = bytearray()
+        name_offsets = array('q', [0])
+        report = self.load_report
+        for line_num, parts in iter_rows(inventory_path, report):
+            if len(parts) != 4:
+                report.record("wrong number of fields", line_num)
+                continue
+            barcode, name, price, quantity = parts
+            if len(barcode) != 12 or not barcode.isdigit():
+                report.record("invalid barcode", line_num)
+                continue
+            try:
+                price, quantity = float(price), int(quantity)
+            except ValueError:
+                report.record("invalid number", line_num)
+                continue
+            codes.append(int(barcode))
+            prices.append(price)
+            quantities.append(quantity)
+            names += name.encode()
+            name_offsets.append(len(names))
+        self._codes = codes
+        self._prices = prices
+        self._quantities = quantities
+        self._names = bytes(names)
+        self._name_offsets = name_offsets
+
+        if np is not None:
+            code_column = np.frombuffer(codes, dtype=np.int64)
+            order = np.argsort(code_column, kind='stable')
+            self._sorted_rows = array('i', order.astype(np.int32).tobytes())
+            self._sorted_codes = array('q', code_column[order].tobytes())
+        else:
+            self._sorted_rows = array('i', sorted(range(len(codes)), key=codes.__getitem__))
+            self._sorted_codes = array('q', (codes[row] for row in self._sorted_rows))
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _find_row(self, numeric_barcode: str) -> int:
+        """Find the row of a barcode. If the barcode is on several rows, the
+        last one wins, as in load_rows (the index sort is stable, so that is
+        the last of the run of equal codes).
+
+        Returns:
+            int: The row (-1 if not found).
+        """
+        if len(numeric_barcode) != 12 or not numeric_barcode.isdigit():
+            return -1
+        code = int(numeric_barcode)
+        sorted_codes = self._sorted_codes
+        i = bisect.bisect_right(sorted_codes, code) - 1
+        if i >= 0 and sorted_codes[i] == code:
+            return self._sorted_rows[i]
+        return -1
+
+    def get_product(self, numeric_barcode: str) -> ProductView:
+        """Given a barcode, return a view of the product with that barcode.
+
+        Args:
+            numeric_barcode (str): 12 digit numeric barcode
+        Returns:
+            ProductView with barcode (None if not found)
+        """
+        row = self._find_row(numeric_barcode)
+        return ProductView(self, row) if row >= 0 else None
+
+    def get_products(self, numeric_barcodes) -> dict:
+        """Look up many barcodes at once.
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            dict: A ProductView of each barcode found, by barcode.
+        """
+        views = {}
+        for barcode in numeric_barcodes:
+            row = self._find_row(barcode)
+            if row >= 0:
+                views[barcode] = ProductView(self, row)
+        return views
+
+    def decrement_many(self, barcodes, quantities):
+        """Decrement the inventory of many products at once (vectorized
+        when NumPy is available). Unknown barcodes are ignored.
+
+        Args:
+            barcodes (Iterable[str]): 12 digit numeric barcodes.
+            quantities (Iterable[int]): The quantity to decrease each by.
+        """
+        if np is None:
+            return super().decrement_many(barcodes, quantities)
+        barcodes = list(barcodes)
+        rows = np.fromiter((self._find_row(barcode) for barcode in barcodes), dtype=np.int64,
+                           count=len(barcodes))
+        amounts = np.asarray(list(quantities), dtype=np.int32)
+        found = rows >= 0
+        rows, amounts = rows[found], amounts[found]
+        # Duplicate barcodes add up; clamp at 0 like Product.decrease_quantity
+        rows, inverse = np.unique(rows, return_inverse=True)
+        totals = np.zeros(len(rows), dtype=np.int32)
+        np.add.at(totals, inverse, amounts)
+        column = self.quantity_array()
+        before = column[rows]
+        after = np.maximum(before - totals, 0)
+        column[rows] = after
+        deltas = self._deltas
+        codes = self._codes
+        since_load = self._since_load
+        for row, delta in zip(rows.tolist(), (after - before).tolist()):
+            if delta:
+                barcode = f"{codes[row]:012d}"
+                deltas[barcode] = deltas.get(barcode, 0) + delta
+                since_load[barcode] = since_load.get(barcode, 0) + delta
+
+    def quantity_array(self):
+        """The quantity column as a NumPy array sharing its memory, for
+        vectorized updates. Use decrement_inventory or decrement_many for
+        changes that must be saved.
+
+        Returns:
+            numpy.ndarray: int32 quantities in file order.
+        """
+        return np.frombuffer(self._quantities, dtype=np.int32)
+
+    def price_array(self):
+        """The price column as a NumPy array sharing its memory.
+
+        Returns:
+            numpy.ndarray: float64 prices in file order.
+        """
+        return np.frombuffer(self._prices, dtype=np.float64)
+
+    def price_cents_array(self):
+        """The price column in cents (see money.py), for batch repricing
+        with integer arithmetic.
+
+        Returns:
+            numpy.ndarray or array.array: int64 cents in file order.
+        """
+        return to_cents_array(self._prices)
+
+    def _snapshot_rows(self) -> list[list]:
+        names, offsets = self._names, self._name_offsets
+        return [[f"{code:012d}", str(names[offsets[row]:offsets[row + 1]], 'utf-8'), price, quantity]
+                for row, (code, price, quantity)
+                in enumerate(zip(self._codes, self._prices, self._quantities))]
+
+
+class MappedProductDatabase(ColumnarProductDatabase):
+    """A ColumnarProductDatabase opened from a binary inventory snapshot
+    (see inventory_snapshot.py) instead of a CSV. The columns are read in
+    place from a memory mapping, so opening takes milliseconds whatever the
+    size of the catalog. Quantity changes are kept in memory and saved like
+    any ProductDatabase: to a journal, compacting into a new snapshot at
+    SAVE_PATH.
+    """
+    SAVE_PATH = "db-data/updated_inventory.bin"
+
+    def _load(self, inventory_path: str):
+        snapshot = self._snapshot = InventorySnapshot(inventory_path)
+        self._codes = snapshot.codes
+        self._prices = snapshot.prices
+        self._quantities = snapshot.quantities
+        self._names = snapshot.names
+        self._name_offsets = snapshot.name_offsets
+        # Snapshots are sorted by barcode, so the rows are their own index
+        self._sorted_codes = snapshot.codes
+        self._sorted_rows = range(snapshot.count)
+
+    @classmethod
+    def build(cls, inventory_path: str, snapshot_path: str) -> int:
+        """Build a snapshot from an inventory CSV (and its journal).
+
+        Args:
+            inventory_path (str): The inventory CSV.
+            snapshot_path (str): The snapshot to create.
+        Returns:
+            int: The number of products written.
+        """
+        return write_inventory_snapshot(snapshot_path, ColumnarProductDatabase(inventory_path)._snapshot_rows())
+
+    @staticmethod
+    def _read_rows(path: str):
+        with InventorySnapshot(path) as snapshot:
+            names, offsets = snapshot.names, snapshot.name_offsets
+            for row, (code, price, quantity) in enumerate(zip(snapshot.codes, snapshot.prices,
+                                                              snapshot.quantities)):
+                yield [f"{code:012d}", str(names[offsets[row]:offsets[row + 1]], 'utf-8'), price, quantity]
+
+    @staticmethod
+    def _write_rows(path: str, rows):
+        write_inventory_snapshot(path, rows)
+
+    def close(self):
+        """Release the memory mapping. Products from this database can't be
+        used afterwards."""
+        self._snapshot.close()
+
 
 class MemberDatabase:
     SAVE_PATH = "db-data/updated_memberships.csv"
+    COMPACT_EVERY = 1000  # journal records between compactions
+
+    def __init__(self, membership_path: str, workers: int = 0):
+        """
+        Args:
+            membership_path (str): The memberships CSV.
+            workers (int, optional): Parse the CSV in this many processes
+                (see csvload.load_rows). Defaults to 0.
+        """
+        self.workers = workers
+        self.load_report = LoadReport()
+        self._since_load = {}  # points changes since membership_path was written
+        self._load(membership_path)
+        warn_malformed(membership_path, self.load_report)
 
-    def __init__(self, membership_path: str):
-        self.memberships = {}
-        with open(membership_path, 'r') as f:
-            lines = f.readlines()
-            for line_num, line in enumerate(lines[1:], start=2):
-                line = line.strip()
-                if line:
-                    parts = [x.strip() for x in line.split(',')]
-                    if len(parts) != 4:
-                        print(f"WARNING: Skipping malformed line {line_num}: {line}")
-                        continue
-
-                    barcode, name, tier, points = parts
-                    points = float(points)  # Use float
-
-                    if tier == 'Silver':
-                        member = SilverMember(barcode, name, points)
-                    elif tier == 'Gold':
-                        member = GoldMember(barcode, name, points)
-                    elif tier == 'Platinum':
-                        member = PlatinumMember(barcode, name, points)
-                    elif tier == 'Member':
-                        member = Member(barcode, name, points)
-                    else:
-                        print(f"WARNING: Unknown tier '{tier}' on line {line_num} for barcode {barcode}. Skipping.")
-                        continue
-
-                    self.memberships[barcode] = member
+        # Replay the journal of deltas saved since the snapshot was written
+        source = Journal(membership_path)
+        for deltas in source.replay():
+            self._replay(deltas)
+        self._source = (membership_path, source.snapshot_id())  # see ProductDatabase
+        self._deltas = {}
+        self._failed = []  # deltas of saves that failed, for the next save
+        self._save_file = None
+        if os.path.abspath(membership_path) == os.path.abspath(self.SAVE_PATH):
+            self._saved().open()
+
+    def _load(self, membership_path: str):
+        self.memberships = load_rows(membership_path, build_member, report=self.load_report,
+                                     workers=self.workers)
+
+    def _replay(self, deltas: dict):
+        """Apply a journal record of saved points changes."""
+        for barcode, delta in deltas.items():
+            member = self.memberships.get(barcode)
+            if member is not None:
+                member.add_points(delta)
+                self._since_load[barcode] = self._since_load.get(barcode, 0) + delta
+
+    def _saved(self) -> JournaledSnapshot:
+        """The snapshot and journal at SAVE_PATH."""
+        save_file = self._save_file
+        if save_file is None or save_file.snapshot_path != self.SAVE_PATH:
+            save_file = self._save_file = JournaledSnapshot(
+                self.SAVE_PATH, self._read_rows, self._fold_row, self._write_rows, self.COMPACT_EVERY)
+        return save_file
+
+    def _can_rebase(self) -> bool:
+        path, snapshot_id = self._source
+        return snapshot_id is not None and Journal(path).snapshot_id() == snapshot_id
 
     def save_inventory(self):
         """Save the inventory to a CSV file"""
@@ -111,6 +594,17 @@ class MemberDatabase:
         """
         return self.memberships.get(numeric_barcode)
 
+    def get_members(self, numeric_barcodes) -> dict:
+        """Look up many barcodes at once.
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            dict: The Member of each barcode found, by barcode.
+        """
+        memberships = self.memberships
+        return {barcode: memberships[barcode] for barcode in numeric_barcodes if barcode in memberships}
+
     def add_points(self, numeric_barcode: str, points: int):
         """Given a barcode, add the specified number of points to the member associated with that barcode.
 
@@ -121,55 +615,463 @@ class MemberDatabase:
         member = self.get_member(numeric_barcode)
         if member:
             member.add_points(points)
+            self._deltas[numeric_barcode] = self._deltas.get(numeric_barcode, 0) + points
+            self._since_load[numeric_barcode] = self._since_load.get(numeric_barcode, 0) + points
         pass
 
     def save_memberships(self):
-        with open(self.SAVE_PATH, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(["barcode", "name", "tier", "points"])
-            for member in self.memberships.values():
-                if isinstance(member, SilverMember):
-                    tier = 'Silver'
-                elif isinstance(member, GoldMember):
-                    tier = 'Gold'
-                elif isinstance(member, PlatinumMember):
-                    tier = 'Platinum'
-                else:
-                    tier = 'Member'
-                writer.writerow([
-                    member.get_barcode(),
-                    member.get_name(),
-                    tier,       
-                    member.get_points()
-                ])
+        """Save the memberships to a CSV file.
+
+        As in ProductDatabase.save_inventory, only the points changes since
+        the last save are appended to the journal of SAVE_PATH, folded into
+        a new snapshot in the background every COMPACT_EVERY records. The
+        first save copies the file the database was loaded from.
+        """
+        self.prepare_save()()
+
+    def prepare_save(self):
+        """Capture the state save_memberships would write, without writing
+        it (see ProductDatabase.prepare_save).
+
+        Returns:
+            Callable[[], None]: Writes the captured state.
+        """
+        deltas = self._take_deltas()
+        save_file = self._saved()
+        if save_file.is_current():
+            if not deltas:
+                return lambda: None
+            return keep_on_failure(lambda: save_file.append(deltas), deltas, self._failed)
+        if self._can_rebase():
+            source_path = self._source[0]
+            since_load = dict(self._since_load)
+            write = lambda: save_file.rebase(source_path, since_load)
+        else:
+            rows = self._snapshot_rows()
+            write = lambda: save_file.write(rows)
+        return keep_on_failure(write, deltas, self._failed)
+
+    def _take_deltas(self) -> dict:
+        """Swap out the pending deltas (see ProductDatabase._take_deltas)."""
+        deltas, self._deltas = self._deltas, {}
+        while self._failed:
+            merge_deltas(deltas, self._failed.pop())
+        return deltas
+
+    def compact(self):
+        """Save, then fold the journal of SAVE_PATH into a new snapshot now
+        instead of in the background."""
+        self.save_memberships()
+        save_file = self._saved()
+        save_file.wait()
+        save_file.compact()
+
+    def _snapshot_rows(self) -> list[list]:
+        return [self._member_row(member) for member in self.memberships.values()]
+
+    @staticmethod
+    def _member_row(member: Member) -> list:
+        if isinstance(member, SilverMember):
+            tier = 'Silver'
+        elif isinstance(member, GoldMember):
+            tier = 'Gold'
+        elif isinstance(member, PlatinumMember):
+            tier = 'Platinum'
+        else:
+            tier = 'Member'
+        return [
+            member.get_barcode(),
+            member.get_name(),
+            tier,
+            member.get_points()
+        ]
+
+    @staticmethod
+    def _read_rows(path: str):
+        return (fields for _, fields in iter_rows(path))
+
+    @staticmethod
+    def _fold_row(row: list, delta: int) -> list:
+        barcode, name, tier, points = row
+        return [barcode, name, tier, float(points) + delta]
+
+    @staticmethod
+    def _write_rows(path: str, rows):
+        write_snapshot(path, ["barcode", "name", "tier", "points"], rows)
+
+class LazyMemberDatabase(MemberDatabase):
+    """A MemberDatabase that only reads the members it is asked for.
+
+    Startup loads a barcode -> byte offset index of the memberships file
+    (memory-mapped from ``<file>.idx``, which is rebuilt when the file
+    changes), and get_member reads and parses a single line. Members are
+    kept in a bounded LRU cache; points changes are also kept per barcode,
+    so an evicted member comes back with the right points. Memory scales
+    with the members seen, not with the loyalty program. Barcodes must be
+    12 digits.
+    """
+    INDEX_MAGIC = b'MIDX'
+    INDEX_VERSION = 2  # 2: one entry per barcode
+    INDEX_HEADER = struct.Struct('<4sHHQQQ')  # magic, version, reserved, count, file size, mtime
+
+    def __init__(self, membership_path: str, cache_size: int = 1024):
+        """
+        Args:
+            membership_path (str): The memberships CSV.
+            cache_size (int, optional): The most members kept in memory.
+                Defaults to 1024.
+        """
+        self.cache_size = cache_size
+        super().__init__(membership_path)
+
+    def _load(self, membership_path: str):
+        self._cache = OrderedDict()
+        self._file = open(membership_path, 'rb')
+        self._codes, self._offsets = self._open_index(membership_path)
+
+    def _open_index(self, membership_path: str):
+        """Map the index of the memberships file, building it first if it
+        is missing or stale.
+
+        Returns:
+            tuple: Sorted barcodes and their line offsets, as memoryviews.
+        """
+        stat = os.fstat(self._file.fileno())
+        shared_path = index_path = membership_path + '.idx'
+        for attempt in range(2):
+            try:
+                with open(index_path, 'rb') as f:
+                    index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                index = None
+            if index is not None:
+                header = self.INDEX_HEADER
+                magic, version, _, count, size, mtime = header.unpack_from(index)
+                if (magic, version, size, mtime) == (self.INDEX_MAGIC, self.INDEX_VERSION,
+                                                     stat.st_size, stat.st_mtime_ns):
+                    if index_path != shared_path:
+                        # A private index in the temporary folder: the
+                        # mapping outlives the file
+                        os.unlink(index_path)
+                    self._index = index
+                    view = memoryview(index)
+                    start = header.size
+                    return (view[start:start + 8 * count].cast('q'),
+                            view[start + 8 * count:start + 16 * count].cast('q'))
+                index.close()
+            if attempt == 0:
+                index_path = self._build_index(index_path, stat)
+        if index_path != shared_path:
+            os.unlink(index_path)
+        raise ValueError(f"can't index {membership_path}")
+
+    def _build_index(self, index_path: str, stat) -> str:
+        """Write the index of the memberships file.
+
+        Returns:
+            str: Where the index was written (a temporary file if the
+                folder isn't writable, removed by _open_index once mapped).
+        """
+        codes = array('q')
+        offsets = array('q')
+        f = self._file
+        f.seek(0)
+        offset = len(f.readline())
+        for line in f:
+            barcode = line.split(b',', 1)[0].strip()
+            if len(barcode) == 12 and barcode.isdigit():
+                codes.append(int(barcode))
+                offsets.append(offset)
+            offset += len(line)
+        # The sort is stable: of the rows of a duplicated barcode, keep the
+        # last one, which is the one load_rows (and MemberDatabase) keeps
+        order = sorted(range(len(codes)), key=codes.__getitem__)
+        order = [i for i, j in zip(order, order[1:] + [None]) if j is None or codes[j] != codes[i]]
+        codes = array('q', (codes[i] for i in order))
+        offsets = array('q', (offsets[i] for i in order))
+
+        data = (self.INDEX_HEADER.pack(self.INDEX_MAGIC, self.INDEX_VERSION, 0, len(codes),
+                                       stat.st_size, stat.st_mtime_ns)
+                + codes.tobytes() + offsets.tobytes())
+        try:
+            temp_path = index_path + '.tmp'
+            with open(temp_path, 'wb') as out:
+                out.write(data)
+            os.replace(temp_path, index_path)
+        except OSError:
+            with tempfile.NamedTemporaryFile(suffix='.idx', delete=False) as out:
+                out.write(data)
+            index_path = out.name
+        return index_path
+
+    def __len__(self):
+        return len(self._codes)
+
+    def get_member(self, numeric_barcode: str) -> Member:
+        """Given a barcode, return the Member object associated with that
+        barcode, reading it from the file if it isn't cached.
+
+        Args:
+            numeric_barcode (str): 12 digit numeric barcode
+        Returns:
+            Member with barcode (None if not found)
+        """
+        cache = self._cache
+        member = cache.get(numeric_barcode)
+        if member is not None:
+            cache.move_to_end(numeric_barcode)
+            return member
+        if len(numeric_barcode) != 12 or not numeric_barcode.isdigit():
+            return None
+        code = int(numeric_barcode)
+        codes = self._codes
+        i = bisect.bisect_left(codes, code)
+        if i == len(codes) or codes[i] != code:
+            return None
+        self._file.seek(self._offsets[i])
+        try:
+            member = build_member(split_row(self._file.readline().decode().strip()))
+        except ValueError:
+            return None
+        member.add_points(self._since_load.get(numeric_barcode, 0))
+        cache[numeric_barcode] = member
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return member
+
+    def get_members(self, numeric_barcodes) -> dict:
+        """Look up many barcodes at once. The rows that aren't cached are
+        read in one forward pass over the file, in file order (seeks within
+        the read buffer don't touch the disk).
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            dict: The Member of each barcode found, by barcode.
+        """
+        cache = self._cache
+        codes, offsets = self._codes, self._offsets
+        members = {}
+        missing = []  # (offset, barcode) of the rows to read
+        for barcode in dict.fromkeys(numeric_barcodes):
+            member = cache.get(barcode)
+            if member is not None:
+                cache.move_to_end(barcode)
+                members[barcode] = member
+            elif len(barcode) == 12 and barcode.isdigit():
+                code = int(barcode)
+                i = bisect.bisect_left(codes, code)
+                if i < len(codes) and codes[i] == code:
+                    missing.append((offsets[i], barcode))
+        missing.sort()
+        f = self._file
+        since_load = self._since_load
+        for offset, barcode in missing:
+            f.seek(offset)
+            try:
+                member = build_member(split_row(f.readline().decode().strip()))
+            except ValueError:
+                continue
+            member.add_points(since_load.get(barcode, 0))
+            cache[barcode] = members[barcode] = member
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return members
+
+    def _replay(self, deltas: dict):
+        # Applied to members as they are read (see get_member)
+        merge_deltas(self._since_load, deltas)
+
+    def _snapshot_rows(self) -> list[list]:
+        # A full save reads the whole file (from the handle opened at
+        # startup, so offsets stay valid after the file is replaced)
+        rows = []
+        f = self._file
+        f.seek(0)
+        f.readline()
+        for line in f:
+            line = line.decode().strip()
+            if line:
+                try:
+                    member = build_member(split_row(line))
+                except ValueError:
+                    continue
+                member.add_points(self._since_load.get(member.get_barcode(), 0))
+                rows.append(self._member_row(member))
+        return rows
+
+    def close(self):
+        """Close the memberships file and release the index."""
+        self._file.close()
+        self._codes.release()
+        self._offsets.release()
+        self._index.close()
+
 
 class CouponDatabase:
 
-    def __init__(self, coupon_path):
-        self.coupons = {}
-        with open(coupon_path, 'r') as f:
-            lines = f.readlines()
-            for line in lines[1:]:
-                line = line.strip()
-                if line:
-                    parts = [x.strip() for x in line.split(',')]
-                    barcode, expiration, discount_type, discount_value, min_purchase, description = parts
-                    expiration = datetime.strptime(expiration, '%Y-%m-%d')
-                    discount_value = float(discount_value)
-                    min_purchase = float(min_purchase)
-                    if discount_type == 'percent':
-                        coupon = PercentDiscountCoupon(barcode, expiration, min_purchase, description, discount_value)
-                    elif discount_type == 'fixed':
-                        coupon = FixedDiscountCoupon(barcode, expiration, min_purchase, description, discount_value)
-                    self.coupons[barcode] = coupon
+    def __init__(self, coupon_path, workers: int = 0):
+        """
+        Args:
+            coupon_path (str): The coupons CSV.
+            workers (int, optional): Parse the CSV in this many processes
+                (see csvload.load_rows). Defaults to 0.
+        """
+        self.load_report = LoadReport()
+        self.coupons = load_rows(coupon_path, build_coupon, report=self.load_report, workers=workers)
+        warn_malformed(coupon_path, self.load_report)
+        # Expiration index: coupons by barcode in buckets by expiration day,
+        # and the days in order, so a day's cohort goes in one step
+        self._buckets = {}
+        for coupon in self.coupons.values():
+            self._buckets.setdefault(coupon.get_expiration_date().date(), {})[coupon.get_barcode()] = coupon
+        self._days = sorted(self._buckets)
+        self._purged_before = None  # the coupons expiring before are dropped, even on reload
 
-        pass
+    def _index(self, coupon: Coupon):
+        day = coupon.get_expiration_date().date()
+        bucket = self._buckets.get(day)
+        if bucket is None:
+            bucket = self._buckets[day] = {}
+            bisect.insort(self._days, day)
+        bucket[coupon.get_barcode()] = coupon
+
+    def _unindex(self, coupon: Coupon):
+        day = coupon.get_expiration_date().date()
+        bucket = self._buckets[day]
+        del bucket[coupon.get_barcode()]
+        if not bucket:
+            del self._buckets[day]
+            del self._days[bisect.bisect_left(self._days, day)]
+
+    def today(self) -> date:
+        """Today's date, the day boundary the coupons use (see
+        coupon.current_day).
+
+        Returns:
+            date: The current day.
+        """
+        return current_day()
 
     def get_coupon(self, numeric_barcode: str) -> Coupon:
         """Given a barcode, return the Coupon object associated with that barcode."""
         return self.coupons.get(numeric_barcode)
         pass
 
+    def get_valid_coupon(self, numeric_barcode: str, day: date = None) -> Coupon:
+        """Given a barcode, return its coupon if it is valid on a day.
+        Coupons are valid through their expiration day.
+
+        Args:
+            numeric_barcode (str): 12 digit numeric barcode
+            day (date, optional): The day. Defaults to today.
+        Returns:
+            Coupon with barcode (None if not found or expired)
+        """
+        coupon = self.coupons.get(numeric_barcode)
+        if coupon is None or coupon.get_expiration_date().date() < (day or self.today()):
+            return None
+        return coupon
+
+    def valid_on(self, day: date = None):
+        """Iterate over the coupons valid on a day, by expiration day. The
+        first one is found by binary search over the expiration days.
+
+        Args:
+            day (date, optional): The day. Defaults to today.
+        Yields:
+            Coupon: The coupons expiring on or after day.
+        """
+        days = self._days
+        for i in range(bisect.bisect_left(days, day or self.today()), len(days)):
+            yield from self._buckets[days[i]].values()
+
+    def purge_expired(self, day: date = None) -> int:
+        """Drop every coupon that expired before a day, a whole expiration
+        day at a time. A reload (diff_rows) doesn't bring them back.
+
+        Args:
+            day (date, optional): The first day to keep. Defaults to today.
+        Returns:
+            int: The number of coupons dropped.
+        """
+        day = day or self.today()
+        if self._purged_before is None or day > self._purged_before:
+            self._purged_before = day
+        days = self._days
+        end = bisect.bisect_left(days, day)
+        coupons = self.coupons
+        purged = 0
+        for expired_day in days[:end]:
+            bucket = self._buckets.pop(expired_day)
+            for barcode in bucket:
+                del coupons[barcode]
+            purged += len(bucket)
+        del days[:end]
+        return purged
+
+    def get_coupons(self, numeric_barcodes) -> dict:
+        """Look up many barcodes at once.
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            dict: The Coupon of each barcode found, by barcode.
+        """
+        coupons = self.coupons
+        return {barcode: coupons[barcode] for barcode in numeric_barcodes if barcode in coupons}
+
+    def diff_rows(self, coupons: dict) -> tuple[list, list, list]:
+        """Compare the coupons of a new version of the coupons file with the
+        loaded ones. Coupons expiring before the last purge_expired day are
+        left out, as if they weren't in the file.
+
+        Args:
+            coupons (dict): Coupons by barcode, from csvload.load_rows.
+        Returns:
+            tuple[list, list, list]: The new coupons, the changed coupons
+                (new versions), and the barcodes no longer in the file.
+        """
+        purged_before = self._purged_before
+        if purged_before is not None:
+            coupons = {barcode: coupon for barcode, coupon in coupons.items()
+                       if coupon.get_expiration_date().date() >= purged_before}
+        added = []
+        changed = []
+        for barcode, new in coupons.items():
+            coupon = self.coupons.get(barcode)
+            if coupon is None:
+                added.append(new)
+            elif type(new) is not type(coupon) or vars(new) != vars(coupon):
+                changed.append(new)
+        removed = [barcode for barcode in self.coupons if barcode not in coupons]
+        return added, changed, removed
+
+    def apply_diff(self, added: list, changed: list, removed: list):
+        """Apply a diff_rows result in place. A changed coupon of the same
+        type keeps its object, so carts holding it get the new terms; one
+        whose type changed is replaced.
+
+        Args:
+            added (list[Coupon]): New coupons.
+            changed (list[Coupon]): New versions of loaded coupons.
+            removed (list[str]): Barcodes to remove.
+        """
+        coupons = self.coupons
+        for new in added:
+            coupons[new.get_barcode()] = new
+            self._index(new)
+        for new in changed:
+            coupon = coupons[new.get_barcode()]
+            self._unindex(coupon)
+            if type(new) is type(coupon):
+                coupon.update(new)
+            else:
+                coupon = coupons[new.get_barcode()] = new
+            self._index(coupon)
+        for barcode in removed:
+            self._unindex(coupons.pop(barcode))
+
 
 def product_database_doctests():
     """Function to run the doctests for the ProductDatabase class.
@@ -196,6 +1098,137 @@ def product_database_doctests():
     >>> milk3 = pdb3.get_product(milk_barcode)
     >>> milk3.get_quantity() == 140
     True
+    >>> pdb3.decrement_inventory(milk_barcode, 5)
+    >>> pdb3.save_inventory()
+    >>> pdb3._save_file.journal.records
+    2
+    >>> ProductDatabase('db-data/updated_inventory.csv').get_product(milk_barcode).get_quantity()
+    135
+    >>> pdb3.compact()
+    >>> pdb3._save_file.journal.records
+    0
+    >>> ProductDatabase('db-data/updated_inventory.csv').get_product(milk_barcode).get_quantity()
+    135
+
+    Every COMPACT_EVERY records, the journal is folded in the background:
+
+    >>> pdb3._save_file.compact_every = 2
+    >>> for _ in range(2):
+    ...     pdb3.decrement_inventory(milk_barcode, 1)
+    ...     pdb3.save_inventory()
+    >>> pdb3._save_file.wait()
+    >>> pdb3._save_file.journal.records
+    0
+    >>> ProductDatabase('db-data/updated_inventory.csv').get_product(milk_barcode).get_quantity()
+    133
+
+    Sales made while a prepared save is being written are kept for the
+    next save, and so are the changes of a save that failed:
+
+    >>> pdb = ProductDatabase('db-data/inventory.csv')
+    >>> job = pdb.prepare_save()
+    >>> pdb.decrement_inventory(milk_barcode, 5)
+    >>> job()
+    >>> pdb.save_inventory()
+    >>> ProductDatabase('db-data/updated_inventory.csv').get_product(milk_barcode).get_quantity()
+    145
+    >>> pdb.decrement_inventory(milk_barcode, 1)
+    >>> job = pdb.prepare_save()
+    >>> journal_path, pdb._save_file.journal.path = pdb._save_file.journal.path, 'db-data/missing/journal'
+    >>> job()
+    Traceback (most recent call last):
+    ...
+    FileNotFoundError: [Errno 2] No such file or directory: 'db-data/missing/journal.tmp'
+    >>> pdb._save_file.journal.path = journal_path
+    >>> pdb.save_inventory()
+    >>> ProductDatabase('db-data/updated_inventory.csv').get_product(milk_barcode).get_quantity()
+    144
+    """
+
+
+def columnar_product_database_doctests():
+    """Function to run the doctests for the ColumnarProductDatabase class.
+
+    Note that you should run this doctest at the root folder of the project
+    (same level as main.py)
+
+    >>> pdb = ColumnarProductDatabase('db-data/inventory.csv')
+    >>> milk_barcode = '012345678905'
+    >>> milk = pdb.get_product(milk_barcode)
+    >>> milk.get_name(), milk.get_price(), milk.get_quantity(), milk.get_barcode() == milk_barcode
+    ('Milk', 2.99, 150, True)
+    >>> pdb.get_product(milk_barcode) == milk
+    True
+    >>> pdb.get_product('000000000000') is None, pdb.get_product('') is None
+    (True, True)
+    >>> pdb.decrement_inventory(milk_barcode, 10)
+    >>> milk.get_quantity()
+    140
+    >>> len(pdb) == len(ProductDatabase('db-data/inventory.csv').products)
+    True
+    >>> apple_barcode = '012345678912'
+    >>> pdb.decrement_many([milk_barcode, apple_barcode, milk_barcode, '000000000000'], [5, 1, 500, 1])
+    >>> milk.get_quantity(), pdb.get_product(apple_barcode).get_quantity()
+    (0, 99)
+    >>> round(float((pdb.quantity_array() * pdb.price_array()).sum()), 2)
+    34.75
+    >>> pdb.save_inventory()
+    >>> reloaded = ColumnarProductDatabase('db-data/updated_inventory.csv')
+    >>> reloaded.get_product(milk_barcode).get_quantity(), reloaded.get_product(apple_barcode).get_name()
+    (0, 'Apple')
+
+    A barcode on several rows resolves to the last one, like ProductDatabase:
+
+    >>> import tempfile
+    >>> duplicated = os.path.join(tempfile.mkdtemp(), 'inventory.csv')
+    >>> with open(duplicated, 'w') as f:
+    ...     _ = f.write('barcode,name,price,quantity\\n'
+    ...                 '012345678905,First,1.0,10\\n'
+    ...                 '012345678912,Apple,0.25,100\\n'
+    ...                 '012345678905,Second,2.0,20\\n')
+    >>> ProductDatabase(duplicated).get_product(milk_barcode).get_name()
+    'Second'
+    >>> ColumnarProductDatabase(duplicated).get_product(milk_barcode).get_name()
+    'Second'
+    >>> MappedProductDatabase.build(duplicated, duplicated + '.bin')
+    3
+    >>> MappedProductDatabase(duplicated + '.bin').get_product(milk_barcode).get_name()
+    'Second'
+    """
+
+
+def mapped_product_database_doctests():
+    """Function to run the doctests for the MappedProductDatabase class.
+
+    Note that you should run this doctest at the root folder of the project
+    (same level as main.py)
+
+    >>> MappedProductDatabase.build('db-data/inventory.csv', 'db-data/inventory.bin')
+    3
+    >>> pdb = MappedProductDatabase('db-data/inventory.bin')
+    >>> milk_barcode = '012345678905'
+    >>> milk = pdb.get_product(milk_barcode)
+    >>> milk.get_name(), milk.get_price(), milk.get_quantity()
+    ('Milk', 2.99, 150)
+    >>> pdb.get_product('000000000000') is None
+    True
+    >>> pdb.decrement_inventory(milk_barcode, 10)
+    >>> milk.get_quantity()
+    140
+    >>> MappedProductDatabase('db-data/inventory.bin').get_product(milk_barcode).get_quantity()
+    150
+    >>> pdb.save_inventory()
+    >>> saved = MappedProductDatabase(MappedProductDatabase.SAVE_PATH)
+    >>> saved.get_product(milk_barcode).get_quantity()
+    140
+    >>> saved.decrement_inventory(milk_barcode, 5)
+    >>> saved.save_inventory()
+    >>> saved._save_file.journal.records
+    2
+    >>> MappedProductDatabase(MappedProductDatabase.SAVE_PATH).get_product(milk_barcode).get_quantity()
+    135
+    >>> saved.close()
+    >>> pdb.close()
     """
 
 
@@ -228,6 +1261,84 @@ def member_database_doctests():
     """
 
 
+def lazy_member_database_doctests():
+    """Function to run the doctests for the LazyMemberDatabase class.
+
+    Note that you should run this doctest at the root folder of the project
+    (same level as main.py)
+
+    >>> mdb = LazyMemberDatabase('db-data/memberships.csv', cache_size=1)
+    >>> len(mdb) == len(MemberDatabase('db-data/memberships.csv').memberships)
+    True
+    >>> os.path.exists('db-data/memberships.csv.idx')
+    True
+    >>> jane_barcode = '257274767454'
+    >>> jane = mdb.get_member(jane_barcode)
+    >>> jane.get_name(), jane.return_membership_type(), jane.get_points() == 1200
+    ('Jane Doe', 'Silver', True)
+    >>> mdb.get_member(jane_barcode) is jane
+    True
+    >>> mdb.get_member('200000000000') is None
+    True
+    >>> mdb.add_points(jane_barcode, 100)
+    >>> len(mdb._cache)
+    1
+    >>> john = mdb.get_member('251111111110')
+    >>> list(mdb._cache) == ['251111111110']
+    True
+    >>> mdb.get_member(jane_barcode).get_points() == 1300
+    True
+    >>> members = mdb.get_members(['251111111110', '200000000000', jane_barcode, '251111111110'])
+    >>> sorted(members), members[jane_barcode].get_points() == 1300, len(mdb._cache)
+    (['251111111110', '257274767454'], True, 1)
+    >>> mdb.save_memberships()
+    >>> MemberDatabase(MemberDatabase.SAVE_PATH).get_member(jane_barcode).get_points() == 1300
+    True
+    >>> mdb.close()
+    >>> saved = LazyMemberDatabase(MemberDatabase.SAVE_PATH)
+    >>> saved.add_points(jane_barcode, 50)
+    >>> saved.save_memberships()
+    >>> saved._save_file.journal.records
+    2
+    >>> LazyMemberDatabase(MemberDatabase.SAVE_PATH).get_member(jane_barcode).get_points() == 1350
+    True
+    >>> saved.close()
+
+    A barcode on several rows resolves to the last one, like MemberDatabase:
+
+    >>> import tempfile
+    >>> duplicated = os.path.join(tempfile.mkdtemp(), 'memberships.csv')
+    >>> with open(duplicated, 'w') as f:
+    ...     _ = f.write('barcode,name,tier,points\\n'
+    ...                 '257274767454,First,Silver,10\\n'
+    ...                 '251111111110,John Smith,Gold,50\\n'
+    ...                 '257274767454,Second,Gold,20\\n')
+    >>> MemberDatabase(duplicated).get_member(jane_barcode).get_name()
+    'Second'
+    >>> lazy = LazyMemberDatabase(duplicated)
+    >>> len(lazy), lazy.get_member(jane_barcode).get_name()
+    (2, 'Second')
+    >>> lazy.close()
+    >>> lazy = LazyMemberDatabase(duplicated)
+    >>> sorted(member.get_name() for member in lazy.get_members([jane_barcode, '251111111110']).values())
+    ['John Smith', 'Second']
+    >>> lazy.close()
+
+    If the index can't be written next to the file, a private one is built
+    in the temporary folder and removed once mapped:
+
+    >>> os.remove(duplicated + '.idx')
+    >>> os.mkdir(duplicated + '.idx.tmp')
+    >>> before = set(os.listdir(tempfile.gettempdir()))
+    >>> lazy = LazyMemberDatabase(duplicated)
+    >>> lazy.get_member(jane_barcode).get_name(), os.path.exists(duplicated + '.idx')
+    ('Second', False)
+    >>> [name for name in set(os.listdir(tempfile.gettempdir())) - before if name.endswith('.idx')]
+    []
+    >>> lazy.close()
+    """
+
+
 def coupon_database_doctests():
     """Function to run the doctests for the CouponDatabase class.
 
@@ -239,6 +1350,28 @@ def coupon_database_doctests():
     >>> cdb = CouponDatabase('db-data/coupons.csv')
     >>> sample_coupon_barcode = '149234073227'
     >>> coupon = cdb.get_coupon(sample_coupon_barcode)
+    >>> from coupon import PercentDiscountCoupon
     >>> isinstance(coupon, PercentDiscountCoupon)
     True
+    >>> from csvload import build_coupon
+    >>> cdb.apply_diff([build_coupon(['149000000011', '2020-01-31', 'fixed', '5', '0', 'Old']),
+    ...                 build_coupon(['149000000028', '2020-01-31', 'fixed', '5', '0', 'Old']),
+    ...                 build_coupon(['149000000035', '2020-02-29', 'percent', '5', '0', 'Old'])], [], [])
+    >>> [coupon.get_barcode() for coupon in cdb.valid_on(date(2020, 2, 1))][:1]
+    ['149000000035']
+    >>> cdb.get_valid_coupon('149000000035', date(2020, 2, 29)) is not None
+    True
+    >>> cdb.get_valid_coupon('149000000035', date(2020, 3, 1)) is None
+    True
+    >>> cdb.purge_expired(date(2020, 3, 1)), cdb.get_coupon('149000000011')
+    (3, None)
+    >>> cdb.get_coupon(sample_coupon_barcode) is coupon, cdb.purge_expired()
+    (True, 0)
+
+    A reload doesn't bring purged coupons back:
+
+    >>> reloaded = dict(cdb.coupons, **{'149000000011': build_coupon(
+    ...     ['149000000011', '2020-01-31', 'fixed', '5', '0', 'Old'])})
+    >>> cdb.diff_rows(reloaded)
+    ([], [], [])
     """
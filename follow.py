@@ -0,0 +1,141 @@
+"""Follow mode for live lane scan files.
+
+Lanes append scans to text files as they happen. ScanFileFollower watches
+one or more of those files, hands out only the complete lines appended since
+the last poll, and records how far it got in each file (optionally in an
+offsets file) so that a restart resumes where it left off.
+"""
+import json
+import os
+import time
+
+
+class ScanFileFollower:
+    def __init__(self, paths, offsets_path: str = None, poll_interval: float = 0.01):
+        """
+        Args:
+            paths (Iterable[str]): The scan files to follow.
+            offsets_path (str, optional): JSON file remembering the byte
+                offset reached in each scan file. Defaults to None (offsets
+                are kept in memory only).
+            poll_interval (float, optional): Seconds to sleep when no file
+                has grown. Defaults to 0.01.
+        """
+        self.paths = list(paths)
+        self.offsets_path = offsets_path
+        self.poll_interval = poll_interval
+        self.offsets = {}
+        if offsets_path is not None and os.path.exists(offsets_path):
+            with open(offsets_path, 'r') as f:
+                self.offsets = json.load(f)
+
+    def get_offset(self, path: str) -> int:
+        """Get the byte offset processed so far in a scan file.
+
+        Args:
+            path (str): The scan file.
+        Returns:
+            int: The offset of the first unprocessed byte.
+        """
+        return self.offsets.get(path, {}).get('offset', 0)
+
+    def _read_new_lines(self, path: str):
+        """Read the complete lines appended to a file since its offset.
+
+        Returns:
+            tuple: (lines, position) where position is the new offset, or
+                (None, None) if there is nothing new.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None, None
+        saved = self.offsets.get(path, {})
+        offset = saved.get('offset', 0)
+        if saved.get('inode', stat.st_ino) != stat.st_ino or stat.st_size < offset:
+            offset = 0  # the file was rotated or truncated: start it over
+        if stat.st_size == offset:
+            return None, None
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(stat.st_size - offset)
+        # A partially written last line is left for the next poll
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return None, None
+        lines = data[:end].decode('ascii', 'replace').splitlines()
+        return lines, {'offset': offset + end, 'inode': stat.st_ino}
+
+    def poll(self):
+        """Yield the lines appended to every followed file since the last
+        poll. A file's offset is committed once all of its new lines have
+        been consumed, so a crash mid-batch replays that batch on restart.
+
+        Yields:
+            str: The new lines, file by file, in file order.
+        """
+        for path in self.paths:
+            lines, position = self._read_new_lines(path)
+            if lines is None:
+                continue
+            yield from lines
+            self.offsets[path] = position
+            self.save_offsets()
+
+    def follow(self, stop=None):
+        """Yield new lines as they are appended, polling forever.
+
+        Args:
+            stop (threading.Event, optional): Stop following once set.
+        Yields:
+            str: The new lines, as they are appended.
+        """
+        while stop is None or not stop.is_set():
+            found = False
+            for line in self.poll():
+                found = True
+                yield line
+            if not found:
+                time.sleep(self.poll_interval)
+
+    def save_offsets(self):
+        """Persist the offsets (atomically) if an offsets file is set."""
+        if self.offsets_path is None:
+            return
+        temp_path = self.offsets_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.offsets, f)
+        os.replace(temp_path, self.offsets_path)
+
+
+def follow_doctests():
+    """Function to run the doctests for ScanFileFollower.
+
+    >>> import tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> lane = os.path.join(folder, 'lane_1.txt')
+    >>> offsets = os.path.join(folder, 'offsets.json')
+    >>> with open(lane, 'w') as f:
+    ...     _ = f.write('first\\nsecond\\nthi')
+    >>> follower = ScanFileFollower([lane], offsets)
+    >>> list(follower.poll())
+    ['first', 'second']
+    >>> list(follower.poll())
+    []
+    >>> with open(lane, 'a') as f:
+    ...     _ = f.write('rd\\n')
+    >>> list(follower.poll())
+    ['third']
+    >>> with open(lane, 'a') as f:
+    ...     _ = f.write('fourth\\n')
+    >>> restarted = ScanFileFollower([lane], offsets)
+    >>> restarted.get_offset(lane)
+    19
+    >>> list(restarted.poll())
+    ['fourth']
+    >>> with open(lane, 'w') as f:
+    ...     _ = f.write('rotated\\n')
+    >>> list(restarted.poll())
+    ['rotated']
+    """
@@ -0,0 +1,142 @@
+"""Binary inventory snapshots, opened with mmap.
+
+Parsing an inventory CSV costs time proportional to the catalog on every
+start. A snapshot stores the catalog sorted by barcode, in fixed-width
+columns that can be used in place: opening one maps the file and takes the
+same time whatever its size, and the OS loads pages as lookups touch them.
+
+Layout (little-endian, every column 8-byte aligned), after a 24 byte header:
+
+    magic (4 bytes) | version (uint16) | reserved (uint16) | count (uint64)
+    | names size (uint64)
+    barcodes (int64 x count, sorted) | prices (float64 x count)
+    | name offsets (int64 x count + 1) | quantities (int32 x count, padded)
+    | names (UTF-8, concatenated)
+
+MappedProductDatabase in database.py reads and writes this format.
+"""
+import mmap
+import os
+import struct
+from array import array
+
+MAGIC = b'INVS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQ')
+
+
+def _padded(size: int) -> int:
+    return (size + 7) // 8 * 8
+
+
+def write_inventory_snapshot(snapshot_path: str, rows) -> int:
+    """Atomically write an inventory snapshot: the file is written next to
+    snapshot_path, forced to disk and renamed over it.
+
+    Args:
+        snapshot_path (str): The snapshot to create or replace.
+        rows (Iterable[list]): [barcode, name, price, quantity] rows with
+            12 digit barcodes, in any order.
+    Returns:
+        int: The number of products written.
+    """
+    rows = sorted(((int(barcode), name, float(price), int(quantity))
+                   for barcode, name, price, quantity in rows), key=lambda row: row[0])
+    codes = array('q')
+    prices = array('d')
+    quantities = array('i')
+    name_offsets = array('q', [0])
+    names = bytearray()
+    for code, name, price, quantity in rows:
+        codes.append(code)
+        prices.append(price)
+        quantities.append(quantity)
+        names += name.encode()
+        name_offsets.append(len(names))
+    count = len(codes)
+
+    temp_path = snapshot_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, count, len(names)))
+        for column in (codes, prices, name_offsets, quantities):
+            data = column.tobytes()
+            f.write(data + bytes(_padded(len(data)) - len(data)))
+        f.write(names)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, snapshot_path)
+    return count
+
+
+def is_inventory_snapshot(path: str) -> bool:
+    """Check whether a file starts with the inventory snapshot header.
+
+    Args:
+        path (str): The file to check.
+    Returns:
+        bool: True if the file is an inventory snapshot.
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class InventorySnapshot:
+    """A memory-mapped inventory snapshot, exposing its columns as
+    memoryviews. The mapping is copy-on-write: quantities can be updated in
+    memory without changing the file."""
+
+    def __init__(self, snapshot_path: str):
+        with open(snapshot_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, version, _, count, names_size = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{snapshot_path} is not an inventory snapshot")
+        sizes = [8 * count, 8 * count, 8 * (count + 1), 4 * count]
+        if HEADER.size + sum(map(_padded, sizes)) + names_size > len(self._mmap):
+            self._mmap.close()
+            raise ValueError(f"{snapshot_path} is truncated")
+        self.count = count
+        view = memoryview(self._mmap)
+        columns = []
+        start = HEADER.size
+        for size, typecode in zip(sizes, 'qdqi'):
+            columns.append(view[start:start + size].cast(typecode))
+            start += _padded(size)
+        self.codes, self.prices, self.name_offsets, self.quantities = columns
+        self.names = view[start:start + names_size]
+        self._views = [view] + columns + [self.names]
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def inventory_snapshot_doctests():
+    """Function to run the doctests for the inventory snapshot format.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'inventory.bin')
+    >>> write_inventory_snapshot(path, [['043210987655', 'Cheddar Cheese', 0.25, 40],
+    ...                                 ['012345678905', 'Milk', 2.99, 150]])
+    2
+    >>> is_inventory_snapshot(path)
+    True
+    >>> os.path.getsize(path)
+    106
+    >>> with InventorySnapshot(path) as snapshot:
+    ...     snapshot.quantities[0] = 0
+    ...     (snapshot.count, list(snapshot.codes), list(snapshot.prices),
+    ...      bytes(snapshot.names[snapshot.name_offsets[0]:snapshot.name_offsets[1]]))
+    (2, [12345678905, 43210987655], [2.99, 0.25], b'Milk')
+    >>> with InventorySnapshot(path) as snapshot:
+    ...     list(snapshot.quantities)
+    [150, 40]
+    """
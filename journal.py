@@ -0,0 +1,393 @@
+"""Append-only journals of deltas against CSV snapshots.
+
+Instead of rewriting a whole snapshot CSV for every sale, the databases
+append one compact record of deltas (inventory or points changes, keyed by
+barcode) to ``<snapshot>.journal``. Loading a database reads the snapshot
+and replays its journal tail; compaction writes a fresh snapshot and starts
+an empty journal.
+
+The first line of a journal names the snapshot it applies to (inode, size
+and modification time). If a crash happens after a new snapshot was written
+but before its journal was reset, the old journal no longer matches the
+snapshot and is ignored instead of being applied twice.
+
+JournaledSnapshot keeps a database's save file and its journal: saves
+append, and a background thread folds the journal into a new snapshot
+every so many records. The fold writes ``<snapshot>.next`` and its journal
+``<snapshot>.next.journal`` (the records appended meanwhile), then renames
+both into place; a journal that doesn't match its snapshot is replaced by
+a ``.next.journal`` that does, so a crash between the two renames loses
+nothing.
+"""
+import json
+import os
+import shutil
+import threading
+
+
+class Journal:
+    def __init__(self, snapshot_path: str, fsync: bool = True):
+        """
+        Args:
+            snapshot_path (str): The CSV snapshot the journal applies to.
+            fsync (bool, optional): Force every record to disk before
+                returning. Defaults to True.
+        """
+        self.snapshot_path = snapshot_path
+        self.path = snapshot_path + '.journal'
+        self.fsync = fsync
+        self.records = 0
+        self._base = None
+
+    def snapshot_id(self):
+        """Identify the current snapshot file: inode, size and modification
+        time (None if there is none)."""
+        try:
+            stat = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+    def is_current(self) -> bool:
+        """Check whether appending to this journal still applies to the
+        snapshot on disk (no one else has written a newer snapshot).
+
+        Returns:
+            bool: True if records can be appended.
+        """
+        return self._base is not None and self._base == self.snapshot_id()
+
+    def replay(self):
+        """Read the records written against the current snapshot, stopping
+        at the first incomplete record (e.g. one cut short by a crash).
+
+        Yields:
+            dict: The deltas of each record, keyed by barcode.
+        """
+        snapshot_id = self.snapshot_id()
+        self._base = snapshot_id
+        self.records = 0
+        f = self._open_for(self.path, snapshot_id)
+        if f is None:
+            # A compaction may have stopped between renaming its snapshot
+            # and its journal into place
+            next_path = self.snapshot_path + '.next.journal'
+            f = self._open_for(next_path, snapshot_id)
+            if f is None:
+                return
+            f.close()
+            os.replace(next_path, self.path)
+            f = self._open_for(self.path, snapshot_id)
+        with f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                try:
+                    deltas = json.loads(line)['d']
+                except (ValueError, KeyError):
+                    break
+                self.records += 1
+                yield deltas
+
+    @staticmethod
+    def _open_for(path: str, snapshot_id):
+        """Open a journal, positioned after its header, if it applies to
+        snapshot_id (None if not)."""
+        try:
+            f = open(path, 'r')
+        except FileNotFoundError:
+            return None
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+        if snapshot_id is None or not isinstance(header, dict) or header.get('snapshot') != snapshot_id:
+            f.close()
+            return None
+        return f
+
+    def append(self, deltas: dict):
+        """Append one record of deltas.
+
+        Args:
+            deltas (dict): Changes keyed by barcode.
+        """
+        if not os.path.exists(self.path):
+            self.reset()
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'d': deltas}, separators=(',', ':')) + '\n')
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        except BaseException:
+            # The record may be half written, and replay stops there: make
+            # the owner write a full snapshot instead of appending after it
+            self._base = None
+            raise
+        self.records += 1
+
+    def reset(self):
+        """Start an empty journal for the current snapshot. Called after a
+        new snapshot has been written."""
+        self._base = self.snapshot_id()
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps({'snapshot': self._base}) + '\n')
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.records = 0
+
+
+class JournaledSnapshot:
+    """The file a database saves to, and the journal of deltas against it.
+
+    Saves append to the journal. Once it holds compact_every records, a
+    background thread folds it into a new snapshot read back from disk, so
+    neither the database nor the saves wait for a full rewrite; the records
+    appended meanwhile move to the new snapshot's journal. A database
+    loaded from another file starts from a byte copy of that file (rebase),
+    and only rewrites its rows when they changed otherwise (write).
+    """
+
+    def __init__(self, snapshot_path: str, read_rows, fold_row, write_rows,
+                 compact_every: int = 1000, fsync: bool = True):
+        """
+        Args:
+            snapshot_path (str): The snapshot file.
+            read_rows (Callable[[str], Iterable[list]]): Reads the rows of a
+                snapshot file, barcode first.
+            fold_row (Callable[[list, int], list]): Applies a delta to a row.
+            write_rows (Callable[[str, Iterable[list]], None]): Atomically
+                writes a snapshot file.
+            compact_every (int, optional): Journal records between
+                compactions. Defaults to 1000.
+            fsync (bool, optional): Force writes to disk. Defaults to True.
+        """
+        self.snapshot_path = snapshot_path
+        self.journal = Journal(snapshot_path, fsync)
+        self.compact_every = compact_every
+        self._read_rows = read_rows
+        self._fold_row = fold_row
+        self._write_rows = write_rows
+        self._lock = threading.Lock()  # between the saves and the compaction's renames
+        self._compactor = None
+
+    def open(self):
+        """Continue the journal of the snapshot on disk, after its last
+        record."""
+        with self._lock:
+            for _ in self.journal.replay():
+                pass
+
+    def is_current(self) -> bool:
+        """Check whether saves can append (see Journal.is_current).
+
+        Returns:
+            bool: True if the snapshot on disk is the one journaled.
+        """
+        return self.journal.is_current()
+
+    def append(self, deltas: dict):
+        """Append one record of deltas, and start a background compaction
+        if the journal is long enough.
+
+        Args:
+            deltas (dict): Changes keyed by barcode.
+        """
+        with self._lock:
+            self.journal.append(deltas)
+            full = self.journal.records >= self.compact_every
+        if full:
+            self.compact_in_background()
+
+    def write(self, rows):
+        """Replace the snapshot with rows and start an empty journal.
+
+        Args:
+            rows (Iterable[list]): Every row, barcode first.
+        """
+        with self._lock:
+            self.journal._base = None  # not current until the journal is reset
+            self._write_rows(self.snapshot_path, rows)
+            self.journal.reset()
+
+    def rebase(self, source_path: str, deltas: dict):
+        """Replace the snapshot with a byte copy of another file (the one a
+        database was loaded from), journaled with the changes since.
+
+        Args:
+            source_path (str): The file to copy.
+            deltas (dict): The changes since source_path was written.
+        """
+        temp_path = self.snapshot_path + '.tmp'
+        with self._lock:
+            self.journal._base = None
+            shutil.copyfile(source_path, temp_path)
+            if self.journal.fsync:
+                with open(temp_path, 'rb') as f:
+                    os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+            self.journal.reset()
+            if deltas:
+                self.journal.append(deltas)
+
+    def compact(self):
+        """Fold the journal into a new snapshot, read from the one on disk.
+        Saves can carry on meanwhile: their records move to the new
+        journal."""
+        with self._lock:
+            base, folded = self.journal._base, self.journal.records
+        if base is None or not folded:
+            return
+        records = list(Journal(self.snapshot_path).replay())
+        if len(records) < folded:
+            return
+        deltas = {}
+        for record in records[:folded]:
+            merge_deltas(deltas, record)
+        fold_row = self._fold_row
+        next_path = self.snapshot_path + '.next'
+        self._write_rows(next_path, (fold_row(row, deltas[row[0]]) if row[0] in deltas else row
+                                     for row in self._read_rows(self.snapshot_path)))
+        with self._lock:
+            if self.journal._base != base or not self.journal.is_current():
+                # Replaced by a full write meanwhile
+                os.remove(next_path)
+                return
+            tail = list(Journal(self.snapshot_path).replay())[folded:]
+            next_journal = Journal(next_path, self.journal.fsync)
+            next_journal.reset()
+            for record in tail:
+                next_journal.append(record)
+            os.replace(next_path, self.snapshot_path)
+            os.replace(next_journal.path, self.journal.path)
+            self.journal._base = next_journal._base
+            self.journal.records = len(tail)
+
+    def compact_in_background(self):
+        """Start compact on a daemon thread, unless one is running. A
+        compaction cut short (e.g. at exit) leaves the snapshot and journal
+        as they were."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_quietly, name='journal-compactor',
+                                           daemon=True)
+        self._compactor.start()
+
+    def wait(self):
+        """Wait for a background compaction to finish."""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def _compact_quietly(self):
+        try:
+            self.compact()
+        except Exception as error:
+            # The journal is still valid; the next compaction tries again
+            print(f"WARNING: compacting {self.snapshot_path} failed: {error}")
+
+
+def write_snapshot(snapshot_path: str, header: list, rows, fsync: bool = True):
+    """Atomically replace a CSV snapshot: the rows are written to a temporary
+    file which is then renamed over the snapshot.
+
+    Args:
+        snapshot_path (str): The CSV to replace.
+        header (list): The column names.
+        rows (Iterable[list]): The rows to write.
+        fsync (bool, optional): Force the file to disk before renaming it.
+            Defaults to True.
+    """
+    temp_path = snapshot_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(','.join(header) + '\n')
+        f.writelines(','.join(map(str, row)) + '\n' for row in rows)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_path, snapshot_path)
+
+
+def merge_deltas(deltas: dict, more: dict):
+    """Add more deltas into deltas, by barcode.
+
+    Args:
+        deltas (dict): Changes keyed by barcode, updated in place.
+        more (dict): Changes to add.
+    """
+    for barcode, delta in more.items():
+        deltas[barcode] = deltas.get(barcode, 0) + delta
+
+
+def keep_on_failure(write, deltas: dict, failed: list):
+    """Wrap a save job so that a failed write doesn't lose its deltas: they
+    are appended to failed, for the next prepare_save to merge back. The
+    job may run on another thread than prepare_save (list.append is atomic).
+
+    Args:
+        write (Callable[[], None]): Writes the captured state.
+        deltas (dict): The changes the write saves.
+        failed (list[dict]): Where to hand the deltas back.
+    Returns:
+        Callable[[], None]: The job.
+    """
+    def job():
+        try:
+            write()
+        except BaseException:
+            failed.append(deltas)
+            raise
+    return job
+
+
+def journal_doctests():
+    """Function to run the doctests for Journal.
+
+    >>> import tempfile
+    >>> snapshot = os.path.join(tempfile.mkdtemp(), 'inventory.csv')
+    >>> write_snapshot(snapshot, ['barcode', 'quantity'], [['012345678905', 150]])
+    >>> journal = Journal(snapshot)
+    >>> journal.reset()
+    >>> journal.append({'012345678905': -2})
+    >>> journal.append({'012345678905': -1, '012345678912': -4})
+    >>> list(Journal(snapshot).replay())
+    [{'012345678905': -2}, {'012345678905': -1, '012345678912': -4}]
+    >>> with open(journal.path, 'a') as f:
+    ...     _ = f.write('{"d": {"0123')
+    >>> len(list(Journal(snapshot).replay()))
+    2
+    >>> write_snapshot(snapshot, ['barcode', 'quantity'], [['012345678905', 147]])
+    >>> journal.is_current()
+    False
+    >>> list(Journal(snapshot).replay())
+    []
+
+    JournaledSnapshot folds the journal into a new snapshot:
+
+    >>> def read_rows(path):
+    ...     with open(path) as f:
+    ...         return [line.strip().split(',') for line in f][1:]
+    >>> saved = JournaledSnapshot(snapshot, read_rows, lambda row, delta: [row[0], int(row[1]) + delta],
+    ...                           lambda path, rows: write_snapshot(path, ['barcode', 'quantity'], rows))
+    >>> saved.write([['012345678905', 150]])
+    >>> saved.append({'012345678905': -2})
+    >>> saved.append({'012345678905': -1})
+    >>> saved.compact()
+    >>> saved.journal.records, read_rows(snapshot)
+    (0, [['012345678905', '147']])
+
+    If a compaction stops between renaming its snapshot and its journal,
+    loading picks up the new journal:
+
+    >>> write_snapshot(snapshot + '.next', ['barcode', 'quantity'], [['012345678905', 146]])
+    >>> next_journal = Journal(snapshot + '.next')
+    >>> next_journal.reset()
+    >>> next_journal.append({'012345678905': -3})
+    >>> os.replace(snapshot + '.next', snapshot)
+    >>> list(Journal(snapshot).replay())
+    [{'012345678905': -3}]
+    """
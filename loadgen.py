@@ -0,0 +1,268 @@
+"""Seeded synthetic data for benchmarks and capacity planning.
+
+LoadGenerator writes inventory, membership and coupon CSVs in the formats
+database.py reads, and text or packed scan logs of their barcodes, with
+configurable flip and corruption rates. The same seed always produces the
+same files.
+
+Usage (from the root folder of the project):
+    python loadgen.py OUTPUT_DIR [--products N] [--members N] [--coupons N]
+                      [--scans N] [--flip-rate R] [--corruption-rate R]
+                      [--packed] [--seed S]
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+from datetime import datetime, timedelta
+
+from barcode import BarcodeProcessor
+from scanlog import write_packed_scans
+
+PRODUCT_PREFIX = '0'
+COUPON_PREFIX = '1'
+MEMBER_PREFIX = '2'
+
+ADJECTIVES = ['Organic', 'Fresh', 'Whole', 'Sliced', 'Frozen', 'Smoked', 'Roasted',
+              'Sparkling', 'Low Fat', 'Spicy', 'Sweet', 'Crunchy', 'Wild', 'Aged']
+NOUNS = ['Milk', 'Bread', 'Apple', 'Cheddar Cheese', 'Coffee', 'Salmon', 'Almonds',
+         'Water', 'Yogurt', 'Tortillas', 'Spinach', 'Rice', 'Chicken', 'Pasta']
+FIRST_NAMES = ['John', 'Jane', 'Maria', 'Wei', 'Aarav', 'Fatima', 'Diego', 'Yuki',
+               'Olga', 'Kwame', 'Sofia', 'Liam', 'Noor', 'Mateo']
+LAST_NAMES = ['Smith', 'Doe', 'Garcia', 'Chen', 'Patel', 'Khan', 'Lopez', 'Sato',
+              'Ivanova', 'Mensah', 'Rossi', 'Murphy', 'Haddad', 'Silva']
+TIERS = ['Member', 'Silver', 'Gold', 'Platinum']
+TIER_WEIGHTS = [60, 25, 10, 5]
+
+
+class LoadGenerator:
+    def __init__(self, seed: int = 0):
+        """
+        Args:
+            seed (int, optional): Seed for every random choice. Defaults to 0.
+        """
+        self.rng = random.Random(seed)
+        self.processor = BarcodeProcessor()
+
+    def generate_barcodes(self, prefix: str, count: int) -> list[str]:
+        """Generate distinct valid 12 digit barcodes.
+
+        Args:
+            prefix (str): The type digit ('0' product, '1' coupon, '2' member).
+            count (int): The number of barcodes.
+        Returns:
+            list[str]: The barcodes, with correct check digits.
+        """
+        barcodes = []
+        for body in self.rng.sample(range(10 ** 10), count):
+            digits = f"{prefix}{body:010d}"
+            barcodes.append(digits + self.processor.compute_check_digit(digits))
+        return barcodes
+
+    def write_inventory(self, inventory_path: str, count: int) -> list[str]:
+        """Write an inventory CSV (barcode,name,price,quantity).
+
+        Args:
+            inventory_path (str): The CSV to create.
+            count (int): The number of products.
+        Returns:
+            list[str]: The product barcodes, in file order.
+        """
+        rng = self.rng
+        barcodes = self.generate_barcodes(PRODUCT_PREFIX, count)
+        with open(inventory_path, 'w') as f:
+            f.write("barcode,name,price,quantity\n")
+            for barcode in barcodes:
+                name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+                price = round(rng.uniform(0.25, 60.0), 2)
+                f.write(f"{barcode},{name},{price},{rng.randint(0, 500)}\n")
+        return barcodes
+
+    def write_memberships(self, membership_path: str, count: int) -> list[str]:
+        """Write a memberships CSV (barcode,name,tier,points).
+
+        Args:
+            membership_path (str): The CSV to create.
+            count (int): The number of members.
+        Returns:
+            list[str]: The member barcodes, in file order.
+        """
+        rng = self.rng
+        barcodes = self.generate_barcodes(MEMBER_PREFIX, count)
+        tiers = rng.choices(TIERS, weights=TIER_WEIGHTS, k=count)
+        with open(membership_path, 'w') as f:
+            f.write("barcode,name,tier,points\n")
+            for barcode, tier in zip(barcodes, tiers):
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                f.write(f"{barcode},{name},{tier},{rng.randint(0, 5000)}\n")
+        return barcodes
+
+    def write_coupons(self, coupon_path: str, count: int, expired_rate: float = 0.2,
+                      today: datetime = None) -> list[str]:
+        """Write a coupons CSV
+        (barcode,expiration,discount_type,discount_value,min_purchase,description).
+
+        Expiration dates cluster on a few hundred campaign end dates, some of
+        them in the past.
+
+        Args:
+            coupon_path (str): The CSV to create.
+            count (int): The number of coupons.
+            expired_rate (float, optional): Fraction of already expired
+                coupons. Defaults to 0.2.
+            today (datetime, optional): The date expirations are relative
+                to. Defaults to now.
+        Returns:
+            list[str]: The coupon barcodes, in file order.
+        """
+        rng = self.rng
+        today = today or datetime.now()
+        barcodes = self.generate_barcodes(COUPON_PREFIX, count)
+        with open(coupon_path, 'w') as f:
+            f.write("barcode,expiration,discount_type,discount_value,min_purchase,description\n")
+            for barcode in barcodes:
+                days = rng.randint(1, 365)
+                if rng.random() < expired_rate:
+                    days = -days
+                expiration = (today + timedelta(days=days)).strftime('%Y-%m-%d')
+                if rng.random() < 0.5:
+                    value = rng.choice([5, 10, 15, 20, 25])
+                    description = f"{value}% off"
+                    discount_type = 'percent'
+                else:
+                    value = rng.choice([1, 2, 5, 10])
+                    description = f"${value} off"
+                    discount_type = 'fixed'
+                min_purchase = rng.choice([0, 10, 20, 50])
+                f.write(f"{barcode},{expiration},{discount_type},{value},{min_purchase},{description}\n")
+        return barcodes
+
+    def generate_scans(self, count: int, products: list[str], members: list[str] = (),
+                       coupons: list[str] = (), member_rate: float = 0.02,
+                       coupon_rate: float = 0.01, flip_rate: float = 0.0,
+                       corruption_rate: float = 0.0):
+        """Generate binary scans (length 95 strings) of the given barcodes.
+
+        Product popularity follows a Zipf-like distribution, so a small set of
+        SKUs makes up most of the traffic, as in a real lane.
+
+        Args:
+            count (int): The number of scans.
+            products (list[str]): Product barcodes to scan.
+            members (list[str], optional): Member barcodes to scan.
+            coupons (list[str], optional): Coupon barcodes to scan.
+            member_rate (float, optional): Fraction of member scans.
+            coupon_rate (float, optional): Fraction of coupon scans.
+            flip_rate (float, optional): Fraction of reversed scans.
+            corruption_rate (float, optional): Fraction of scans with one
+                flipped bit, which never decode.
+        Yields:
+            str: The binary scans.
+        """
+        rng = self.rng
+        encode = self.processor.encode
+        encoded = {}
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(products) + 1)))
+        total_weight = cum_weights[-1] if cum_weights else 0
+        for _ in range(count):
+            roll = rng.random()
+            if members and roll < member_rate:
+                barcode = rng.choice(members)
+            elif coupons and roll < member_rate + coupon_rate:
+                barcode = rng.choice(coupons)
+            else:
+                index = bisect.bisect(cum_weights, rng.random() * total_weight)
+                barcode = products[min(index, len(products) - 1)]
+            binary = encoded.get(barcode)
+            if binary is None:
+                binary = encoded[barcode] = encode(barcode)
+            if rng.random() < corruption_rate:
+                bit = rng.randrange(3, 92)
+                binary = binary[:bit] + ('1' if binary[bit] == '0' else '0') + binary[bit + 1:]
+            if rng.random() < flip_rate:
+                binary = binary[::-1]
+            yield binary
+
+    def write_scan_log(self, scan_path: str, count: int, products: list[str],
+                       packed: bool = False, **options) -> int:
+        """Write a scan log of generated scans (see generate_scans).
+
+        Args:
+            scan_path (str): The scan log to create.
+            count (int): The number of scans.
+            products (list[str]): Product barcodes to scan.
+            packed (bool, optional): Write the packed binary format instead
+                of text. Defaults to False.
+            **options: Passed on to generate_scans.
+        Returns:
+            int: The number of scans written.
+        """
+        scans = self.generate_scans(count, products, **options)
+        if packed:
+            return write_packed_scans(scans, scan_path)
+        with open(scan_path, 'w') as f:
+            for binary in scans:
+                f.write(binary + '\n')
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic store data and scan logs.")
+    parser.add_argument('output_dir')
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--members', type=int, default=10_000)
+    parser.add_argument('--coupons', type=int, default=1_000)
+    parser.add_argument('--scans', type=int, default=1_000_000)
+    parser.add_argument('--flip-rate', type=float, default=0.1)
+    parser.add_argument('--corruption-rate', type=float, default=0.01)
+    parser.add_argument('--packed', action='store_true', help="write the scan log in packed format")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    generator = LoadGenerator(args.seed)
+    products = generator.write_inventory(os.path.join(args.output_dir, 'inventory.csv'), args.products)
+    members = generator.write_memberships(os.path.join(args.output_dir, 'memberships.csv'), args.members)
+    coupons = generator.write_coupons(os.path.join(args.output_dir, 'coupons.csv'), args.coupons)
+    scan_name = 'scans.bin' if args.packed else 'scans.txt'
+    generator.write_scan_log(os.path.join(args.output_dir, scan_name), args.scans, products,
+                             packed=args.packed, members=members, coupons=coupons,
+                             flip_rate=args.flip_rate, corruption_rate=args.corruption_rate)
+
+
+def loadgen_doctests():
+    """Function to run the doctests for LoadGenerator.
+
+    >>> import tempfile
+    >>> from database import ProductDatabase, MemberDatabase, CouponDatabase
+    >>> folder = tempfile.mkdtemp()
+    >>> generator = LoadGenerator(seed=42)
+    >>> products = generator.write_inventory(os.path.join(folder, 'inventory.csv'), 50)
+    >>> members = generator.write_memberships(os.path.join(folder, 'memberships.csv'), 20)
+    >>> coupons = generator.write_coupons(os.path.join(folder, 'coupons.csv'), 10)
+    >>> len(set(products)), products[0][0], members[0][0], coupons[0][0]
+    (50, '0', '2', '1')
+    >>> scanner = BarcodeProcessor()
+    >>> all(scanner.modulo_check(barcode) for barcode in products + members + coupons)
+    True
+    >>> len(ProductDatabase(os.path.join(folder, 'inventory.csv')).products)
+    50
+    >>> len(MemberDatabase(os.path.join(folder, 'memberships.csv')).memberships)
+    20
+    >>> len(CouponDatabase(os.path.join(folder, 'coupons.csv')).coupons)
+    10
+    >>> scans = list(generator.generate_scans(1000, products, members, coupons,
+    ...                                       flip_rate=0.5, corruption_rate=0.1))
+    >>> results = [scanner.decode(scan) for scan in scans]
+    >>> 50 < sum(not result.is_valid() for result in results) < 150
+    True
+    >>> 400 < sum(result.orientation == 'flipped' for result in results) < 500
+    True
+    >>> LoadGenerator(seed=42).generate_barcodes('0', 3) == products[:3]
+    True
+    """
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+from money import to_cents, from_cents, to_basis_points, apply_rate
+
+
 class Member:
     """A member of the store."""
 
@@ -76,8 +79,18 @@ class Member:
     def apply_discount(self, subtotal: float) -> float:
         """Apply the member discount to the subtotal and return the discounted amount."""
 
-        discount = subtotal * self.discount_rate
-        return round(subtotal - discount, 2)
+        return from_cents(self.apply_discount_cents(to_cents(subtotal)))
+
+    def apply_discount_cents(self, subtotal_cents: int) -> int:
+        """Apply the member discount to a subtotal in cents, rounding the
+        discount half up to the cent.
+
+        Args:
+            subtotal_cents (int): The subtotal in cents.
+        Returns:
+            int: The discounted subtotal in cents.
+        """
+        return subtotal_cents - apply_rate(subtotal_cents, to_basis_points(self.discount_rate))
 
 
 class SilverMember(Member):
@@ -151,4 +164,8 @@ def member_doctests():
     True
     >>> test_plat.get_discount_rate() == 0.1
     True
+    >>> test_gold.apply_discount_cents(50), test_gold.apply_discount(0.5)
+    (47, 0.47)
+    >>> Member(numeric_barcode, name, points).apply_discount_cents(1999)
+    1999
     """
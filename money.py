@@ -0,0 +1,131 @@
+"""Fixed-point money: amounts are integer cents.
+
+Prices, subtotals, discounts and totals are computed in whole cents, so sums
+are exact and the same cart always gives the same total, whatever order its
+items were added in. The float methods of Product, Member, the coupons and
+ShoppingCart convert at the edges with to_cents and from_cents.
+
+Rounding policy: a step that produces a fraction of a cent (converting a
+decimal amount, or taking a percentage of an amount) rounds half up to the
+nearest cent, at that step. Rates are held in basis points (1/100 of a
+percent), so percentages with up to two decimals are exact.
+"""
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; it speeds up batch conversions
+    np = None
+
+CENTS = 100  # cents per dollar
+BASIS_POINTS = 10_000  # basis points per 1 (100%)
+
+
+def to_cents(amount) -> int:
+    """Convert a dollar amount to cents, rounding half up.
+
+    Args:
+        amount (float, str, int or Decimal): The amount in dollars.
+    Returns:
+        int: The amount in cents.
+    """
+    if type(amount) is float:
+        # Inlined fast path of _scaled, for building products
+        scaled = amount * CENTS
+        cents = round(scaled)
+        if -1e-6 < scaled - cents < 1e-6:
+            return cents
+    return _scaled(amount, 2)
+
+
+def from_cents(cents: int) -> float:
+    """Convert cents to a dollar amount.
+
+    Args:
+        cents (int): The amount in cents.
+    Returns:
+        float: The amount in dollars.
+    """
+    return cents / CENTS
+
+
+def to_basis_points(rate) -> int:
+    """Convert a rate (0.05 for 5%) to basis points, rounding half up.
+
+    Args:
+        rate (float, str, int or Decimal): The rate.
+    Returns:
+        int: The rate in basis points.
+    """
+    return _scaled(rate, 4)
+
+
+def percent_to_basis_points(percent) -> int:
+    """Convert a percentage (15.5 for 15.5%) to basis points, rounding half up.
+
+    Args:
+        percent (float, str, int or Decimal): The percentage.
+    Returns:
+        int: The rate in basis points.
+    """
+    return _scaled(percent, 2)
+
+
+def _scaled(value, digits: int) -> int:
+    """Multiply by 10 ** digits and round half up to an integer."""
+    if isinstance(value, float):
+        scaled = value * 10 ** digits
+        nearest = round(scaled)
+        if abs(scaled - nearest) < 1e-6:
+            # Already whole up to float error (2.99 * 100), the usual case
+            return int(nearest)
+        # repr is the shortest decimal that reads back as the same float
+        # (2.675 rather than 2.67499999...), which is what was meant
+        value = repr(value)
+    return int(Decimal(value).scaleb(digits).quantize(Decimal(1), ROUND_HALF_UP))
+
+
+def apply_rate(cents: int, basis_points: int) -> int:
+    """Take a rate of an amount, rounding half up to the cent.
+
+    Args:
+        cents (int): The amount in cents (not negative).
+        basis_points (int): The rate in basis points.
+    Returns:
+        int: The rate of the amount, in cents.
+    """
+    return (cents * basis_points + BASIS_POINTS // 2) // BASIS_POINTS
+
+
+def to_cents_array(prices):
+    """Convert many dollar amounts to cents at once, for batch repricing.
+
+    Args:
+        prices (Iterable[float]): Amounts in dollars (e.g. the price column
+            of a ColumnarProductDatabase).
+    Returns:
+        numpy.ndarray or array.array: int64 cents.
+    """
+    if np is not None:
+        # Rounding to 6 decimals first drops the float error of the product
+        # (1.005 * 100 is 100.49999...), so halves round up like to_cents
+        cents = np.round(np.asarray(prices, dtype=np.float64) * CENTS, 6)
+        return np.floor(cents + 0.5).astype(np.int64)
+    return array('q', map(to_cents, prices))
+
+
+def money_doctests():
+    """Function to run the doctests for the money helpers.
+
+    >>> to_cents(2.99), to_cents('0.055'), to_cents(2.675), to_cents(3)
+    (299, 6, 268, 300)
+    >>> from_cents(299)
+    2.99
+    >>> to_basis_points(0.05), percent_to_basis_points(15.5)
+    (500, 1550)
+    >>> apply_rate(50, 500), apply_rate(20000, 1550), apply_rate(49, 500)
+    (3, 3100, 2)
+    >>> [int(cents) for cents in to_cents_array([2.99, 0.25, 1.005])]
+    [299, 25, 101]
+    """
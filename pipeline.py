@@ -0,0 +1,197 @@
+"""Composable generator stages for scan processing.
+
+    read_scans -> decode_scans -> classify -> resolve -> apply_to_cart
+
+Every stage takes any iterable and yields lazily, so a pipeline can be fed
+from a file, a socket, the tail of a growing file or a test fixture while
+holding one scan at a time in memory. Stages only rely on the duck-typed
+interfaces of the decoder (decode/decode_value), the backend
+(get_product/get_coupon/get_member) and the cart (add_item/add_coupon/
+add_membership), so a faster decoder or a cached backend can be swapped in.
+For a finite batch of scans, resolve_batch replaces resolve and uses the
+backend's bulk lookups (get_products/get_coupons/get_members) instead.
+"""
+from barcode import ScanStats
+from scanlog import PackedScanReader, is_packed_scan_log
+
+
+def read_scans(source):
+    """Read raw scans from a scan log or any iterable of lines.
+
+    Args:
+        source (str or Iterable[str]): A text or packed scan log path, or
+            lines (e.g. an open file or a socket's lines).
+    Yields:
+        str or int: Stripped lines (text), or 95-bit integers (packed logs).
+    """
+    if isinstance(source, str):
+        if is_packed_scan_log(source):
+            with PackedScanReader(source) as reader:
+                yield from reader.values()
+        else:
+            with open(source, 'r') as f:
+                for line in f:
+                    yield line.strip()
+    else:
+        for line in source:
+            yield line.strip()
+
+
+def decode_scans(scans, processor, stats: ScanStats = None):
+    """Decode raw scans, skipping the ones that don't decode.
+
+    Args:
+        scans (Iterable[str or int]): Binary strings or 95-bit integers.
+        processor (BarcodeProcessor): The decoder to use.
+        stats (ScanStats, optional): Statistics to record every scan in.
+    Yields:
+        str: The 12 digit barcodes of valid scans.
+    """
+    decode = processor.decode
+    decode_value = processor.decode_value
+    for scan in scans:
+        result = decode_value(scan) if isinstance(scan, int) else decode(scan)
+        if stats is not None:
+            stats.record(result)
+        if result.reason is None:
+            yield result.digits
+
+
+def classify(numeric_barcodes, identify):
+    """Pair each barcode with its type, skipping unknown types.
+
+    Args:
+        numeric_barcodes (Iterable[str]): 12 digit barcodes.
+        identify (Callable[[str], str]): Returns the type of a barcode
+            ('product', 'coupon' or 'membership'), raising ValueError for
+            invalid ones, e.g. POSSystem._identify_barcode_type.
+    Yields:
+        tuple[str, str]: (numeric_barcode, barcode_type) pairs.
+    """
+    for numeric in numeric_barcodes:
+        try:
+            yield numeric, identify(numeric)
+        except ValueError:
+            continue
+
+
+def resolve(classified, backend):
+    """Look up classified barcodes, skipping the ones the store doesn't know.
+
+    Args:
+        classified (Iterable[tuple[str, str]]): (numeric_barcode, barcode_type).
+        backend (StoreBackend): The store to look barcodes up in.
+    Yields:
+        tuple[str, object]: (barcode_type, Product/Coupon/Member) pairs.
+    """
+    lookups = {
+        'product': backend.get_product,
+        'coupon': backend.get_coupon,
+        'membership': backend.get_member,
+    }
+    for numeric, barcode_type in classified:
+        lookup = lookups.get(barcode_type)
+        found = lookup(numeric) if lookup else None
+        if found:
+            yield barcode_type, found
+
+
+def resolve_batch(classified, backend):
+    """Like resolve, but for a finite batch: the batch is read whole and
+    looked up with one bulk lookup per barcode type.
+
+    Args:
+        classified (Iterable[tuple[str, str]]): (numeric_barcode, barcode_type).
+        backend (StoreBackend): The store to look barcodes up in.
+    Yields:
+        tuple[str, object]: (barcode_type, Product/Coupon/Member) pairs, in
+            the order of the batch.
+    """
+    classified = list(classified)
+    lookups = {
+        'product': backend.get_products,
+        'coupon': backend.get_coupons,
+        'membership': backend.get_members,
+    }
+    batches = {barcode_type: [] for barcode_type in lookups}
+    for numeric, barcode_type in classified:
+        batch = batches.get(barcode_type)
+        if batch is not None:
+            batch.append(numeric)
+    found = {barcode_type: dict(zip(batch, lookups[barcode_type](batch)))
+             for barcode_type, batch in batches.items() if batch}
+    for numeric, barcode_type in classified:
+        result = found.get(barcode_type, {}).get(numeric)
+        if result:
+            yield barcode_type, result
+
+
+def apply_to_cart(resolved, cart) -> int:
+    """Add resolved products, coupons and memberships to a cart.
+
+    Args:
+        resolved (Iterable[tuple[str, object]]): (barcode_type, object) pairs.
+        cart (ShoppingCart): The cart to update.
+    Returns:
+        int: The number of objects applied.
+    """
+    actions = {
+        'product': cart.add_item,
+        'coupon': cart.add_coupon,
+        'membership': cart.add_membership,
+    }
+    count = 0
+    for barcode_type, found in resolved:
+        actions[barcode_type](found)
+        count += 1
+    return count
+
+
+def pipeline_doctests():
+    """Function to run the doctests for the pipeline stages.
+
+    >>> from barcode import BarcodeProcessor
+    >>> from cart import ShoppingCart
+    >>> from product import Product
+    >>> scanner = BarcodeProcessor()
+    >>> encode = scanner.encode
+    >>> lines = [encode('012345678905') + '\\n', '\\n', encode('252109613999')[::-1],
+    ...          encode('036000291439')]
+    >>> stats = ScanStats()
+    >>> list(decode_scans(read_scans(lines), scanner, stats))
+    ['012345678905', '252109613999']
+    >>> stats
+    ScanStats(scanned=4, decoded=2, flipped=1, invalid=2)
+    >>> def identify(numeric):
+    ...     if numeric[0] != '0':
+    ...         raise ValueError("Not a product")
+    ...     return 'product'
+    >>> class Backend:
+    ...     def get_product(self, numeric):
+    ...         return Product(numeric, 'Milk', 2.99, 150)
+    ...     def get_coupon(self, numeric):
+    ...         return None
+    ...     def get_member(self, numeric):
+    ...         return None
+    >>> cart = ShoppingCart()
+    >>> scans = decode_scans(read_scans(lines), scanner)
+    >>> apply_to_cart(resolve(classify(scans, identify), Backend()), cart)
+    1
+    >>> [item.get_name() for item in cart.get_items()]
+    ['Milk']
+    >>> class BulkBackend:
+    ...     def get_products(self, numerics):
+    ...         print('products', numerics)
+    ...         return [Product(numeric, 'Milk', 2.99, 150) for numeric in numerics]
+    ...     def get_coupons(self, numerics):
+    ...         return [None] * len(numerics)
+    ...     def get_members(self, numerics):
+    ...         print('members', numerics)
+    ...         return [None] * len(numerics)
+    >>> classified = [('012345678905', 'product'), ('252109613999', 'membership'),
+    ...               ('036000291439', 'product')]
+    >>> [found.get_barcode() for _, found in resolve_batch(classified, BulkBackend())]
+    products ['012345678905', '036000291439']
+    members ['252109613999']
+    ['012345678905', '036000291439']
+    """
@@ -1,5 +1,12 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 from store_backend import StoreBackend
-from barcode import BarcodeProcessor
+from barcode import BarcodeProcessor, ScanStats
+from scanlog import PackedScanReader, is_packed_scan_log, line_aligned_chunks
+from pipeline import read_scans, decode_scans, classify, resolve, resolve_batch, apply_to_cart
+from follow import ScanFileFollower
 from cart import ShoppingCart
 from member import Member
 
@@ -10,57 +17,147 @@ class POSSystem:
         inventory_path: str,
         membership_path: str,
         coupon_path: str,
+        decode_cache_size: int = 0,
+        commit_interval: float = 0.0,
+        write_behind: bool = False,
+        backend: StoreBackend = None,
     ):
-        self.backend = StoreBackend(inventory_path, membership_path, coupon_path)
-        self.barcode_processor = BarcodeProcessor()
+        """
+        Args:
+            inventory_path (str): The inventory CSV.
+            membership_path (str): The memberships CSV.
+            coupon_path (str): The coupons CSV.
+            decode_cache_size (int, optional): Size of the barcode decode
+                cache. Defaults to 0 (no cache).
+            commit_interval (float, optional): Group commit window in seconds:
+                checkouts are applied in memory, and the inventory and
+                memberships are saved at most once per window (on the first
+                checkout after it ends, or on flush/close). Defaults to 0
+                (save on every checkout).
+            write_behind (bool, optional): Save from a background thread, so
+                checkouts never wait for the disk (see StoreBackend). Call
+                close() before shutting down. Defaults to False.
+            backend (StoreBackend, optional): Use this backend (e.g. one from
+                sqlite_store.open_backend) instead of loading the CSVs; the
+                paths and write_behind are then ignored.
+        """
+        if backend is None:
+            backend = StoreBackend(inventory_path, membership_path, coupon_path,
+                                   write_behind=write_behind)
+        self.backend = backend
+        self.barcode_processor = BarcodeProcessor(decode_cache_size)
         self.cart = ShoppingCart()
+        self.scan_stats = ScanStats()
+        self.commit_interval = commit_interval
+        self._pending_checkouts = 0
+        self._last_flush = time.monotonic()
 
     def process_barcodes(self, barcode_file_path: str) -> None:
         """For each line in the barcode file (length 95 strings), we will need to do the following:
-        1. Validate the barcode
-        2. If it doesn't work, flip the barcode and try again
-        3.1 If it doesn't work, just skip the barcode
-        3.2 If it does work, convert the barcode to 12 digits (and continue to step 4)
-        4. Identify the type of the barcode (item, coupon, or membership)
-        5. Process the barcode based on its type (update the shopping cart instance)
+        1. Decode the barcode (its orientation is detected, so flipped scans are decoded reversed)
+        2.1 If it doesn't decode, just skip the barcode
+        2.2 If it does, continue with its 12 digits
+        3. Identify the type of the barcode (item, coupon, or membership)
+        4. Process the barcode based on its type (update the shopping cart instance)
+
+        Packed binary scan logs (see scanlog.py) are read through a memory
+        mapping instead. Statistics for the file (including how many scans
+        were flipped) are available from get_scan_stats() afterwards.
+
+        The whole file is one batch: its barcodes are looked up with the
+        backend's bulk lookups.
+        """
+        self.process_scans(read_scans(barcode_file_path), batch=True)
+
+    def process_scans(self, scans, batch: bool = False) -> None:
+        """Run raw scans from any iterable (lines of a file or socket, 95-bit
+        integers, ...) through the pipeline stages in pipeline.py and into
+        the cart, one scan at a time.
+
+        The decoder and backend used are self.barcode_processor and
+        self.backend, so either can be replaced on the instance.
+
+        Args:
+            scans (Iterable[str or int]): Binary strings or 95-bit integers.
+            batch (bool, optional): The scans are a finite batch: decode them
+                all, then look them up with one bulk lookup per barcode type
+                before filling the cart. Defaults to False.
+        """
+        self.scan_stats = ScanStats()
+        numeric_barcodes = decode_scans(scans, self.barcode_processor, self.scan_stats)
+        classified = classify(numeric_barcodes, self._identify_barcode_type)
+        resolver = resolve_batch if batch else resolve
+        apply_to_cart(resolver(classified, self.backend), self.cart)
+
+    def follow_barcodes(self, barcode_file_paths, offsets_path: str = None,
+                        stop=None, poll_interval: float = 0.01) -> None:
+        """Follow growing lane scan files, adding each appended scan to the
+        cart as soon as its line is complete. Blocks until stop is set.
+
+        Args:
+            barcode_file_paths (Iterable[str]): The text scan files to follow.
+            offsets_path (str, optional): JSON file remembering how far each
+                scan file was processed, so a restart resumes there.
+            stop (threading.Event, optional): Stop following once set.
+            poll_interval (float, optional): Seconds between polls of idle
+                files. Defaults to 0.01.
+        """
+        follower = ScanFileFollower(barcode_file_paths, offsets_path, poll_interval)
+        self.process_scans(read_scans(follower.follow(stop)))
+
+    def process_barcodes_parallel(self, barcode_file_path: str, workers: int = None,
+                                  chunks_per_worker: int = 4) -> None:
+        """Like process_barcodes, but decode and classify the file in worker
+        processes.
+
+        The file is split into chunks (line-aligned byte ranges for text logs,
+        record ranges for packed logs). Decoding is pure CPU work, so the
+        chunks are spread over a process pool; their results are merged back
+        in file order before any StoreBackend lookup or cart update happens
+        in this process.
+
+        Args:
+            barcode_file_path (str): The text or packed scan log to process.
+            workers (int, optional): The number of worker processes. Defaults
+                to the number of CPUs; 1 decodes in this process.
+            chunks_per_worker (int, optional): Chunks per worker, so that
+                faster workers pick up more of the file. Defaults to 4.
         """
-        with open(barcode_file_path, 'r') as f:
-            for line in f:
-                binary_barcode = line.strip()
-
-                if len(binary_barcode) != self.barcode_processor.BARCODE_LENGTH:
-                    continue
-                numeric = None
-                try:
-                    self.barcode_processor.validate_barcode(binary_barcode)
-                    numeric = self.barcode_processor.convert_to_12_digits(binary_barcode)
-                except ValueError:
-                    flipped = self.barcode_processor.flip_barcode(binary_barcode)
-                    try:
-                        self.barcode_processor.validate_barcode(flipped)
-                        numeric = self.barcode_processor.convert_to_12_digits(flipped)
-                    except ValueError:
-                        continue
-                if numeric is None:
-                    continue
-                try:
-                    barcode_type = self._identify_barcode_type(numeric)
-                except ValueError:
-                    continue
-
-                if barcode_type == 'product':
-                    product = self.backend.get_product(numeric)
-                    if product:
-                        self.cart.add_item(product)
-                elif barcode_type == 'coupon':
-                    coupon = self.backend.get_coupon(numeric)
-                    if coupon:
-                        self.cart.add_coupon(coupon)
-                elif barcode_type == 'membership':
-                    member = self.backend.get_member(numeric)
-                    if member:
-                        self.cart.add_membership(member)
-            pass
+        workers = workers or os.cpu_count() or 1
+        chunk_count = workers * chunks_per_worker
+        cache = self.barcode_processor.cache_info()
+        cache_size = cache.maxsize if cache is not None else 0
+        if is_packed_scan_log(barcode_file_path):
+            with PackedScanReader(barcode_file_path) as reader:
+                count = len(reader)
+            bounds = [count * i // chunk_count for i in range(chunk_count + 1)]
+            chunks = [(barcode_file_path, start, end, True, cache_size)
+                      for start, end in zip(bounds, bounds[1:]) if start < end]
+        else:
+            chunks = [(barcode_file_path, start, end, False, cache_size)
+                      for start, end in line_aligned_chunks(barcode_file_path, chunk_count)]
+
+        if workers == 1:
+            self._merge_chunks(map(_decode_chunk, chunks))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                self._merge_chunks(executor.map(_decode_chunk, chunks))
+
+    def _merge_chunks(self, decoded_chunks) -> None:
+        """Apply decoded chunks to the cart, in order.
+
+        Args:
+            decoded_chunks (Iterable[tuple]): (classified, stats) pairs, as
+                returned by _decode_chunk, in file order.
+        """
+        self.scan_stats = ScanStats()
+
+        def merged():
+            for classified, stats in decoded_chunks:
+                self.scan_stats.merge(stats)
+                yield from classified
+
+        apply_to_cart(resolve_batch(merged(), self.backend), self.cart)
 
     def scan(self, barcode_file_path: str):
         """Scan barcodes by processing them correctly."""
@@ -68,7 +165,8 @@ class POSSystem:
         pass
 
 
-    def _identify_barcode_type(self, numeric_barcode: str) -> str:
+    @staticmethod
+    def _identify_barcode_type(numeric_barcode: str) -> str:
         """Given a barcode (length 12 string), identify the type of the barcode.
 
         Args:
@@ -101,23 +199,96 @@ class POSSystem:
         Returns:
             float: The total price of the cart.
         """
-        total = self.cart.calculate_total()
-        member = self.cart.get_membership()
+        total = self._apply_checkout(self.cart)
+        if time.monotonic() - self._last_flush >= self.commit_interval:
+            self.flush()
+        return total
+        pass
+
+    def checkout_many(self, carts) -> list[float]:
+        """Check out many carts as one group commit: every transaction is
+        applied in memory, then the inventory and memberships are saved once.
+
+        Args:
+            carts (Iterable[ShoppingCart]): The carts to check out.
+        Returns:
+            list[float]: The total price of each cart, in order.
+        """
+        totals = [self._apply_checkout(cart) for cart in carts]
+        self.flush()
+        return totals
+
+    def _apply_checkout(self, cart: ShoppingCart) -> float:
+        """Apply a cart's transaction to the in-memory databases.
+
+        Args:
+            cart (ShoppingCart): The cart to check out.
+        Returns:
+            float: The total price of the cart.
+        """
+        total = cart.calculate_total()
+        member = cart.get_membership()
         if member:
             self.backend.add_member_points(member, 10)
-        for product in self.cart.get_items():
-            self.backend.decrease_product_quantity(product, 1)
-        self.backend.save_inventory()
-        self.backend.save_memberships()
-
+        for line in cart.get_lines():
+            self.backend.decrease_product_quantity(line.product, line.quantity)
+        self._pending_checkouts += 1
         return total
-        pass
+
+    def flush(self) -> None:
+        """Save the inventory and memberships if any checkout isn't saved yet."""
+        if self._pending_checkouts:
+            self.backend.save_inventory()
+            self.backend.save_memberships()
+            self._pending_checkouts = 0
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        """Save any pending checkouts. Call before shutting down when
+        commit_interval or write_behind is set."""
+        self.flush()
+        self.backend.close()
+
+    def get_scan_stats(self) -> ScanStats:
+        """Get the decode statistics of the last processed scan file.
+
+        Returns:
+            ScanStats: Counts of scanned, decoded, flipped and invalid barcodes.
+        """
+        return self.scan_stats
 
     def get_current_cart(self) -> ShoppingCart:
         return self.cart
         pass
 
 
+def _decode_chunk(chunk: tuple) -> tuple:
+    """Decode and classify one chunk of a scan log. Runs in a worker process.
+
+    Args:
+        chunk (tuple): (path, start, end, packed, cache_size), where start and
+            end are byte offsets for text logs and record indices for packed
+            logs, and cache_size sizes the worker's decode cache.
+    Returns:
+        tuple: (classified, stats) where classified lists the (numeric,
+            barcode_type) pairs of the chunk's usable scans in order.
+    """
+    path, start, end, packed, cache_size = chunk
+    processor = BarcodeProcessor(cache_size)
+    stats = ScanStats()
+    if packed:
+        with PackedScanReader(path) as reader:
+            numeric_barcodes = decode_scans(reader.values(start, end), processor, stats)
+            classified = list(classify(numeric_barcodes, POSSystem._identify_barcode_type))
+    else:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            lines = f.read(end - start).decode('ascii', 'replace').splitlines()
+        numeric_barcodes = decode_scans(read_scans(lines), processor, stats)
+        classified = list(classify(numeric_barcodes, POSSystem._identify_barcode_type))
+    return classified, stats
+
+
 def pos_doctests(self):
     """Function to run the doctests for the POSSystem class.
 
@@ -144,9 +315,10 @@ def pos_doctests(self):
     True
     >>> cart.get_membership().return_membership_type() == 'Gold'
     True
-    >>> import math
-    >>> math.isclose(pos.checkout(), 0.415, abs_tol=0.001)
+    >>> pos.get_scan_stats().get_invalid() == 0
     True
+    >>> pos.checkout()
+    0.41
     >>> updated_memerships_exists = False
     >>> try:
     ...     f = open('db-data/updated_memberships.csv')
@@ -175,4 +347,45 @@ def pos_doctests(self):
     ...         calculated_types.append(barcode_type)
     >>> expected_types == calculated_types
     True
+    >>> parallel_pos = POSSystem(
+    ...     'db-data/inventory.csv',
+    ...     'db-data/memberships.csv',
+    ...     'db-data/coupons.csv'
+    ... )
+    >>> parallel_pos.process_barcodes_parallel('cart-data/scan_1_binary.txt', workers=2)
+    >>> [item.get_name() for item in parallel_pos.get_current_cart().get_items()] == item_names
+    True
+    >>> parallel_pos.get_scan_stats().decoded == pos.get_scan_stats().decoded
+    True
+    >>> batch_pos = POSSystem(
+    ...     'db-data/inventory.csv',
+    ...     'db-data/memberships.csv',
+    ...     'db-data/coupons.csv',
+    ...     commit_interval=60
+    ... )
+    >>> batch_pos.process_barcodes('cart-data/scan_1_binary.txt')
+    >>> apple = [item for item in batch_pos.get_current_cart().get_items() if item.get_name() == 'Apple'][0]
+    >>> stock = apple.get_quantity()
+    >>> totals = batch_pos.checkout_many([batch_pos.get_current_cart()] * 3)
+    >>> len(totals), apple.get_quantity() == stock - 3
+    (3, True)
+    >>> batch_pos.checkout() == totals[0]
+    True
+    >>> batch_pos._pending_checkouts
+    1
+    >>> batch_pos.close()
+    >>> batch_pos._pending_checkouts
+    0
+    >>> behind_pos = POSSystem(
+    ...     'db-data/inventory.csv',
+    ...     'db-data/memberships.csv',
+    ...     'db-data/coupons.csv',
+    ...     write_behind=True
+    ... )
+    >>> behind_pos.process_barcodes('cart-data/scan_1_binary.txt')
+    >>> behind_pos.checkout() == totals[0]
+    True
+    >>> behind_pos.close()
+    >>> behind_pos.backend._dirty
+    0
     """
@@ -1,14 +1,26 @@
+from money import to_cents, from_cents
+
+
 class Product:
     def __init__(
         self, numeric_barcode: str, name: str, price: float, quantity: int
     ):
         self.numeric_barcode = numeric_barcode
         self.name = name
-        self.price = float(price)
+        self.price_cents = to_cents(price)
         self.quantity = quantity
 
         pass
 
+    @property
+    def price(self) -> float:
+        """The price in dollars (stored in cents, see money.py)."""
+        return from_cents(self.price_cents)
+
+    @price.setter
+    def price(self, price: float):
+        self.price_cents = to_cents(price)
+
     def decrease_quantity(self, quantity: int):
         """Decrease the quantity of the product by the specified quantity.
 
@@ -72,6 +84,14 @@ class Product:
         return float(self.price)
         pass
 
+    def get_unit_price_cents(self) -> int:
+        """Get the unit price of the product in cents.
+
+        Returns:
+            int: The price of a single unit of the product, in cents.
+        """
+        return self.price_cents
+
 
 def product_doctests():
     """Function to run the doctests for the Product class.
@@ -83,6 +103,11 @@ def product_doctests():
     True
     >>> p.get_price() == 10.0
     True
+    >>> p.get_unit_price_cents()
+    1000
+    >>> p.price = 0.995
+    >>> p.get_unit_price_cents(), p.get_price()
+    (100, 1.0)
     >>> p.get_quantity() == 5
     True
     >>> p.is_in_stock()
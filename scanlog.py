@@ -0,0 +1,255 @@
+"""Packed binary scan logs.
+
+A text scan log spends 96 bytes (95 ASCII bits and a newline) on every scan.
+The packed format stores each 95-bit scan in 12 bytes, most significant bit
+first with one trailing pad bit, after a 16 byte header:
+
+    magic (4 bytes) | version (uint16) | record size (uint16) | count (uint64)
+"""
+import mmap
+import os
+import struct
+
+from barcode import BarcodeProcessor
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by PackedScanReader.bit_matrix
+    np = None
+
+MAGIC = b'UPCS'
+VERSION = 1
+RECORD_SIZE = 12
+HEADER = struct.Struct('<4sHHQ')
+BARCODE_LENGTH = BarcodeProcessor.BARCODE_LENGTH
+
+
+def pack_barcode(binary_barcode: str) -> bytes:
+    """Given a barcode (length 95 string), pack it into a 12 byte record.
+
+    Args:
+        binary_barcode (str): The barcode to pack.
+    Returns:
+        bytes: The packed record.
+    Raises:
+        ValueError: If the barcode isn't 95 binary characters.
+    """
+    if len(binary_barcode) != BARCODE_LENGTH or binary_barcode.strip('01'):
+        raise ValueError("Only 95 bit binary barcodes can be packed")
+    return (int(binary_barcode, 2) << 1).to_bytes(RECORD_SIZE, 'big')
+
+
+def unpack_barcode(record) -> str:
+    """Given a 12 byte record, unpack it into a barcode (length 95 string).
+
+    Args:
+        record (bytes-like): The packed record.
+    Returns:
+        str: The barcode.
+    """
+    return format(int.from_bytes(record, 'big') >> 1, '095b')
+
+
+def write_packed_scans(binary_barcodes, packed_path: str) -> int:
+    """Write barcodes to a packed scan log. Entries that aren't 95 binary
+    characters (blank lines, truncated scans) are skipped.
+
+    Args:
+        binary_barcodes (Iterable[str]): The barcodes to write.
+        packed_path (str): The packed scan log to create.
+    Returns:
+        int: The number of records written.
+    """
+    count = 0
+    with open(packed_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE, 0))
+        for binary_barcode in binary_barcodes:
+            binary_barcode = binary_barcode.strip()
+            if len(binary_barcode) != BARCODE_LENGTH or binary_barcode.strip('01'):
+                continue
+            f.write((int(binary_barcode, 2) << 1).to_bytes(RECORD_SIZE, 'big'))
+            count += 1
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE, count))
+    return count
+
+
+def text_to_packed(text_path: str, packed_path: str) -> int:
+    """Convert a text scan log (one 95 bit barcode per line) to a packed one.
+
+    Args:
+        text_path (str): The text scan log to read.
+        packed_path (str): The packed scan log to create.
+    Returns:
+        int: The number of records written.
+    """
+    with open(text_path, 'r') as f:
+        return write_packed_scans(f, packed_path)
+
+
+def packed_to_text(packed_path: str, text_path: str) -> int:
+    """Convert a packed scan log back to a text one.
+
+    Args:
+        packed_path (str): The packed scan log to read.
+        text_path (str): The text scan log to create.
+    Returns:
+        int: The number of lines written.
+    """
+    with PackedScanReader(packed_path) as reader, open(text_path, 'w') as f:
+        for binary_barcode in reader:
+            f.write(binary_barcode + '\n')
+        return len(reader)
+
+
+def line_aligned_chunks(text_path: str, chunks: int) -> list[tuple[int, int]]:
+    """Split a text scan log into byte ranges that start and end on line
+    boundaries, so each range can be decoded independently.
+
+    Args:
+        text_path (str): The text scan log to split.
+        chunks (int): The number of ranges wanted (fewer may be returned for
+            small files).
+    Returns:
+        list[tuple[int, int]]: (start, end) byte offsets, in file order.
+    """
+    size = os.path.getsize(text_path)
+    bounds = [0]
+    with open(text_path, 'rb') as f:
+        for i in range(1, chunks):
+            target = size * i // chunks
+            if target <= bounds[-1]:
+                continue
+            # Move to the start of the first line beginning at or after target
+            f.seek(target - 1)
+            f.readline()
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def is_packed_scan_log(path: str) -> bool:
+    """Check whether a file starts with the packed scan log header.
+
+    Args:
+        path (str): The file to check.
+    Returns:
+        bool: True if the file is a packed scan log.
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class PackedScanReader:
+    """Memory-mapped reader for packed scan logs.
+
+    Records are read straight from the mapping, so nothing is copied until a
+    record is looked at, and pages are loaded by the OS on demand.
+    """
+
+    def __init__(self, packed_path: str):
+        with open(packed_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            self._mmap.close()
+            raise ValueError(f"{packed_path} is not a packed scan log")
+        if HEADER.size + count * RECORD_SIZE > len(self._mmap):
+            self._mmap.close()
+            raise ValueError(f"{packed_path} is truncated")
+        self._count = count
+        self._records = memoryview(self._mmap)[HEADER.size:HEADER.size + count * RECORD_SIZE]
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index: int) -> str:
+        if not -self._count <= index < self._count:
+            raise IndexError("record index out of range")
+        start = (index % self._count) * RECORD_SIZE
+        return unpack_barcode(self._records[start:start + RECORD_SIZE])
+
+    def __iter__(self):
+        for value in self.values():
+            yield format(value, '095b')
+
+    def values(self, start: int = 0, stop: int = None):
+        """Iterate over the records as 95-bit integers (first bit most
+        significant), ready for BarcodeProcessor.decode_value.
+
+        Args:
+            start (int, optional): The first record to read. Defaults to 0.
+            stop (int, optional): The record to stop before. Defaults to the
+                end of the log.
+        Yields:
+            int: The barcode bits of each record.
+        """
+        records = self._records
+        stop = self._count if stop is None else min(stop, self._count)
+        for start in range(start * RECORD_SIZE, stop * RECORD_SIZE, RECORD_SIZE):
+            yield int.from_bytes(records[start:start + RECORD_SIZE], 'big') >> 1
+
+    def bit_matrix(self):
+        """Get every record as an (N, 95) array of 0/1 bits, ready for
+        BarcodeProcessor.decode_batch_array. Requires numpy.
+
+        Returns:
+            numpy.ndarray: The barcode bits, one barcode per row.
+        """
+        if np is None:
+            raise ImportError("bit_matrix requires numpy")
+        packed = np.frombuffer(self._records, dtype=np.uint8).reshape(-1, RECORD_SIZE)
+        return np.unpackbits(packed, axis=1, count=BARCODE_LENGTH)
+
+    def close(self):
+        self._records.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def scanlog_doctests():
+    """Function to run the doctests for the packed scan log format.
+
+    >>> import os, tempfile
+    >>> scanner = BarcodeProcessor()
+    >>> binary = scanner.encode('252109613999')
+    >>> len(pack_barcode(binary))
+    12
+    >>> unpack_barcode(pack_barcode(binary)) == binary
+    True
+    >>> folder = tempfile.mkdtemp()
+    >>> text_path = os.path.join(folder, 'scan.txt')
+    >>> packed_path = os.path.join(folder, 'scan.bin')
+    >>> with open(text_path, 'w') as f:
+    ...     _ = f.write(binary + '\\n' + binary[::-1] + '\\n\\n')
+    >>> text_to_packed(text_path, packed_path)
+    2
+    >>> is_packed_scan_log(packed_path), is_packed_scan_log(text_path)
+    (True, False)
+    >>> os.path.getsize(packed_path)
+    40
+    >>> with PackedScanReader(packed_path) as reader:
+    ...     [scanner.decode_value(value).digits for value in reader.values()]
+    ['252109613999', '252109613999']
+    >>> with PackedScanReader(packed_path) as reader:
+    ...     reader[-1] == binary[::-1]
+    True
+    >>> with PackedScanReader(packed_path) as reader:
+    ...     len(list(reader.values(1)))
+    1
+    >>> packed_to_text(packed_path, text_path)
+    2
+    >>> line_aligned_chunks(text_path, 2)
+    [(0, 96), (96, 192)]
+    >>> line_aligned_chunks(text_path, 10)
+    [(0, 96), (96, 192)]
+    >>> with open(text_path) as f:
+    ...     f.read().split() == [binary, binary[::-1]]
+    True
+    """
@@ -0,0 +1,456 @@
+"""SQLite storage engine for StoreBackend.
+
+The CSV databases in database.py load every row into dicts at startup. The
+classes here keep the rows in a SQLite file instead (WAL mode, barcode
+primary keys) and only build Product and Member objects for the barcodes a
+lane actually scans, so startup doesn't depend on the size of the catalog
+or member base. They have the same methods as the CSV databases, so
+StoreBackend and its write-behind flusher use them unchanged:
+
+    backend = open_backend('db-data/store.db')
+
+Inventory and points changes are kept as pending deltas, like the CSV
+journals, and saved with one batched executemany per table.
+
+Usage (from the root folder of the project), to import the CSVs:
+    python sqlite_store.py DATABASE INVENTORY MEMBERSHIPS COUPONS
+"""
+import argparse
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from product import Product
+from member import Member
+from csvload import MEMBER_TIERS, COUPON_TYPES, iter_rows
+from coupon import current_day
+from journal import Journal, merge_deltas, keep_on_failure
+from store_backend import StoreBackend
+
+MAX_PARAMETERS = 500  # barcodes per IN query, under SQLite's variable limit
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    barcode TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    quantity INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS members (
+    barcode TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    points REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coupons (
+    barcode TEXT PRIMARY KEY,
+    expiration TEXT NOT NULL,
+    discount_type TEXT NOT NULL,
+    discount_value REAL NOT NULL,
+    min_purchase REAL NOT NULL,
+    description TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS coupons_by_expiration ON coupons (expiration);
+"""
+
+class SQLiteStore:
+    def __init__(self, path: str):
+        """Open (or create) a store database.
+
+        Args:
+            path (str): The SQLite file.
+        """
+        self.path = path
+        # The write-behind flusher saves from its own thread; the lock
+        # serializes every use of the connection
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+
+    def fetch_one(self, sql: str, parameters: tuple):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchone()
+
+    def fetch_by_barcode(self, columns: str, table: str, barcodes: list) -> list:
+        """Fetch the rows of many barcodes with IN queries, holding the
+        connection once.
+
+        Args:
+            columns (str): The columns to select, after the barcode.
+            table (str): The table.
+            barcodes (list[str]): The barcodes, without duplicates.
+        Returns:
+            list[tuple]: (barcode, *columns) rows of the barcodes found.
+        """
+        rows = []
+        with self.lock:
+            for start in range(0, len(barcodes), MAX_PARAMETERS):
+                chunk = barcodes[start:start + MAX_PARAMETERS]
+                rows += self.connection.execute(
+                    f"SELECT barcode, {columns} FROM {table} WHERE barcode IN ({', '.join('?' * len(chunk))})",
+                    chunk).fetchall()
+        return rows
+
+    def count(self, table: str) -> int:
+        """Count the rows of a table."""
+        return self.fetch_one(f"SELECT COUNT(*) FROM {table}", ())[0]
+
+    def execute_many(self, sql: str, rows):
+        """Run one statement over many rows in a single transaction."""
+        with self.lock:
+            connection = self.connection
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(sql, rows)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def import_csv(self, inventory_path: str = None, membership_path: str = None,
+                   coupon_path: str = None):
+        """Import the CSV files database.py reads (and the journals saved
+        against them), replacing rows with the same barcodes. Rows are
+        streamed, so the files don't have to fit in memory.
+
+        Args:
+            inventory_path (str, optional): An inventory CSV.
+            membership_path (str, optional): A memberships CSV.
+            coupon_path (str, optional): A coupons CSV.
+        """
+        if inventory_path:
+            self.execute_many("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?)",
+                              ((barcode, name, float(price), int(quantity))
+                               for barcode, name, price, quantity in _read_rows(inventory_path, 4)))
+            self.execute_many(SQLiteProductDatabase.UPDATE_QUANTITY, _journal_rows(inventory_path))
+        if membership_path:
+            self.execute_many("INSERT OR REPLACE INTO members VALUES (?, ?, ?, ?)",
+                              ((barcode, name, tier, float(points))
+                               for barcode, name, tier, points in _read_rows(membership_path, 4)
+                               if tier in MEMBER_TIERS))
+            self.execute_many(SQLiteMemberDatabase.UPDATE_POINTS, _journal_rows(membership_path))
+        if coupon_path:
+            self.execute_many("INSERT OR REPLACE INTO coupons VALUES (?, ?, ?, ?, ?, ?)",
+                              ((barcode, expiration, discount_type, float(value), float(minimum), description)
+                               for barcode, expiration, discount_type, value, minimum, description
+                               in _read_rows(coupon_path, 6) if discount_type in COUPON_TYPES))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def _read_rows(path: str, width: int):
+    """Yield the fields of each data row with the given number of fields."""
+    for _, parts in iter_rows(path):
+        if len(parts) == width:
+            yield parts
+
+
+def _journal_rows(snapshot_path: str):
+    """Yield (delta, barcode) rows for the journal saved against a CSV."""
+    for deltas in Journal(snapshot_path).replay():
+        for barcode, delta in deltas.items():
+            yield delta, barcode
+
+
+class SQLiteProductDatabase:
+    UPDATE_QUANTITY = "UPDATE products SET quantity = MAX(quantity + ?, 0) WHERE barcode = ?"
+
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+        # Products are built on first lookup and kept, so a barcode always
+        # maps to the same object; only the scanned SKUs are ever in memory
+        self._products = {}
+        self._deltas = {}
+        self._failed = []  # deltas of saves that failed, for the next save
+
+    def get_product(self, numeric_barcode: str) -> Product:
+        """Given a barcode, return the Product object associated with that
+        barcode.
+
+        Args:
+            numeric_barcode (str): 12 digit numeric barcode
+        Returns:
+            Product with barcode (None if not found)
+        """
+        product = self._products.get(numeric_barcode)
+        if product is not None:
+            return product
+        row = self.store.fetch_one(
+            "SELECT name, price, quantity FROM products WHERE barcode = ?", (numeric_barcode,))
+        if row is None:
+            return None
+        name, price, quantity = row
+        product = self._products[numeric_barcode] = Product(numeric_barcode, name, price, quantity)
+        return product
+
+    def get_products(self, numeric_barcodes) -> dict:
+        """Look up many barcodes at once, with one query for the ones that
+        aren't in memory yet.
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            dict: The Product of each barcode found, by barcode.
+        """
+        known = self._products
+        missing = [barcode for barcode in dict.fromkeys(numeric_barcodes) if barcode not in known]
+        for barcode, name, price, quantity in self.store.fetch_by_barcode(
+                "name, price, quantity", "products", missing):
+            known[barcode] = Product(barcode, name, price, quantity)
+        return {barcode: known[barcode] for barcode in numeric_barcodes if barcode in known}
+
+    def decrement_inventory(self, numeric_barcode: str, quantity: int):
+        """Given a barcode and a quantity to decrease by, decrement the
+        inventory of the product associated with that barcode by the quantity.
+
+        Args:
+            numeric_barcode (str): 12 digit numeric barcode
+            quantity (int): The quantity to decrease by.
+        """
+        product = self.get_product(numeric_barcode)
+        if product is not None:
+            before = product.get_quantity()
+            product.decrease_quantity(quantity)
+            delta = product.get_quantity() - before
+            if delta:
+                self._deltas[numeric_barcode] = self._deltas.get(numeric_barcode, 0) + delta
+
+    def save_inventory(self):
+        """Save the pending inventory changes."""
+        self.prepare_save()()
+
+    def prepare_save(self):
+        """Capture the pending changes without writing them (see
+        ProductDatabase.prepare_save).
+
+        Returns:
+            Callable[[], None]: Writes the captured changes.
+        """
+        deltas, self._deltas = self._deltas, {}
+        while self._failed:
+            merge_deltas(deltas, self._failed.pop())
+        if not deltas:
+            return lambda: None
+        rows = [(delta, barcode) for barcode, delta in deltas.items()]
+        return keep_on_failure(lambda: self.store.execute_many(self.UPDATE_QUANTITY, rows),
+                               deltas, self._failed)
+
+
+class SQLiteMemberDatabase:
+    UPDATE_POINTS = "UPDATE members SET points = points + ? WHERE barcode = ?"
+
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+        self._members = {}
+        self._deltas = {}
+        self._failed = []
+
+    def get_member(self, numeric_barcode: str) -> Member:
+        """Given a barcode, return the Member object associated with that
+        barcode.
+
+        Args:
+            numeric_barcode (str): 12 digit numeric barcode
+        Returns:
+            Member with barcode (None if not found)
+        """
+        member = self._members.get(numeric_barcode)
+        if member is not None:
+            return member
+        row = self.store.fetch_one(
+            "SELECT name, tier, points FROM members WHERE barcode = ?", (numeric_barcode,))
+        if row is None:
+            return None
+        name, tier, points = row
+        member = self._members[numeric_barcode] = MEMBER_TIERS[tier](numeric_barcode, name, points)
+        return member
+
+    def get_members(self, numeric_barcodes) -> dict:
+        """Look up many barcodes at once, with one query for the ones that
+        aren't in memory yet.
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            dict: The Member of each barcode found, by barcode.
+        """
+        known = self._members
+        missing = [barcode for barcode in dict.fromkeys(numeric_barcodes) if barcode not in known]
+        for barcode, name, tier, points in self.store.fetch_by_barcode(
+                "name, tier, points", "members", missing):
+            known[barcode] = MEMBER_TIERS[tier](barcode, name, points)
+        return {barcode: known[barcode] for barcode in numeric_barcodes if barcode in known}
+
+    def add_points(self, numeric_barcode: str, points: int):
+        """Given a barcode, add the specified number of points to the member
+        associated with that barcode.
+
+        Args:
+            numeric_barcode (str): The barcode of the member to add points to.
+            points (int): The number of points to add.
+        """
+        member = self.get_member(numeric_barcode)
+        if member:
+            member.add_points(points)
+            self._deltas[numeric_barcode] = self._deltas.get(numeric_barcode, 0) + points
+
+    def save_memberships(self):
+        """Save the pending points changes."""
+        self.prepare_save()()
+
+    def prepare_save(self):
+        """Capture the pending changes without writing them (see
+        ProductDatabase.prepare_save).
+
+        Returns:
+            Callable[[], None]: Writes the captured changes.
+        """
+        deltas, self._deltas = self._deltas, {}
+        while self._failed:
+            merge_deltas(deltas, self._failed.pop())
+        if not deltas:
+            return lambda: None
+        rows = [(delta, barcode) for barcode, delta in deltas.items()]
+        return keep_on_failure(lambda: self.store.execute_many(self.UPDATE_POINTS, rows),
+                               deltas, self._failed)
+
+
+class SQLiteCouponDatabase:
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+
+    def get_coupon(self, numeric_barcode: str):
+        """Given a barcode, return the Coupon object associated with that barcode."""
+        row = self.store.fetch_one(
+            "SELECT expiration, discount_type, discount_value, min_purchase, description "
+            "FROM coupons WHERE barcode = ?", (numeric_barcode,))
+        if row is None:
+            return None
+        return self._build(numeric_barcode, *row)
+
+    def get_coupons(self, numeric_barcodes) -> dict:
+        """Look up many barcodes at once, with one query.
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            dict: The Coupon of each barcode found, by barcode.
+        """
+        rows = self.store.fetch_by_barcode(
+            "expiration, discount_type, discount_value, min_purchase, description",
+            "coupons", list(dict.fromkeys(numeric_barcodes)))
+        return {row[0]: self._build(*row) for row in rows}
+
+    def purge_expired(self, day: date = None) -> int:
+        """Delete every coupon that expired before a day, through the
+        expiration index (ISO dates sort as text).
+
+        Args:
+            day (date, optional): The first day to keep. Defaults to today.
+        Returns:
+            int: The number of coupons deleted.
+        """
+        with self.store.lock:
+            cursor = self.store.connection.execute(
+                "DELETE FROM coupons WHERE expiration < ?", ((day or current_day()).isoformat(),))
+        return cursor.rowcount
+
+    @staticmethod
+    def _build(numeric_barcode, expiration, discount_type, discount_value, min_purchase, description):
+        expiration = datetime.strptime(expiration, '%Y-%m-%d')
+        return COUPON_TYPES[discount_type](numeric_barcode, expiration, min_purchase, description, discount_value)
+
+
+def open_backend(path: str, **options) -> StoreBackend:
+    """Open a StoreBackend on a SQLite store.
+
+    Args:
+        path (str): The SQLite file (see SQLiteStore.import_csv to fill it).
+        **options: Passed on to StoreBackend (write_behind, ...).
+    Returns:
+        StoreBackend: The backend.
+    """
+    store = SQLiteStore(path)
+    return StoreBackend.from_databases(SQLiteProductDatabase(store), SQLiteMemberDatabase(store),
+                                       SQLiteCouponDatabase(store), **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the store CSVs into a SQLite database.")
+    parser.add_argument('database')
+    parser.add_argument('inventory')
+    parser.add_argument('memberships')
+    parser.add_argument('coupons')
+    args = parser.parse_args()
+
+    store = SQLiteStore(args.database)
+    store.import_csv(args.inventory, args.memberships, args.coupons)
+    print(f"{store.count('products')} products, {store.count('members')} members, "
+          f"{store.count('coupons')} coupons")
+    store.close()
+
+
+def sqlite_store_doctests():
+    """Function to run the doctests for the SQLite storage engine.
+
+    Note that you should run this doctest at the root folder of the project
+    (same level as main.py)
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'store.db')
+    >>> store = SQLiteStore(path)
+    >>> store.import_csv('db-data/inventory.csv', 'db-data/memberships.csv', 'db-data/coupons.csv')
+    >>> store.fetch_one("PRAGMA journal_mode", ())
+    ('wal',)
+    >>> store.close()
+    >>> backend = open_backend(path)
+    >>> milk_barcode = '012345678905'
+    >>> milk = backend.get_product(milk_barcode)
+    >>> milk.get_name(), milk.get_price(), milk.get_quantity()
+    ('Milk', 2.99, 150)
+    >>> backend.get_product(milk_barcode) is milk
+    True
+    >>> backend.get_product('000000000000') is None
+    True
+    >>> backend.decrease_product_quantity(milk, 10)
+    >>> jane = backend.get_member('257274767454')
+    >>> jane.get_name(), jane.get_points() == 1200
+    ('Jane Doe', True)
+    >>> backend.add_member_points(jane, 100)
+    >>> type(backend.get_coupon('149234073227')).__name__
+    'PercentDiscountCoupon'
+    >>> products = backend.get_products(['012345678912', milk_barcode, '000000000000', '012345678912'])
+    >>> products[1] is milk, products[2], products[0] is products[3], products[0].get_name()
+    (True, None, True, 'Apple')
+    >>> [member.get_name() for member in backend.get_members(['257274767454'])]
+    ['Jane Doe']
+    >>> [type(coupon).__name__ for coupon in backend.get_coupons(['149234073227', '100000000000'])]
+    ['PercentDiscountCoupon', 'NoneType']
+    >>> backend.save_inventory()
+    >>> backend.save_memberships()
+    >>> reopened = open_backend(path)
+    >>> reopened.get_product(milk_barcode).get_quantity()
+    140
+    >>> reopened.get_member('257274767454').get_points() == 1300
+    True
+    >>> from pos import POSSystem
+    >>> pos = POSSystem(None, None, None, backend=reopened)
+    >>> pos.process_barcodes('cart-data/scan_1_binary.txt')
+    >>> csv_pos = POSSystem('db-data/inventory.csv', 'db-data/memberships.csv', 'db-data/coupons.csv')
+    >>> csv_pos.process_barcodes('cart-data/scan_1_binary.txt')
+    >>> pos.checkout() == csv_pos.checkout()
+    True
+    >>> backend.purge_expired_coupons()
+    0
+    >>> backend.coupon_database.purge_expired(date(2031, 1, 1)), backend.get_coupon('149234073227')
+    (2, None)
+    """
+
+
+if __name__ == '__main__':
+    main()
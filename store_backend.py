@@ -1,4 +1,12 @@
-from database import ProductDatabase, MemberDatabase, CouponDatabase
+import atexit
+import os
+import threading
+
+from database import (ProductDatabase, ColumnarProductDatabase, MappedProductDatabase,
+                      MemberDatabase, LazyMemberDatabase, CouponDatabase)
+from csvload import LoadReport, load_rows, warn_malformed, build_product, build_coupon
+from inventory_snapshot import is_inventory_snapshot
+from watch import FileWatcher
 from product import Product
 from member import Member
 from coupon import Coupon
@@ -7,14 +15,129 @@ from coupon import Coupon
 class StoreBackend:
     """I think we can provide this class fully implemented"""
 
-    def __init__(self, inventory_path: str, membership_path: str, coupon_path: str):
-        self.product_database = ProductDatabase(inventory_path)
-        self.member_database = MemberDatabase(membership_path)
-        self.coupon_database = CouponDatabase(coupon_path)
+    def __init__(
+        self,
+        inventory_path: str,
+        membership_path: str,
+        coupon_path: str,
+        write_behind: bool = False,
+        flush_interval: float = 1.0,
+        flush_threshold: int = 1000,
+        columnar: bool = False,
+        lazy_members: bool = False,
+        watch_interval: float = 0,
+    ):
+        """
+        Args:
+            inventory_path (str): The inventory CSV, or a binary inventory
+                snapshot (see inventory_snapshot.py), which is memory-mapped.
+            membership_path (str): The memberships CSV.
+            coupon_path (str): The coupons CSV.
+            write_behind (bool, optional): Persist from a background thread:
+                save_inventory and save_memberships return immediately, and
+                the changes are written every flush_interval seconds, or
+                sooner once flush_threshold changes are pending. Call
+                flush() to write them now and close() before shutting down
+                (it is also called at interpreter exit). Defaults to False.
+            flush_interval (float, optional): Seconds between background
+                writes. Defaults to 1.0.
+            flush_threshold (int, optional): Pending changes that trigger a
+                background write early. Defaults to 1000.
+            columnar (bool, optional): Keep the inventory in a
+                ColumnarProductDatabase, for large catalogs. Defaults to False.
+            lazy_members (bool, optional): Read members on demand with a
+                LazyMemberDatabase, for large loyalty programs. Defaults to
+                False.
+            watch_interval (float, optional): Check the inventory and coupon
+                files for changes every watch_interval seconds and reload
+                them (see reload). Defaults to 0 (only when reload is
+                called).
+        """
+        if is_inventory_snapshot(inventory_path):
+            product_database_class = MappedProductDatabase
+        elif columnar:
+            product_database_class = ColumnarProductDatabase
+        else:
+            product_database_class = ProductDatabase
+        member_database_class = LazyMemberDatabase if lazy_members else MemberDatabase
+        self._setup(product_database_class(inventory_path), member_database_class(membership_path),
+                    CouponDatabase(coupon_path), write_behind, flush_interval, flush_threshold)
+        # A columnar inventory can't be updated in place, and the save path
+        # is rewritten by this backend itself
+        if (product_database_class is ProductDatabase
+                and os.path.abspath(inventory_path) != os.path.abspath(ProductDatabase.SAVE_PATH)):
+            self._watchers.append((FileWatcher(inventory_path), self.product_database, build_product))
+        self._watchers.append((FileWatcher(coupon_path), self.coupon_database, build_coupon))
+        if watch_interval > 0:
+            self._watch_interval = watch_interval
+            self._watcher = threading.Thread(target=self._watch_loop, name='store-watcher', daemon=True)
+            self._watcher.start()
+
+    @classmethod
+    def from_databases(cls, product_database, member_database, coupon_database,
+                       write_behind: bool = False, flush_interval: float = 1.0,
+                       flush_threshold: int = 1000):
+        """Create a backend over other storage engines (see sqlite_store.py).
+
+        A product database needs get_product, get_products,
+        decrement_inventory, save_inventory and prepare_save; a member
+        database get_member, get_members, add_points, save_memberships and
+        prepare_save; a coupon database get_coupon, get_coupons and
+        purge_expired, like the CSV databases in database.py. The bulk lookups take barcodes without
+        duplicates and return the objects found, by barcode.
+
+        Args:
+            product_database: The product storage.
+            member_database: The member storage.
+            coupon_database: The coupon storage.
+            write_behind, flush_interval, flush_threshold: As in __init__.
+        Returns:
+            StoreBackend: The backend.
+        """
+        backend = cls.__new__(cls)
+        backend._setup(product_database, member_database, coupon_database,
+                       write_behind, flush_interval, flush_threshold)
+        return backend
+
+    def _setup(self, product_database, member_database, coupon_database,
+               write_behind, flush_interval, flush_threshold):
+        self.product_database = product_database
+        self.member_database = member_database
+        self.coupon_database = coupon_database
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._lock = threading.Lock()  # guards the in-memory databases
+        self._write_lock = threading.Lock()  # keeps writes in order
+        self._dirty = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._flush_error = None
+        self._flusher = None
+        self._watchers = []  # (FileWatcher, database, row builder)
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        if write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, name='store-flusher', daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
 
     def get_product(self, numeric_barcode: str) -> Product:
         return self.product_database.get_product(numeric_barcode)
 
+    def get_products(self, numeric_barcodes) -> list:
+        """Look up many products with one bulk lookup (one query for the
+        SQLite engine).
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes,
+                possibly repeated.
+        Returns:
+            list[Product]: The product of each barcode, in order (None for
+                unknown barcodes).
+        """
+        return _bulk_lookup(self.product_database.get_products, numeric_barcodes)
+
     def decrease_product_quantity(self, product: Product, quantity: int):
         """Given a product and a quantity to decrease by, decrement the inventory of the product by the quantity.
 
@@ -22,11 +145,24 @@ class StoreBackend:
             product (Product): The product to decrease the quantity of.
             quantity (int): The quantity to decrease by.
         """
-        self.product_database.decrement_inventory(product.get_barcode(), quantity)
+        with self._lock:
+            self.product_database.decrement_inventory(product.get_barcode(), quantity)
+            self._mark_dirty()
 
     def get_member(self, numeric_barcode: str) -> Member:
         return self.member_database.get_member(numeric_barcode)
 
+    def get_members(self, numeric_barcodes) -> list:
+        """Look up many members with one bulk lookup (see get_products).
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            list[Member]: The member of each barcode, in order (None for
+                unknown barcodes).
+        """
+        return _bulk_lookup(self.member_database.get_members, numeric_barcodes)
+
     def add_member_points(self, member: Member, points: int):
         """Given a member and a quantity to increase by, increment the points of the member by the quantity.
 
@@ -34,16 +170,164 @@ class StoreBackend:
             member (Member): The member to update the points of.
             points (int): The points to increase by.
         """
-        self.member_database.add_points(member.get_barcode(), points)
+        with self._lock:
+            self.member_database.add_points(member.get_barcode(), points)
+            self._mark_dirty()
 
     def get_coupon(self, numeric_barcode: str) -> Coupon:
         return self.coupon_database.get_coupon(numeric_barcode)
 
+    def get_coupons(self, numeric_barcodes) -> list:
+        """Look up many coupons with one bulk lookup (see get_products).
+
+        Args:
+            numeric_barcodes (Iterable[str]): 12 digit numeric barcodes.
+        Returns:
+            list[Coupon]: The coupon of each barcode, in order (None for
+                unknown barcodes).
+        """
+        return _bulk_lookup(self.coupon_database.get_coupons, numeric_barcodes)
+
+    def purge_expired_coupons(self) -> int:
+        """Drop the coupons that expired before today from the coupon
+        database (see CouponDatabase.purge_expired).
+
+        Returns:
+            int: The number of coupons dropped.
+        """
+        with self._lock:
+            return self.coupon_database.purge_expired()
+
     def save_inventory(self):
-        self.product_database.save_inventory()
+        """Save the inventory. With write_behind, the background thread
+        saves it instead and this returns immediately."""
+        if self.write_behind:
+            self._raise_flush_error()
+            return
+        with self._write_lock:
+            with self._lock:
+                job = self.product_database.prepare_save()
+            job()
 
     def save_memberships(self):
-        self.member_database.save_memberships()
+        """Save the memberships. With write_behind, the background thread
+        saves them instead and this returns immediately."""
+        if self.write_behind:
+            self._raise_flush_error()
+            return
+        with self._write_lock:
+            with self._lock:
+                job = self.member_database.prepare_save()
+            job()
+
+    def flush(self):
+        """Write every pending change now. The databases are only locked
+        while their state is captured, not during the disk writes, so
+        checkouts carry on meanwhile."""
+        self._raise_flush_error()
+        with self._write_lock:
+            with self._lock:
+                self._dirty = 0
+                jobs = [self.product_database.prepare_save(), self.member_database.prepare_save()]
+            # A failed job hands its changes back to its database; still
+            # run the other one
+            errors = []
+            for job in jobs:
+                try:
+                    job()
+                except Exception as error:
+                    errors.append(error)
+            if errors:
+                raise errors[0]
+
+    def reload(self) -> dict:
+        """Apply the changes made to the inventory and coupon files since
+        they were loaded (or last reloaded), row by row and in place: the
+        product and coupon objects carts hold are updated, not replaced.
+        Quantities keep the sales made since the load. Rows removed from
+        the file are dropped, unless the new file has malformed rows.
+        Columnar and memory-mapped inventories aren't reloaded: their rows
+        can't change in place, so they are rebuilt (restart the lane).
+
+        The files should be replaced atomically (written to a temporary file
+        and renamed), so a reload never reads half a file.
+
+        Returns:
+            dict[str, tuple[int, int, int]]: Rows added, changed and removed,
+                by path of the files that changed.
+        """
+        counts = {}
+        for watcher, database, build in self._watchers:
+            if not watcher.changed():
+                continue
+            report = LoadReport()
+            rows = load_rows(watcher.path, build, report=report)
+            warn_malformed(watcher.path, report)
+            with self._lock:
+                added, changed, removed = database.diff_rows(rows)
+                if report.malformed:
+                    removed = []
+                database.apply_diff(added, changed, removed)
+            counts[watcher.path] = (len(added), len(changed), len(removed))
+        return counts
+
+    def close(self):
+        """Stop the background threads and write every pending change. Safe
+        to call more than once."""
+        watcher = self._watcher
+        if watcher is not None:
+            self._watcher = None
+            self._stop_watching.set()
+            watcher.join()
+        flusher = self._flusher
+        if flusher is None:
+            return
+        self._flusher = None
+        self._stopping = True
+        self._wake.set()
+        flusher.join()
+        atexit.unregister(self.close)
+        self.flush()
+
+    def _mark_dirty(self):
+        """Count a change; wake the background writer at the threshold.
+        Called with the lock held."""
+        self._dirty += 1
+        if self.write_behind and self._dirty >= self.flush_threshold:
+            self._wake.set()
+
+    def _flush_loop(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopping or not self._dirty:
+                continue
+            try:
+                self.flush()
+            except Exception as error:
+                # Reported to the caller on its next save, flush or close
+                self._flush_error = error
+
+    def _watch_loop(self):
+        while not self._stop_watching.wait(self._watch_interval):
+            try:
+                self.reload()
+            except Exception as error:
+                # The previous rows stay in effect until the next good file
+                print(f"WARNING: reload failed: {error}")
+
+    def _raise_flush_error(self):
+        error, self._flush_error = self._flush_error, None
+        if error is not None:
+            raise error
+
+
+def _bulk_lookup(lookup, numeric_barcodes) -> list:
+    """Run a database bulk lookup over the distinct barcodes, and spread the
+    results back over the barcodes in order."""
+    numeric_barcodes = list(numeric_barcodes)
+    found = lookup(list(dict.fromkeys(numeric_barcodes)))
+    return [found.get(barcode) for barcode in numeric_barcodes]
 
 
 def store_backend_doctests():
@@ -71,6 +355,11 @@ def store_backend_doctests():
     >>> non_existent_barcode = ''
     >>> store_backend.get_product(non_existent_barcode) is None
     True
+    >>> products = store_backend.get_products([milk_barcode, non_existent_barcode, milk_barcode])
+    >>> products[0] is milk, products[1], products[2] is milk
+    (True, None, True)
+    >>> [coupon.get_barcode() for coupon in store_backend.get_coupons(['149234073227'])]
+    ['149234073227']
     >>> jane_barcode = '257274767454'
     >>> jane = store_backend.get_member(jane_barcode)
     >>> jane.get_points() == 1200
@@ -78,4 +367,60 @@ def store_backend_doctests():
     >>> store_backend.add_member_points(jane, 100)
     >>> jane.get_points() == 1300
     True
+    >>> behind = StoreBackend('db-data/inventory.csv', 'db-data/memberships.csv', 'db-data/coupons.csv',
+    ...                       write_behind=True, flush_interval=60, flush_threshold=3)
+    >>> milk = behind.get_product(milk_barcode)
+    >>> behind.decrease_product_quantity(milk, 5)
+    >>> behind.save_inventory()
+    >>> behind._dirty
+    1
+    >>> behind.flush()
+    >>> behind._dirty
+    0
+    >>> ProductDatabase(ProductDatabase.SAVE_PATH).get_product(milk_barcode).get_quantity()
+    145
+    >>> import time
+    >>> for _ in range(3):
+    ...     behind.decrease_product_quantity(milk, 1)
+    >>> deadline = time.monotonic() + 5
+    >>> while behind._dirty and time.monotonic() < deadline:
+    ...     time.sleep(0.01)
+    >>> behind._dirty
+    0
+    >>> behind.add_member_points(behind.get_member(jane_barcode), 100)
+    >>> behind.close()
+    >>> ProductDatabase(ProductDatabase.SAVE_PATH).get_product(milk_barcode).get_quantity()
+    142
+    >>> MemberDatabase(MemberDatabase.SAVE_PATH).get_member(jane_barcode).get_points() == 1300
+    True
+    >>> behind.close()
+    >>> columnar = StoreBackend('db-data/inventory.csv', 'db-data/memberships.csv', 'db-data/coupons.csv',
+    ...                         columnar=True)
+    >>> columnar_milk = columnar.get_product(milk_barcode)
+    >>> columnar.decrease_product_quantity(columnar_milk, 10)
+    >>> columnar_milk.get_name(), columnar_milk.get_quantity()
+    ('Milk', 140)
+    >>> import shutil, tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> inventory_path = os.path.join(folder, 'inventory.csv')
+    >>> coupon_path = os.path.join(folder, 'coupons.csv')
+    >>> _ = shutil.copy('db-data/inventory.csv', inventory_path)
+    >>> _ = shutil.copy('db-data/coupons.csv', coupon_path)
+    >>> live = StoreBackend(inventory_path, 'db-data/memberships.csv', coupon_path)
+    >>> milk = live.get_product(milk_barcode)
+    >>> live.decrease_product_quantity(milk, 10)
+    >>> live.reload()
+    {}
+    >>> with open(inventory_path + '.tmp', 'w') as f:
+    ...     _ = f.write('barcode,name,price,quantity\\n'
+    ...                 '012345678905,Milk,3.19,200\\n'
+    ...                 '012345678912,Apple,0.25,100\\n'
+    ...                 '099999999990,Bread,2.5,30\\n')
+    >>> os.replace(inventory_path + '.tmp', inventory_path)
+    >>> live.reload() == {inventory_path: (1, 1, 1)}
+    True
+    >>> live.get_product(milk_barcode) is milk, milk.get_price(), milk.get_quantity()
+    (True, 3.19, 190)
+    >>> live.get_product('043210987655') is None, live.get_product('099999999990').get_name()
+    (True, 'Bread')
     """